@@ -0,0 +1,69 @@
+# scripts/backtest.py
+import os, sys, json, argparse, datetime
+
+# allow `src` imports when running from repo root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.backtest import load_grouped_history, threshold_grid, run_backtest
+from src.fatigue import DEFAULT_THRESHOLDS
+
+
+def parse_grid(items):
+    """['CTR_DOWN_PCT=20,25,30', ...] -> {'CTR_DOWN_PCT': [20.0, 25.0, 30.0]}"""
+    spec = {}
+    for item in items or []:
+        key, _, vals = item.partition("=")
+        key = key.strip().upper()
+        if key not in DEFAULT_THRESHOLDS or not vals:
+            raise SystemExit(f"Bad --grid entry '{item}'. Keys: {', '.join(DEFAULT_THRESHOLDS)}")
+        spec[key] = [float(v) for v in vals.split(",") if v.strip()]
+    if not spec:
+        # default: each threshold at default -10 / default / +10
+        spec = {k: [d - 10, d, d + 10] for k, d in DEFAULT_THRESHOLDS.items()}
+    return spec
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Backtest fatigue thresholds over local KPI history (no Slack/Notion).")
+    ap.add_argument("--client", required=True, help="Client name as in clients.json")
+    ap.add_argument("--level", default="ad", help="campaign|adset|ad")
+    ap.add_argument("--since", help="YYYY-MM-DD (default: 90 days before --until)")
+    ap.add_argument("--until", help="YYYY-MM-DD (default: yesterday)")
+    ap.add_argument("--baseline_days", type=int, default=7)
+    ap.add_argument("--grid", nargs="*", help="KEY=v1,v2,... per threshold (default: each default ±10)")
+    ap.add_argument("--outcome-drop", type=float, default=40.0,
+                    help="ROAS drop %% vs baseline that counts as real fatigue for lead-time")
+    ap.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count)")
+    ap.add_argument("--top", type=int, default=15, help="Rows to print")
+    ap.add_argument("--out", help="Write the full report as JSON here")
+    args = ap.parse_args()
+
+    until = args.until or (datetime.date.today() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+    since = args.since or (datetime.date.fromisoformat(until) - datetime.timedelta(days=89)).strftime("%Y-%m-%d")
+
+    grouped = load_grouped_history(args.client, args.level, since, until)
+    if not grouped:
+        raise SystemExit(f"No {args.level} history for '{args.client}' in {since}..{until}. Run pull_kpis.py first.")
+
+    grid = threshold_grid(parse_grid(args.grid))
+    print(f"[Backtest] {args.client} level={args.level} {since}..{until} | entities={len(grouped)} | combos={len(grid)}")
+    results = run_backtest(grouped, grid, args.baseline_days, args.outcome_drop, args.workers)
+
+    ranked = sorted(results, key=lambda r: (-r["caught"], r["alerts"]))
+    keys = list(DEFAULT_THRESHOLDS)
+    print(" ".join(f"{k[:-4]:>10}" for k in keys) + f" {'flags':>7} {'alerts':>7} {'caught':>7} {'lead_med':>8}")
+    for r in ranked[:args.top]:
+        lead = "-" if r["lead_days_median"] is None else f"{r['lead_days_median']:.1f}"
+        print(" ".join(f"{r['thresholds'][k]:>10.0f}" for k in keys)
+              + f" {r['flags']:>7} {r['alerts']:>7} {r['caught']:>7} {lead:>8}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"client": args.client, "level": args.level, "since": since, "until": until,
+                       "baseline_days": args.baseline_days, "outcome_drop_pct": args.outcome_drop,
+                       "results": results}, f, indent=2)
+        print(f"[Saved] {args.out}")
+
+
+if __name__ == "__main__":
+    main()
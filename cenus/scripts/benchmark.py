@@ -0,0 +1,65 @@
+# scripts/benchmark.py
+import os, sys, argparse, datetime
+
+# allow `src` imports when running from repo root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.benchmark import run_benchmark, compare
+from src.synth import SynthSpec
+from src.storage import DATA_DIR, read_json, write_json_atomic
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Time transform / grouping / baselines / rules / storage / Notion payloads on synthetic data.")
+    ap.add_argument("--clients", type=int, default=5)
+    ap.add_argument("--ads", type=int, default=2000, help="Ads per client")
+    ap.add_argument("--days", type=int, default=14)
+    ap.add_argument("--fatigue-rate", type=float, default=0.05, help="Share of ads with injected fatigue")
+    ap.add_argument("--fatigue-days", type=int, default=3, help="Final days over which fatigue ramps in")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--baseline_days", type=int, default=7)
+    ap.add_argument("--repeat", type=int, default=3, help="Runs per stage; the fastest is kept")
+    ap.add_argument("--out", default=None,
+                    help="Report JSON path (default: data/_runs/bench_<utc time>.json)")
+    ap.add_argument("--baseline", default=os.path.join(DATA_DIR, "_bench", "baseline.json"),
+                    help="Stored baseline report to compare against")
+    ap.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    ap.add_argument("--tolerance", type=float, default=1.25,
+                    help="A stage regressed when slower than this x its baseline time")
+    args = ap.parse_args()
+
+    spec = SynthSpec(clients=args.clients, ads=args.ads, days=args.days, fatigue_rate=args.fatigue_rate,
+                     fatigue_days=args.fatigue_days, seed=args.seed)
+    print(f"[Bench] {spec.clients} clients x {spec.ads} ads x {spec.days} days "
+          f"= {spec.clients * spec.ads * spec.days} rows, repeat={args.repeat}")
+    report = run_benchmark(spec, repeat=args.repeat, baseline_days=args.baseline_days)
+
+    out = args.out or os.path.join(
+        DATA_DIR, "_runs", f"bench_{datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.json")
+    baseline = read_json(args.baseline)
+    regressions = []
+    if baseline and baseline.get("spec") != report["spec"]:
+        print(f"[Bench] baseline {args.baseline} was recorded with a different spec; not comparing")
+    elif baseline:
+        rows = compare(report, baseline, args.tolerance)
+        report["comparison"] = {"baseline": args.baseline, "baseline_created_at": baseline.get("created_at"),
+                                "tolerance": args.tolerance, "stages": rows}
+        print(f"\n[Bench] vs baseline {args.baseline} ({baseline.get('created_at')})")
+        for r in rows:
+            flag = "  REGRESSION" if r["regression"] else ""
+            print(f"  {r['stage']:<22} {r['seconds']:9.4f}s vs {r['baseline_seconds']:9.4f}s  x{r['ratio']:.2f}{flag}")
+        regressions = [r["stage"] for r in rows if r["regression"]]
+
+    write_json_atomic(report, out)
+    print(f"[Bench] report written to {out}")
+    if args.save_baseline:
+        write_json_atomic(report, args.baseline)
+        print(f"[Bench] baseline stored at {args.baseline}")
+    elif regressions:
+        print(f"[Bench] slower than baseline: {', '.join(regressions)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
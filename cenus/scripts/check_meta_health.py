@@ -3,6 +3,7 @@ import sys
 import requests
 from datetime import datetime, timedelta
 from src.config import FB_ACCESS_TOKEN, META_API_VERSION
+from src.graph import get_graph_client
 
 BASE = f"https://graph.facebook.com/{META_API_VERSION}"
 
@@ -21,9 +22,7 @@ def get_active_campaign_count(account: str) -> int:
         "summary": "true",
         "limit": 1
     }
-    r = requests.get(f"{BASE}/{account}/campaigns", params=params, timeout=30)
-    r.raise_for_status()
-    j = r.json()
+    j = get_graph_client().get(f"{BASE}/{account}/campaigns", params)
     summary = j.get("summary", {})
     return int(summary.get("total_count") or 0)
 
@@ -37,9 +36,7 @@ def get_yesterday_spend(account: str) -> float:
         "time_range": str(time_range).replace("'", '"'),  # JSON-ish
         "limit": 1
     }
-    r = requests.get(f"{BASE}/{account}/insights", params=params, timeout=60)
-    r.raise_for_status()
-    data = r.json().get("data", [])
+    data = get_graph_client().get(f"{BASE}/{account}/insights", params).get("data", [])
     if not data:
         return 0.0
     spend_str = data[0].get("spend") or "0"
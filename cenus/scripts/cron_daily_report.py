@@ -1,18 +1,13 @@
 #!/usr/bin/env python3
 # Daily pipeline: pull yesterday KPIs -> push to Notion -> fatigue+alerts
 
-import os, subprocess, sys
+import os, sys
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 os.chdir(ROOT)
+sys.path.insert(0, ROOT)
 
+# Run the helper that glues everything together, in this process
+from scripts.run_daily_pipeline import main
 
-def sh(args):
-    print("+", " ".join(args), flush=True)
-    r = subprocess.run(args)
-    if r.returncode != 0:
-        sys.exit(r.returncode)
-
-
-# Call the helper that glues everything together
-sh(["python", "scripts/run_daily_pipeline.py"])
+main([])
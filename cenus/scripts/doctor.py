@@ -2,6 +2,9 @@
 import os, json, sys, argparse, requests
 from pathlib import Path
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.graph import get_graph_client
+
 NOTION_API = "https://api.notion.com/v1"
 GRAPH_API = "https://graph.facebook.com"
 
@@ -74,7 +77,7 @@ def notion_ping_db(token, db_id, label):
 
 def graph_get(url, params):
     try:
-        r = requests.get(url, params=params, timeout=30)
+        r = get_graph_client().request("GET", url, params)
         code = r.status_code
         try:
             j = r.json()
@@ -0,0 +1,45 @@
+import os, sys, argparse
+
+# allow `src` imports when running from repo root
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.outbox import get_outbox, drain
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Deliver queued Notion/Slack messages from the local outbox.")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="Concurrent deliveries (default: OUTBOX_WORKERS or 4)")
+    ap.add_argument("--retry-dead", action="store_true",
+                    help="Re-queue dead-lettered messages before draining")
+    ap.add_argument("--list-dead", action="store_true",
+                    help="Show dead-lettered messages and exit")
+    ap.add_argument("--purge-done", action="store_true",
+                    help="Delete delivered messages after draining")
+    args = ap.parse_args()
+
+    outbox = get_outbox()
+    if args.list_dead:
+        for m in outbox.dead(limit=200):
+            print(f"  #{m['id']} {m['kind']} {m['key']} attempts={m['attempts']} at {m['updated_at']}\n"
+                  f"      {(m['last_error'] or '')[:300]}")
+        print(f"[Outbox] {outbox.counts()}")
+        return
+
+    if args.retry_dead:
+        print(f"[Outbox] re-queued {outbox.retry_dead()} dead messages")
+
+    counts = drain(args.workers)
+    print("[Outbox] delivered: " + (", ".join(f"{k}={v}" for k, v in sorted(counts.items())) or "nothing due"))
+    if args.purge_done:
+        print(f"[Outbox] purged {outbox.purge_done()} delivered messages")
+    status = outbox.counts()
+    print(f"[Outbox] queue: {status}")
+    if status.get("dead"):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,18 @@
 # cenus/scripts/pull_kpis.py
 import os, sys, json, argparse
 from datetime import date, timedelta
-from typing import List, Dict
+from typing import Dict, Iterable, List, Tuple
 
 # allow imports from src/ no matter where we run from
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from src.meta_client import fetch_insights_for_account, transform_rows_to_kpis
-from src.storage import save_jsonl, save_csv, ts_now_iso
+from src.meta_client import iter_insights_rows, iter_reach_rows, iter_kpis, to_fatigue_row, KPI_FIELDS
+from src.history import HistoryStore
+from src.sync import WatermarkStore
+from src.storage import stream_records, ts_now_iso
+from src.graph import configure_graph_client
+from src.parallel import run_bounded
+from src.rollup import RollUp
 
 CLIENTS_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "clients.json"))
 
@@ -20,13 +25,9 @@ def load_clients() -> List[Dict]:
 def dstr(d: date) -> str:
     return d.strftime("%Y-%m-%d")
 
-def pull_for_client(client: Dict, level: str, since: str, until: str):
+def persist_rows(client: Dict, level: str, since: str, until: str, raw_rows: Iterable[Dict]) -> int:
+    """Raw insights rows -> ./data/<ClientName>/ JSONL/CSV + KPI history + watermark."""
     name = client["client_name"]
-    account_id = client["ad_account_id"]
-    print(f"[Pull] {name} {account_id} | level={level} | range {since}..{until}")
-
-    raw_rows = fetch_insights_for_account(account_id, level=level, since=since, until=until)
-    recs = transform_rows_to_kpis(raw_rows, level=level)
 
     # Output under ./data/<ClientName>/
     base_dir = os.path.join("data", name.replace(" ", "_"))
@@ -34,9 +35,69 @@ def pull_for_client(client: Dict, level: str, since: str, until: str):
     jsonl_path = os.path.join(base_dir, f"{level}_{since}_{until}.jsonl")
     csv_path  = os.path.join(base_dir,  f"{level}_{since}_{until}.csv")
 
-    save_jsonl(recs, jsonl_path)
-    save_csv(recs, csv_path)
-    print(f"[Saved] {len(recs)} records | JSONL: {jsonl_path} | CSV: {csv_path}")
+    # pages -> transform -> writers, one record at a time; the same rows feed the
+    # client's KPI history so later reads (fatigue, backfills) skip Meta
+    with HistoryStore(name).ingest(level, since, until) as hist:
+        def _tee(rows):
+            for r in rows:
+                hist.add(to_fatigue_row(r, level))
+                yield r
+        n = stream_records(iter_kpis(_tee(raw_rows), level=level), jsonl_path, csv_path, sorted(KPI_FIELDS))
+    WatermarkStore().advance(client["ad_account_id"], level, until)
+    print(f"[Saved] {n} records | JSONL: {jsonl_path} | CSV: {csv_path}", flush=True)
+    return n
+
+def pull_for_client(client: Dict, level: str, since: str, until: str, mode: str = None):
+    print(f"[Pull] {client['client_name']} {client['ad_account_id']} | level={level} | range {since}..{until}")
+    raw_rows = iter_insights_rows(client["ad_account_id"], level=level, since=since, until=until, mode=mode)
+    return persist_rows(client, level, since, until, raw_rows)
+
+def pull_rolled_up(client: Dict, levels: List[str], since: str, until: str, mode: str = None) -> int:
+    """
+    One ad-level pull for the client; adset/campaign rows in `levels` are
+    derived from it (src/rollup.py) instead of being fetched separately; only
+    their reach / frequency is, with one fields-limited request per level.
+    """
+    print(f"[Pull] {client['client_name']} {client['ad_account_id']} | level=ad (roll-up to "
+          f"{','.join(l for l in levels if l != 'ad') or 'none'}) | range {since}..{until}")
+    ru = RollUp([l for l in levels if l != "ad"])
+    raw_rows = ru.tee(iter_insights_rows(client["ad_account_id"], level="ad", since=since, until=until, mode=mode))
+    if "ad" in levels:
+        n = persist_rows(client, "ad", since, until, raw_rows)
+    else:
+        n = sum(1 for _ in raw_rows)
+    for lvl in ru.levels:
+        ru.add_reach(lvl, iter_reach_rows(client["ad_account_id"], lvl, since, until))
+        persist_rows(client, lvl, since, until, ru.rows(lvl))
+    return n
+
+def pull_tasks(clients: List[Dict], levels: List[str], rollup: bool = False) -> List[Tuple[Dict, Tuple[str, ...]]]:
+    """(client, levels) units of work: one per client when rolling up, else one per client x level."""
+    if rollup:
+        return [(c, tuple(levels)) for c in clients]
+    return [(c, (lvl,)) for c in clients for lvl in levels]
+
+def run_task(task: Tuple[Dict, Tuple[str, ...]], since: str, until: str, mode: str = None, rollup: bool = False):
+    c, lvls = task
+    if rollup:
+        return pull_rolled_up(c, list(lvls), since, until, mode)
+    return pull_for_client(c, lvls[0], since, until, mode)
+
+def pull_parallel(clients: List[Dict], levels: List[str], since: str, until: str,
+                  workers: int, per_account: int, mode: str = None, rollup: bool = False) -> int:
+    """
+    Pull every client x level at once: `workers` caps total in-flight pulls,
+    `per_account` caps pulls against the same ad account. Returns failure count.
+    """
+    configure_graph_client(pool_size=max(10, workers))
+    results = run_bounded(pull_tasks(clients, levels, rollup), lambda t: run_task(t, since, until, mode, rollup),
+                          workers=workers, key=lambda t: t[0]["ad_account_id"], per_key=per_account)
+    failed = 0
+    for (c, lvls), _, err in results:
+        if err is not None:
+            failed += 1
+            print(f"[Error] {c['client_name']} level={','.join(lvls)}: {err}")
+    return failed
 
 def main():
     p = argparse.ArgumentParser(description="Pull KPIs from Meta for one/all clients.")
@@ -44,6 +105,11 @@ def main():
     p.add_argument("--level", default="all", help="campaign|adset|ad|all")
     p.add_argument("--since", help="YYYY-MM-DD (inclusive)")
     p.add_argument("--until", help="YYYY-MM-DD (inclusive)")
+    p.add_argument("--workers", type=int, default=1, help="Parallel pulls across clients x levels (1 = sequential)")
+    p.add_argument("--per-account", type=int, default=2, help="Max concurrent pulls per ad account (with --workers)")
+    p.add_argument("--mode", default=None, help="sync|async|auto insights fetch (default: META_INSIGHTS_MODE or sync)")
+    p.add_argument("--no-rollup", action="store_true",
+                   help="With --level all, pull campaign/adset/ad separately instead of deriving them from one ad pull")
     args = p.parse_args()
 
     # default date range = yesterday
@@ -54,6 +120,8 @@ def main():
         since = until = dstr(y)
 
     levels = ["campaign", "adset", "ad"] if args.level == "all" else [args.level]
+    # one ad-level pull per client feeds every level (src/rollup.py)
+    rollup = args.level == "all" and not args.no_rollup
 
     clients = load_clients()
     if args.client:
@@ -61,10 +129,15 @@ def main():
         if not clients:
             raise SystemExit(f"No client named '{args.client}' found in clients.json")
 
-    print(f"[Start] {ts_now_iso()} | range {since}..{until} | levels={levels} | clients={len(clients)}")
-    for c in clients:
-        for lvl in levels:
-            pull_for_client(c, lvl, since, until)
+    print(f"[Start] {ts_now_iso()} | range {since}..{until} | levels={levels} | rollup={rollup} | clients={len(clients)}")
+    if args.workers > 1:
+        failed = pull_parallel(clients, levels, since, until, args.workers, args.per_account, args.mode, rollup)
+        print(f"[Done] {ts_now_iso()} | failed={failed}")
+        if failed:
+            raise SystemExit(1)
+        return
+    for task in pull_tasks(clients, levels, rollup):
+        run_task(task, since, until, args.mode, rollup)
     print(f"[Done] {ts_now_iso()}")
 
 if __name__ == "__main__":
@@ -4,7 +4,8 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))  # add repo root to
 # scripts/push_to_notion.py
 import os, json, argparse
 from typing import List, Dict
-from src.notion import upsert_record  # ✅ only this import
+from src.notion_writer import bulk_upsert
+from src.meta_client import LEVELS
 
 CLIENTS_FILE = "clients.json"
 
@@ -22,6 +23,9 @@ def main():
     ap = argparse.ArgumentParser(description="Push KPI JSONL into Notion with upsert")
     ap.add_argument("--client", required=True, help="Client name as in clients.json")
     ap.add_argument("--file", required=True, help="Path to JSONL file produced by Step 3 / mock")
+    ap.add_argument("--level", default=None,
+                    help="Level of the records (default: from a <level>_<since>_<until>.jsonl file name)")
+    ap.add_argument("--workers", type=int, default=None, help="Concurrent Notion writes (default: NOTION_RPS)")
     args = ap.parse_args()
 
     clients = load_clients()
@@ -30,20 +34,18 @@ def main():
         raise SystemExit(f"No client named '{args.client}' in clients.json")
 
     db_id = client["notion_db_id"]
-
-    count_create = 0
-    count_update = 0
+    prefix = os.path.basename(args.file).split("_", 1)[0]
+    level = args.level or (prefix if prefix in LEVELS else None)  # records carrying a level keep theirs
 
     with open(args.file, "r", encoding="utf-8") as f:
-        for line in f:
-            record = json.loads(line)
-            action, _ = upsert_record(db_id, record)
-            if action == "create":
-                count_create += 1
-            else:
-                count_update += 1
-
-    print(f"[Done] Notion upsert: created={count_create}, updated={count_update}")
+        records = (json.loads(line) for line in f if line.strip())
+        res = bulk_upsert(db_id, records, workers=args.workers, level=level)
+
+    counts = res["counts"]
+    print(f"[Done] Notion upsert: created={counts.get('created', 0)}, updated={counts.get('updated', 0)}, "
+          f"skipped={counts.get('skipped', 0)}, failed={counts.get('failed', 0)}")
+    if res["errors"]:
+        raise SystemExit(1)
 
 if __name__ == "__main__":
     main()
@@ -1,16 +1,15 @@
-import os, json, datetime, subprocess, sys
+import os, sys, json, argparse
 
-CLIENTS_FILE = "clients.json"
+# allow `src` imports when running from repo root
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from src.pipeline import run_pipeline, STEP_NAMES
 
-def sh(args):
-    print("+", " ".join(args), flush=True)
-    r = subprocess.run(args, stdout=sys.stdout, stderr=sys.stderr)
-    if r.returncode != 0:
-        raise SystemExit(r.returncode)
+CLIENTS_FILE = "clients.json"
 
 
-def main():
+def load_clients():
     if not os.path.exists(CLIENTS_FILE):
         raise SystemExit(
             "clients.json not found. Run scripts/add_client.py first.")
@@ -19,45 +18,53 @@ def main():
 
     # supports {"clients":[...]} or bare list [...]
     if isinstance(data, dict) and "clients" in data:
-        clients = data["clients"]
+        return data["clients"]
     elif isinstance(data, list):
-        clients = data
-    else:
-        clients = []
+        return data
+    return []
 
-    # Default: yesterday
-    y = (datetime.date.today() -
-         datetime.timedelta(days=1)).strftime("%Y-%m-%d")
 
-    for c in clients:
-        name = c["client_name"]
-        print(f"\n=== Daily pipeline for: {name} ===")
+def main(argv=None):
+    ap = argparse.ArgumentParser(
+        description="Daily pipeline: pull -> persist -> push -> evaluate -> alert, in one process.")
+    ap.add_argument("--client", default=None, help="Only this client (default: all)")
+    ap.add_argument("--date", default=None, help="Day to pull, YYYY-MM-DD (default: yesterday)")
+    ap.add_argument("--steps", default=",".join(STEP_NAMES),
+                    help=f"Comma-separated subset of {','.join(STEP_NAMES)}")
+    ap.add_argument("--level", default="ad", help="Level evaluated for fatigue")
+    ap.add_argument("--days", type=int, default=14, help="Fatigue window in days")
+    ap.add_argument("--baseline_days", type=int, default=7, help="Days used for rolling baseline")
+    ap.add_argument("--lookback", type=int, default=None,
+                    help="Days before the sync watermark to re-fetch (default: SYNC_LOOKBACK_DAYS or 2)")
+    ap.add_argument("--no-rollup", action="store_true",
+                    help="Pull campaign/adset/ad separately instead of deriving them from one ad pull")
+    ap.add_argument("--detector", default=None, choices=["window", "ewma"],
+                    help="Fatigue detector (default: FATIGUE_DETECTOR or window)")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="Clients run at once (default: PIPELINE_WORKERS or 4)")
+    ap.add_argument("--report", default=None,
+                    help="Run report JSON path (default: data/_runs/pipeline_<utc time>.json)")
+    args = ap.parse_args(argv)
 
-        # 1) Pull KPIs (campaign/adset/ad) for yesterday
-        sh([
-            "python", "scripts/pull_kpis.py", "--client", name, "--level",
-            "all", "--since", y, "--until", y
-        ])
+    if args.days < args.baseline_days + 1:
+        raise SystemExit("--days must be >= baseline_days + 1")
 
-        # 2) Push each level’s JSONL to Notion (exists in data/<Client_Name>/)
-        client_dir = os.path.join("data", name.replace(" ", "_"))
-        for level in ["campaign", "adset", "ad"]:
-            jsonl = os.path.join(client_dir, f"{level}_{y}_{y}.jsonl")
-            if os.path.exists(jsonl):
-                sh([
-                    "python", "scripts/push_to_notion.py", "--client", name,
-                    "--file", jsonl
-                ])
-            else:
-                print(f"   (skip: {jsonl} not found)")
+    clients = load_clients()
+    if args.client:
+        clients = [c for c in clients
+                   if c["client_name"].strip().lower() == args.client.strip().lower()]
+        if not clients:
+            raise SystemExit(f"No client named '{args.client}' found in clients.json")
 
-        # 3) Run fatigue + alerts across the last 14 days (7-day baseline)
-        sh([
-            "python", "scripts/run_fatigue_and_alerts.py", "--client", name,
-            "--level", "ad", "--days", "14", "--baseline_days", "7"
-        ])
+    steps = [s.strip() for s in args.steps.split(",") if s.strip()]
+    results = run_pipeline(clients, steps=steps, workers=args.workers, report_path=args.report,
+                           level=args.level, days=args.days, baseline_days=args.baseline_days,
+                           day=args.date, lookback=args.lookback, rollup=not args.no_rollup,
+                           detector=args.detector)
 
     print("\n[Daily pipeline complete]")
+    if any(not r["ok"] for r in results):
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
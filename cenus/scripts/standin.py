@@ -0,0 +1,108 @@
+# scripts/standin.py
+import os, sys, json, time, argparse, tempfile
+
+# allow `src` imports when running from repo root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# `src` is imported only after --data-dir is in CENUS_DATA_DIR: storage.DATA_DIR
+# is read at import, and the synthetic clients must not land in the real data dir.
+
+
+def synth_clients(si):
+    """clients.json-style entries for the synthetic accounts, alerting to stand-in webhooks."""
+    out = []
+    for c in range(si.spec.clients):
+        client = si.synth.client(c)
+        client.update(slack_webhook=si.webhook(f"client{c:03d}"), notion_alerts_db_id=f"synth-alerts-{c:03d}")
+        out.append(client)
+    return out
+
+
+def run_pipeline_offline(si, args):
+    # notion.py reads NOTION_API_BASE at import, so the env goes in before src.pipeline is loaded
+    os.environ.update(si.env())
+    from src.pipeline import run_pipeline, STEP_NAMES
+
+    steps = [s.strip() for s in (args.steps or ",".join(STEP_NAMES)).split(",") if s.strip()]
+    t0 = time.perf_counter()
+    results = run_pipeline(synth_clients(si), steps=steps, workers=args.workers, report_path=args.report,
+                           days=args.window, baseline_days=args.baseline_days, day=si.synth.dates[-1],
+                           rollup=not args.no_rollup, detector=args.detector)
+    total = time.perf_counter() - t0
+    stats = si.stats()
+    print(f"\n[StandIn] pipeline: {len(results)} clients x {si.spec.ads} ads in {total:.2f}s, "
+          f"{sum(not r['ok'] for r in results)} failed")
+    print(json.dumps(stats["services"], indent=2, sort_keys=True))
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Serve local Graph / Notion / Slack stand-ins (optionally run the daily pipeline against them).")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--clients", type=int, default=3)
+    ap.add_argument("--ads", type=int, default=500, help="Ads per client")
+    ap.add_argument("--days", type=int, default=30, help="Days of synthetic insights, ending yesterday")
+    ap.add_argument("--fatigue-rate", type=float, default=0.05)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--page-size", type=int, default=500, help="Max Graph insights rows per page")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="Added to every request (all services)")
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 5xx")
+    ap.add_argument("--graph-rps", type=float, default=0.0, help="Per ad account; 0 = unlimited")
+    ap.add_argument("--notion-rps", type=float, default=3.0, help="Per integration; 0 = unlimited")
+    ap.add_argument("--slack-rps", type=float, default=1.0, help="Per webhook; 0 = unlimited")
+    ap.add_argument("--run-pipeline", action="store_true",
+                    help="Run the daily pipeline for the synthetic clients against the stand-ins, then exit")
+    ap.add_argument("--steps", default=None, help="Pipeline steps (default: all)")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--window", type=int, default=14, help="Fatigue window in days")
+    ap.add_argument("--baseline_days", type=int, default=7)
+    ap.add_argument("--detector", default=None, choices=["window", "ewma"])
+    ap.add_argument("--no-rollup", action="store_true", help="Pull every level instead of rolling up ad rows")
+    ap.add_argument("--report", default=None, help="Pipeline run report path")
+    ap.add_argument("--data-dir", default=None,
+                    help="CENUS_DATA_DIR for the pipeline run (default: $CENUS_DATA_DIR, else a new temp dir)")
+    args = ap.parse_args()
+
+    data_dir = args.data_dir or os.getenv("CENUS_DATA_DIR") or tempfile.mkdtemp(prefix="cenus-standin-")
+    os.environ["CENUS_DATA_DIR"] = data_dir
+    from src.standin import StandIn, Faults, ACCOUNT_BASE
+    from src.synth import SynthSpec
+
+    def faults(rps):
+        return Faults(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate, rps=rps)
+
+    spec = SynthSpec(clients=args.clients, ads=args.ads, days=args.days, fatigue_rate=args.fatigue_rate,
+                     seed=args.seed)
+    si = StandIn(spec, {"graph": faults(args.graph_rps), "notion": faults(args.notion_rps),
+                        "slack": faults(args.slack_rps)},
+                 host=args.host, port=args.port, page_size=args.page_size, seed=args.seed).start()
+
+    if args.run_pipeline:
+        print(f"[StandIn] pipeline data dir: {data_dir}")
+        try:
+            results = run_pipeline_offline(si, args)
+        finally:
+            si.stop()
+        if any(not r["ok"] for r in results):
+            raise SystemExit(1)
+        return
+
+    print("[StandIn] point the clients here with:")
+    for k, v in si.env().items():
+        print(f"  export {k}={v}")
+    print(f"[StandIn] accounts act_{ACCOUNT_BASE}..act_{ACCOUNT_BASE + spec.clients - 1}, "
+          f"{spec.days} days ending {si.synth.dates[-1]}; stats at {si.url}/_stats (Ctrl-C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        si.stop()
+
+
+if __name__ == "__main__":
+    main()
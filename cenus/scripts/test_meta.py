@@ -4,28 +4,25 @@ import os, sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from src.config import FB_ACCESS_TOKEN, META_API_VERSION, mask
+from src.graph import get_graph_client
 
 BASE = f"https://graph.facebook.com/{META_API_VERSION}"
 
 
 def get_me():
-    r = requests.get(f"{BASE}/me",
-                     params={
-                         "access_token": FB_ACCESS_TOKEN,
-                         "fields": "id,name"
-                     })
-    r.raise_for_status()
-    return r.json()
+    return get_graph_client().get(f"{BASE}/me",
+                                  params={
+                                      "access_token": FB_ACCESS_TOKEN,
+                                      "fields": "id,name"
+                                  })
 
 
 def list_ad_accounts():
-    r = requests.get(f"{BASE}/me/adaccounts",
-                     params={
-                         "access_token": FB_ACCESS_TOKEN,
-                         "fields": "account_id,name,account_status"
-                     })
-    r.raise_for_status()
-    return r.json()
+    return get_graph_client().get(f"{BASE}/me/adaccounts",
+                                  params={
+                                      "access_token": FB_ACCESS_TOKEN,
+                                      "fields": "account_id,name,account_status"
+                                  })
 
 
 if __name__ == "__main__":
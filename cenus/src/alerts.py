@@ -1,14 +1,86 @@
-import json, requests
+import os, json, time, threading, requests
+from typing import Any, Dict, List
+
+from .ledger import get_ledger, payload_hash, secret_tag
+from .http_pool import make_session, backoff_delay, retry_after_seconds, never_sent
+from .ratelimit import TokenBucket
+from .metrics import incr, timer
+
+# Incoming webhooks accept ~1 message/s each; every post to a webhook shares its bucket.
+SLACK_RPS = float(os.getenv("SLACK_RPS", "1"))
+SLACK_MAX_RETRIES = int(os.getenv("SLACK_MAX_RETRIES", "5"))
+# Slack rejects messages with more than 50 blocks or section text over 3000 chars.
+SLACK_MAX_BLOCKS = 50
+SLACK_MAX_TEXT = 3000
+
+_session = None
+_buckets: Dict[str, TokenBucket] = {}
+_lock = threading.Lock()
+
+
+def resolve_webhook(value: str) -> str:
+    """A client's slack_webhook setting; "__FROM_SECRET__" means SLACK_WEBHOOK_URL."""
+    value = (value or "").strip()
+    if value == "__FROM_SECRET__":
+        value = os.getenv("SLACK_WEBHOOK_URL", "").strip()
+    return value
+
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = make_session(4, {"Content-Type": "application/json"})
+    return _session
+
+
+def _bucket(url: str) -> TokenBucket:
+    with _lock:
+        tag = secret_tag(url)
+        b = _buckets.get(tag)
+        if b is None:
+            b = _buckets[tag] = TokenBucket(SLACK_RPS, burst=1)
+        return b
+
 
 def _post_json(url: str, payload: dict, timeout: int = 15):
-    r = requests.post(
-        url,
-        data=json.dumps(payload),
-        headers={"Content-Type": "application/json"},
-        timeout=timeout
-    )
-    if r.status_code >= 300:
-        raise RuntimeError(f"Slack webhook error {r.status_code}: {r.text}")
+    """
+    Rate-limited webhook post on the pooled session. A webhook post is not
+    idempotent, so only attempts that cannot have posted are retried: 429s
+    (pausing this webhook for Retry-After) and connections that never reached
+    Slack. A read timeout or 5xx may already have posted the message; it raises,
+    and the outbox (src/outbox.py) decides whether to re-drive it.
+    """
+    bucket = _bucket(url)
+    attempt = 0
+    while True:
+        with timer("slack.bucket_wait"):
+            bucket.acquire()
+        incr("slack.http_calls")
+        try:
+            with timer("slack.post"):
+                r = _get_session().post(url, data=json.dumps(payload), timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            incr("slack.connection_errors")
+            if not never_sent(e) or attempt >= SLACK_MAX_RETRIES:
+                raise
+            incr("slack.retries")
+            time.sleep(backoff_delay(attempt, 1.0, 30.0))
+            attempt += 1
+            continue
+        if r.status_code == 429:
+            incr("slack.rate_limited")
+            if attempt < SLACK_MAX_RETRIES:
+                incr("slack.retries")
+                delay = retry_after_seconds(r) or backoff_delay(attempt, 1.0, 30.0)
+                print(f"[Slack] 429 rate limited; pausing {delay:.1f}s")
+                bucket.pause(delay)
+                attempt += 1
+                continue
+        if r.status_code >= 300:
+            raise RuntimeError(f"Slack webhook error {r.status_code}: {r.text}")
+        return
 
 def format_slack_block(client_name: str, level: str, name: str, ts: str, reasons: str, fixes: str, kpis: dict):
     fields = []
@@ -28,7 +100,107 @@ def format_slack_block(client_name: str, level: str, name: str, ts: str, reasons
         blocks.append({"type":"context","elements":[{"type":"mrkdwn","text":text_kpis}]})
     return {"blocks": blocks}
 
-def send_slack_alert(webhook_url: str, client_name: str, level: str, name: str, ts: str, reasons: str, actions_list: list, kpis: dict):
+def send_slack_alert(webhook_url: str, client_name: str, level: str, name: str, ts: str, reasons: str, actions_list: list, kpis: dict,
+                     entity_id: str = "") -> bool:
+    """
+    Post one alert; returns False (nothing sent) if this exact message was already
+    delivered. Delivery is tracked per entity_id (ad names are not unique).
+    """
     fixes_bullets = "\n".join([f"• {a}" for a in actions_list]) if actions_list else "• Review creative & audience"
     payload = format_slack_block(client_name, level, name, ts, reasons, fixes_bullets, kpis)
+    channel, key = f"slack:{secret_tag(webhook_url)}", f"{client_name}|{level}|{entity_id or name}|{ts}"
+    digest = payload_hash(payload)
+    ledger = get_ledger()
+    if ledger.is_delivered(channel, key, digest):
+        return False
     _post_json(webhook_url, payload)
+    ledger.record(channel, key, digest)
+    return True
+
+
+# --- digest mode: every flagged entity of a client run in a few messages ---
+def _clip(text: str, limit: int = SLACK_MAX_TEXT) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def digest_entry_blocks(alert: Dict[str, Any]) -> List[dict]:
+    """
+    Blocks for one flagged entity in a digest. `alert` has name, ts, reasons
+    (str), actions (list), kpis (same keys as send_slack_alert) and optionally
+    severity and detections (fatigue.detections).
+    """
+    kpis = alert.get("kpis") or {}
+    fields = []
+    if kpis.get("roas") is not None: fields.append(f"ROAS {kpis['roas']}")
+    if kpis.get("cpm")  is not None: fields.append(f"CPM ${kpis['cpm']}")
+    if kpis.get("ctr")  is not None: fields.append(f"CTR {kpis['ctr']}%")
+    if kpis.get("spend")is not None: fields.append(f"Spend ${kpis['spend']}")
+    if kpis.get("res")  is not None: fields.append(f"Results {kpis['res']}")
+    fixes = "; ".join(alert.get("actions") or []) or "Review creative & audience"
+    head = f"*{alert.get('name') or '(unnamed)'}* — {alert.get('ts') or ''}"
+    if alert.get("severity"):
+        head += f" — *{alert['severity']}*"
+    lines = [head]
+    moves = " • ".join(f"{d['metric'].upper()} {d['pct_change']:+.0f}%" for d in alert.get("detections") or [])
+    if moves:
+        lines.append(moves)
+    lines += [alert.get("reasons") or "", f"_Fix:_ {fixes}"]
+    text = "\n".join(lines)
+    blocks = [{"type": "section", "text": {"type": "mrkdwn", "text": _clip(text)}}]
+    if fields:
+        blocks.append({"type": "context", "elements": [{"type": "mrkdwn", "text": " • ".join(fields)}]})
+    return blocks
+
+
+def chunk_entries(entries: List[List[dict]], max_blocks: int = SLACK_MAX_BLOCKS) -> List[List[int]]:
+    """
+    Split per-entity block lists into messages of at most `max_blocks` blocks
+    (header + divider included). Returns entry indexes per message.
+    """
+    room = max_blocks - 2
+    chunks, cur, used = [], [], 0
+    for i, blocks in enumerate(entries):
+        if cur and used + len(blocks) > room:
+            chunks.append(cur)
+            cur, used = [], 0
+        cur.append(i)
+        used += len(blocks)
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+
+def send_slack_digest(webhook_url: str, client_name: str, level: str, alerts: List[Dict[str, Any]]) -> int:
+    """
+    Post every alert of a client run as a digest: a few block-kit messages chunked
+    under Slack's block limit instead of one webhook call per entity. Entities
+    whose exact entry was already delivered (by entity_id) are left out. Returns
+    messages sent.
+    """
+    channel = f"slack:{secret_tag(webhook_url)}"
+    ledger = get_ledger()
+    pending = []
+    for a in alerts:
+        blocks = digest_entry_blocks(a)
+        key = f"{client_name}|{level}|{a.get('entity_id') or a.get('name') or ''}|{a.get('ts') or ''}"
+        digest = payload_hash(blocks)
+        if not ledger.is_delivered(channel, key, digest):
+            pending.append((key, digest, blocks))
+    if not pending:
+        return 0
+
+    chunks = chunk_entries([p[2] for p in pending])
+    for n, idxs in enumerate(chunks, 1):
+        part = f" ({n}/{len(chunks)})" if len(chunks) > 1 else ""
+        blocks = [
+            {"type": "section", "text": {"type": "mrkdwn", "text":
+                f":rotating_light: *Creative Fatigue Digest — {client_name}*{part}\n*Level:* {level} • *Flagged:* {len(pending)}"}},
+            {"type": "divider"},
+        ]
+        for i in idxs:
+            blocks.extend(pending[i][2])
+        _post_json(webhook_url, {"blocks": blocks, "text": f"Creative fatigue: {len(pending)} flagged for {client_name}"})
+        # record per entity, so a failure in a later chunk only resends that chunk
+        for i in idxs:
+            ledger.record(channel, pending[i][0], pending[i][1])
+    return len(chunks)
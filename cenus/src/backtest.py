@@ -0,0 +1,134 @@
+# src/backtest.py
+# Replay the fatigue rules over stored KPI history for many threshold
+# combinations. Baselines do not depend on thresholds, so they are computed once
+# (rolling, O(1) per day); each combination is then a vectorized rule_masks call.
+import datetime, itertools, os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .fatigue import _flt, RULE_KEYS, DEFAULT_THRESHOLDS, batch_pct_change, rule_masks
+from .history import HistoryStore
+from .rolling import replay_baselines
+
+
+def load_grouped_history(client: str, level: str, since: str, until: str) -> Dict[str, List[Dict[str, Any]]]:
+    """{entity_id: rows} for a client/level window from the local HistoryStore."""
+    g = defaultdict(list)
+    for r in HistoryStore(client).read_range(level, since, until):
+        g[r[f"{level}_id"]].append(r)
+    return g
+
+
+def build_replay(grouped: Dict[str, List[Dict[str, Any]]], baseline_days: int) -> Dict[str, np.ndarray]:
+    """
+    One row per (entity, day) that has a full baseline: latest values (as
+    evaluate_rules reads them), rolling baseline, entity index and day ordinal.
+    Rows are ordered by entity, then day.
+    """
+    latest, base, ent, day = [], [], [], []
+    for i, (eid, rows) in enumerate(grouped.items()):
+        for row, b in replay_baselines(rows, baseline_days):
+            latest.append([_flt(row.get(k)) or 0.0 for k in RULE_KEYS])
+            base.append([b[k] for k in RULE_KEYS])
+            ent.append(i)
+            day.append(datetime.date.fromisoformat(row["timestamp"]).toordinal())
+    k = len(RULE_KEYS)
+    return {
+        "latest": np.array(latest, dtype=np.float64).reshape(-1, k),
+        "base": np.array(base, dtype=np.float64).reshape(-1, k),
+        "entity": np.array(ent, dtype=np.int64),
+        "day": np.array(day, dtype=np.int64),
+    }
+
+
+def outcome_mask(replay: Dict[str, np.ndarray], drop_pct: float) -> np.ndarray:
+    """Entity-days where ROAS is at least drop_pct below its baseline (the event we want early warning for)."""
+    d_roas = batch_pct_change(replay["latest"][:, RULE_KEYS.index("kpis_roas")],
+                              replay["base"][:, RULE_KEYS.index("kpis_roas")])
+    return d_roas <= -drop_pct
+
+
+def _first_per_entity(mask: np.ndarray, entity: np.ndarray, day: np.ndarray) -> Dict[int, int]:
+    out = {}
+    for e, d in zip(entity[mask], day[mask]):
+        if e not in out:
+            out[int(e)] = int(d)  # rows are day-ordered within an entity
+    return out
+
+
+def score_thresholds(replay: Dict[str, np.ndarray], th: Dict[str, float],
+                     outcome: np.ndarray) -> Dict[str, Any]:
+    """
+    Flag counts, alert volume and lead time for one threshold combination.
+      flags   entity-days flagged
+      alerts  alert episodes (a flagged day whose previous entity-day was not flagged)
+      lead    days from an entity's first alert to its first outcome day, for
+              entities alerted on or before that day
+    """
+    masks, _ = rule_masks(replay["latest"], replay["base"], th)
+    flagged = masks["A"] | masks["B"] | masks["C"] | masks["D"]
+    ent, day = replay["entity"], replay["day"]
+
+    prev_flag = np.zeros_like(flagged)
+    same = np.zeros_like(flagged)
+    if len(flagged) > 1:
+        prev_flag[1:] = flagged[:-1]
+        same[1:] = ent[1:] == ent[:-1]
+    episodes = flagged & ~(prev_flag & same)
+
+    first_alert = _first_per_entity(flagged, ent, day)
+    first_outcome = _first_per_entity(outcome, ent, day)
+    leads = [first_outcome[e] - first_alert[e] for e in first_outcome
+             if e in first_alert and first_alert[e] <= first_outcome[e]]
+
+    return {
+        "thresholds": th,
+        "flags": int(flagged.sum()),
+        "alerts": int(episodes.sum()),
+        "entities_flagged": len(first_alert),
+        "rule_counts": {k: int(m.sum()) for k, m in masks.items()},
+        "outcomes": len(first_outcome),
+        "caught": len(leads),
+        "lead_days_mean": float(np.mean(leads)) if leads else None,
+        "lead_days_median": float(np.median(leads)) if leads else None,
+    }
+
+
+def threshold_grid(spec: Dict[str, List[float]]) -> List[Dict[str, float]]:
+    """Cartesian product of threshold values; keys not in spec keep their defaults."""
+    keys = list(spec)
+    return [dict(DEFAULT_THRESHOLDS, **dict(zip(keys, combo)))
+            for combo in itertools.product(*(spec[k] for k in keys))]
+
+
+# --- process pool plumbing: the replay arrays are shipped once per worker ---
+_W: Dict[str, Any] = {}
+
+
+def _init_worker(replay, outcome):
+    _W["replay"], _W["outcome"] = replay, outcome
+
+
+def _score_chunk(combos: List[Dict[str, float]]) -> List[Dict[str, Any]]:
+    return [score_thresholds(_W["replay"], th, _W["outcome"]) for th in combos]
+
+
+def run_backtest(grouped: Dict[str, List[Dict[str, Any]]], grid: List[Dict[str, float]],
+                 baseline_days: int = 7, outcome_drop_pct: float = 40.0,
+                 workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Score every combination in `grid`; results come back in grid order."""
+    replay = build_replay(grouped, baseline_days)
+    outcome = outcome_mask(replay, outcome_drop_pct)
+    workers = max(1, workers or os.cpu_count() or 1)
+    if workers == 1 or len(grid) < 2:
+        _init_worker(replay, outcome)
+        return _score_chunk(grid)
+
+    size = max(1, -(-len(grid) // (workers * 4)))
+    chunks = [grid[i:i + size] for i in range(0, len(grid), size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(replay, outcome)) as ex:
+        return [r for part in ex.map(_score_chunk, chunks) for r in part]
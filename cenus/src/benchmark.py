@@ -0,0 +1,213 @@
+# src/benchmark.py
+# End-to-end timings of the hot paths on synthetic data (src/synth.py): Graph
+# rows -> KPI / fatigue rows, roll-up, grouping, baselines, rules (vectorized,
+# batch, EWMA), local storage writes / reads and Notion payload building.
+# Every stage runs `repeat` times on fresh inputs and keeps the fastest run.
+# Reports compare against a stored baseline report (scripts/benchmark.py).
+import os, sys, time, shutil, platform, tempfile
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from .synth import SynthSpec, Synth, generate
+from .meta_client import iter_kpis, to_fatigue_row, KPI_FIELDS
+from .rollup import RollUp
+from .fatigue_job import group_by_entity
+from .fatigue import kpi_cube, batch_baselines, evaluate_batch, rolling_baseline
+from .rules import compile_rules
+from .ewma import EwmaState, default_alpha, fold
+from .history import HistoryStore
+from .storage import stream_records, ts_now_iso
+from .notion import record_properties, alert_properties
+from .ledger import payload_hash
+
+# a stage is slower than its baseline when it takes more than `tolerance` x the
+# baseline time and at least this many seconds more (timer noise on tiny stages)
+MIN_REGRESSION_SECONDS = 0.005
+
+
+def _best(fn: Callable[[Any], int], repeat: int, setup: Optional[Callable[[], Any]] = None):
+    """(fastest seconds, rows) over `repeat` runs of fn(setup())."""
+    best, rows = float("inf"), 0
+    for _ in range(max(1, repeat)):
+        arg = setup() if setup else None
+        t0 = time.perf_counter()
+        rows = fn(arg)
+        best = min(best, time.perf_counter() - t0)
+    return best, rows
+
+
+def run_benchmark(spec: SynthSpec, repeat: int = 3, baseline_days: int = 7,
+                  workdir: Optional[str] = None) -> Dict[str, Any]:
+    """Run every stage; returns the report ({"spec", "env", "stages": {name: {seconds, rows, rows_per_sec}}})."""
+    tmp = workdir or tempfile.mkdtemp(prefix="cenus-bench-")
+    stages: Dict[str, Dict[str, Any]] = {}
+    rules = compile_rules({})
+
+    def stage(name: str, fn, setup=None):
+        seconds, rows = _best(fn, repeat, setup)
+        stages[name] = {"seconds": round(seconds, 6), "rows": rows,
+                        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None}
+        print(f"[Bench] {name:<22} {seconds:9.4f}s  {rows:>10} rows")
+
+    holder: Dict[str, Any] = {}
+
+    def _generate(_):
+        holder["synth"] = generate(spec)
+        return holder["synth"].n_rows
+    stage("generate", _generate)
+    s: Synth = holder["synth"]
+    clients = range(spec.clients)
+    since, until = s.dates[0], s.dates[-1]
+
+    def _render(_):
+        holder["graph"] = [list(s.graph_rows(c)) for c in clients]
+        return sum(len(g) for g in holder["graph"])
+    stage("render_graph_rows", _render)
+    graph = holder["graph"]
+
+    stage("transform_kpis", lambda _: sum(sum(1 for _ in iter_kpis(g, "ad")) for g in graph))
+
+    def _fatigue_rows(_):
+        holder["frows"] = [[to_fatigue_row(r, "ad") for r in g] for g in graph]
+        return sum(len(f) for f in holder["frows"])
+    stage("transform_fatigue_rows", _fatigue_rows)
+    frows = holder["frows"]
+
+    def _rollup(_):
+        n = 0
+        for g in graph:
+            ru = RollUp()
+            for r in g:
+                ru.add(r)
+            n += sum(1 for lvl in ru.levels for _ in ru.rows(lvl))
+        return n
+    stage("rollup", _rollup)
+
+    def _group(_):
+        holder["grouped"] = [group_by_entity(f, "ad") for f in frows]
+        return sum(len(f) for f in frows)
+    stage("group", _group)
+    grouped = holder["grouped"]
+
+    def _baselines(_):
+        holder["cubes"] = []
+        n = 0
+        for g in grouped:
+            eids, vals, present, _tails = kpi_cube(g, baseline_days + 1, rules.keys)
+            holder["cubes"].append(batch_baselines(vals, present))
+            n += vals.shape[0] * vals.shape[1]
+        return n
+    stage("baselines", _baselines)
+
+    def _masks(_):
+        n = 0
+        for latest, base in holder["cubes"]:
+            masks, near = rules.masks(latest, base)
+            rules.fired_any(masks, latest.shape[0])
+            n += latest.shape[0]
+        return n
+    stage("rules_vectorized", _masks)
+
+    stage("evaluate_batch", lambda _: sum(len(evaluate_batch(g, baseline_days, {}, rules)) for g in grouped))
+
+    # EWMA: state warmed on every day but the last, then one daily fold
+    def _ewma_setup():
+        states = []
+        for c in clients:
+            st = EwmaState(f"bench{c}", "ad", default_alpha(baseline_days), os.path.join(tmp, f"ewma_{c}.json"))
+            st.reset()
+            fold(st, [r for r in frows[c] if r["timestamp"] < until], "ad_id", rules, warmup=baseline_days)
+            states.append(st)
+        return states
+
+    def _ewma_day(states):
+        n = 0
+        for c, st in enumerate(states):
+            day_rows = [r for r in frows[c] if r["timestamp"] == until]
+            fold(st, day_rows, "ad_id", rules, warmup=baseline_days)
+            n += len(day_rows)
+        return n
+    stage("ewma_daily_fold", _ewma_day, _ewma_setup)
+
+    def _write_exports(_):
+        n = 0
+        for c, g in enumerate(graph):
+            n += stream_records(iter_kpis(g, "ad"), os.path.join(tmp, f"ad_{c}.jsonl"),
+                                os.path.join(tmp, f"ad_{c}.csv"), sorted(KPI_FIELDS))
+        return n
+    stage("write_jsonl_csv", _write_exports)
+
+    def _fresh_history():
+        shutil.rmtree(os.path.join(tmp, "history"), ignore_errors=True)
+
+    def _write_history(_):
+        for c in clients:
+            with HistoryStore(f"bench{c}", root=os.path.join(tmp, "history", str(c))).ingest("ad", since, until) as h:
+                for r in frows[c]:
+                    h.add(r)
+        return sum(len(f) for f in frows)
+    stage("write_history", _write_history, _fresh_history)
+
+    stage("read_history", lambda _: sum(
+        len(HistoryStore(f"bench{c}", root=os.path.join(tmp, "history", str(c))).read_range("ad", since, until))
+        for c in clients))
+
+    # Notion: yesterday's KPI page per entity, plus one alert row per detection
+    def _payloads(_):
+        n = 0
+        for c in clients:
+            for r in frows[c]:
+                if r["timestamp"] != until:
+                    continue
+                payload_hash(record_properties(r))
+                n += 1
+        return n
+    stage("notion_kpi_payloads", _payloads)
+
+    def _flagged():
+        out = []
+        for g in grouped:
+            for eid, (fatigued, _, _) in evaluate_batch(g, baseline_days, {}, rules).items():
+                if fatigued:
+                    tail = sorted(g[eid], key=lambda r: r["timestamp"])[-(baseline_days + 1):]
+                    out.append((eid, tail[-1], rolling_baseline(tail[:-1])))
+        return out
+
+    def _alert_payloads(flagged):
+        n = 0
+        for eid, latest, base in flagged:
+            for d in rules.detections(latest, base):
+                payload_hash(alert_properties(latest["timestamp"], "Ad", eid, latest["name"], d["metric"],
+                                              d["value"], d["baseline"], d["pct_change"], d["severity"],
+                                              "bench", None, ""))
+                n += 1
+        return n
+    stage("notion_alert_payloads", _alert_payloads, _flagged)
+
+    if not workdir:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "created_at": ts_now_iso(),
+        "spec": spec.to_dict(),
+        "repeat": repeat,
+        "baseline_days": baseline_days,
+        "rows": s.n_rows,
+        "env": {"python": sys.version.split()[0], "numpy": np.__version__, "platform": platform.platform(),
+                "machine": platform.machine(), "cpus": os.cpu_count()},
+        "stages": stages,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 1.25) -> List[Dict[str, Any]]:
+    """Per-stage current vs baseline seconds; `regression` is set where it got slower than `tolerance` x."""
+    out = []
+    for name, cur in report["stages"].items():
+        old = (baseline.get("stages") or {}).get(name)
+        if not old or not old.get("seconds"):
+            continue
+        ratio = cur["seconds"] / old["seconds"]
+        out.append({"stage": name, "seconds": cur["seconds"], "baseline_seconds": old["seconds"],
+                    "ratio": round(ratio, 3),
+                    "regression": ratio > tolerance and cur["seconds"] - old["seconds"] > MIN_REGRESSION_SECONDS})
+    return out
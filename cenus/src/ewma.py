@@ -0,0 +1,133 @@
+# src/ewma.py
+# Incremental fatigue baselines: instead of re-reading baseline_days of history
+# per entity, keep an exponentially weighted mean per KPI and fold in
+# one new day at a time. The compiled rules (src/rules.py) run against the EWMA mean.
+#   <DATA_DIR>/_state/ewma/<Client_Name>_<level>.json
+#     {"alpha", "keys", "until", "entities": {id: {"d", "n", "m": [...]}}}
+# alpha defaults to 2 / (baseline_days + 1), which gives the same centre of mass
+# as a baseline_days simple mean. An entity is evaluated once it has `warmup` days.
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .storage import state_path, write_json_atomic, read_json
+from .history import client_key
+from .fatigue import BASELINE_KEYS, _flt
+from .rules import CompiledRules
+from .metrics import incr, timer
+
+
+def default_alpha(baseline_days: int) -> float:
+    a = os.getenv("EWMA_ALPHA")
+    return float(a) if a else 2.0 / (baseline_days + 1)
+
+
+class EwmaState:
+    """Per-entity EWMA state of one client/level (see module comment)."""
+
+    def __init__(self, client: str, level: str, alpha: float, path: Optional[str] = None):
+        self.path = path or state_path("ewma", f"{client_key(client)}_{level}.json")
+        data = read_json(self.path) or {}
+        if data.get("keys") != BASELINE_KEYS or data.get("alpha") != alpha:
+            if data:
+                print(f"[EWMA] {self.path}: alpha/keys changed, starting over")
+            data = {}
+        self.alpha = alpha
+        self.until: Optional[str] = data.get("until")  # last day folded for any entity
+        self.entities: Dict[str, Dict[str, Any]] = data.get("entities", {})
+
+    def reset(self):
+        self.until, self.entities = None, {}
+
+    def seen(self, eid: str) -> int:
+        e = self.entities.get(eid)
+        return e["n"] if e else 0
+
+    def last_day(self, eid: str) -> Optional[str]:
+        e = self.entities.get(eid)
+        return e["d"] if e else None
+
+    def baseline(self, eid: str) -> Dict[str, float]:
+        """EWMA mean per KPI (0.0 for a KPI never seen, like rolling_baseline)."""
+        m = self.entities[eid]["m"]
+        return {k: (v if v is not None else 0.0) for k, v in zip(BASELINE_KEYS, m)}
+
+    def update(self, eid: str, row: Dict[str, Any]) -> bool:
+        """Fold one daily row in; False (no change) if that day is not newer than the state."""
+        day = row.get("timestamp")
+        e = self.entities.get(eid)
+        if e is None:
+            e = self.entities[eid] = {"d": None, "n": 0, "m": [None] * len(BASELINE_KEYS)}
+        elif e["d"] and day <= e["d"]:
+            return False
+        a = self.alpha
+        for i, key in enumerate(BASELINE_KEYS):
+            x = _flt(row.get(key))
+            if x is None:  # missing value: keep the previous estimate
+                continue
+            m = e["m"][i]
+            e["m"][i] = x if m is None else m + a * (x - m)
+        e["d"], e["n"] = day, e["n"] + 1
+        if not self.until or day > self.until:
+            self.until = day
+        return True
+
+    def save(self):
+        write_json_atomic({"alpha": self.alpha, "keys": BASELINE_KEYS, "until": self.until,
+                           "entities": self.entities}, self.path)
+
+
+def evaluate_day(state: EwmaState, rows: Dict[str, Dict[str, Any]], rules: CompiledRules,
+                 warmup: int) -> Dict[str, Tuple[bool, List[str], List[str]]]:
+    """
+    `rules` for one day's rows ({entity_id: row}) against the state *before*
+    that day is folded in. Entities with fewer than `warmup` days of state, or
+    whose state already contains the day, are left out. Flags are decided
+    vectorized; flagged / borderline entities are re-run through the scalar path.
+    """
+    eids = [eid for eid, r in rows.items()
+            if state.seen(eid) >= warmup and r.get("timestamp") > (state.last_day(eid) or "")]
+    incr("ewma.entities", len(eids))
+    if not eids:
+        return {}
+    with timer("ewma.rules"):
+        latest = np.array([[_flt(rows[eid].get(k)) or 0.0 for k in BASELINE_KEYS] for eid in eids], dtype=np.float64)
+        base = np.array([[x if x is not None else 0.0 for x in state.entities[eid]["m"]] for eid in eids],
+                        dtype=np.float64)
+        masks, near = rules.masks(latest, base, BASELINE_KEYS)
+        flagged = rules.fired_any(masks, len(eids))
+    out = {}
+    for i, eid in enumerate(eids):
+        if flagged[i] or near[i]:
+            out[eid] = rules.evaluate(rows[eid], state.baseline(eid))
+        else:
+            out[eid] = (False, [], [])
+    incr("ewma.flagged", sum(1 for v in out.values() if v[0]))
+    return out
+
+
+def fold(state: EwmaState, rows: Iterable[Dict[str, Any]], id_key: str, rules: CompiledRules,
+         warmup: int) -> Tuple[Optional[str], Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """
+    Catch the state up on `rows` (daily rows of any number of days, any order)
+    one day at a time. The newest day is evaluated (evaluate_day) before it is
+    folded in. Returns (day, {entity_id: result}, {entity_id: baseline used}).
+    """
+    by_day: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for r in rows:
+        eid, day = r.get(id_key), r.get("timestamp")
+        if eid and day:
+            by_day.setdefault(day, {})[eid] = r
+    if not by_day:
+        return None, {}, {}
+    days = sorted(by_day)
+    for day in days[:-1]:
+        for eid, r in by_day[day].items():
+            state.update(eid, r)
+    last = days[-1]
+    results = evaluate_day(state, by_day[last], rules, warmup)
+    bases = {eid: state.baseline(eid) for eid, res in results.items() if res[0]}
+    for eid, r in by_day[last].items():
+        state.update(eid, r)
+    return last, results, bases
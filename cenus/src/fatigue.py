@@ -1,18 +1,20 @@
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Optional
 import statistics as stats
+import math
 
+import numpy as np
 
-def _flt(x):
-    try:
-        return float(x) if x is not None else None
-    except Exception:
-        return None
+from .metrics import incr, timer
+from .rules import (DEFAULT_THRESHOLDS, SEVERITIES, CompiledRules, compile_rules, resolve_thresholds,
+                    pct_change, batch_pct_change, severity, _flt, _to_float)
 
+BASELINE_KEYS = [
+    "kpis_ctr", "kpis_roas", "kpis_cpm", "kpis_cpc", "kpis_frequency",
+    "kpis_impressions", "kpis_spend", "kpis_clicks", "kpis_results"
+]
 
-def pct_change(curr: float, base: float) -> float:
-    if base is None or base == 0 or curr is None:
-        return 0.0
-    return (curr - base) / base * 100.0
+# KPIs the rules look at, in the column order used by the batch API
+RULE_KEYS = ["kpis_ctr", "kpis_roas", "kpis_cpm", "kpis_cpc", "kpis_frequency", "kpis_results"]
 
 
 def build_series(rows: List[Dict[str, Any]], key: str) -> List[float]:
@@ -29,117 +31,148 @@ def rolling_baseline(last_7_rows: List[Dict[str, Any]]) -> Dict[str, float]:
     Compute 7-day baseline (mean) for key KPIs.
     Input rows must be daily (one per date for the same entity).
     """
-    keys = [
-        "kpis_ctr", "kpis_roas", "kpis_cpm", "kpis_cpc", "kpis_frequency",
-        "kpis_impressions", "kpis_spend", "kpis_clicks", "kpis_results"
-    ]
     base = {}
-    for k in keys:
+    for k in BASELINE_KEYS:
         s = build_series(last_7_rows, k)
         base[k] = stats.fmean(s) if s else 0.0
     return base
 
-def _to_float(v, default):
-    try:
-        return float(v)
-    except (TypeError, ValueError):
-        return default
-
-
 def evaluate_rules(latest: Dict[str, Any], base: Dict[str, float],
-                   th: Dict[str, float]) -> Tuple[bool, List[str], List[str]]:
+                   th: Dict[str, Any]) -> Tuple[bool, List[str], List[str]]:
     """
     Returns (is_fatigued, reasons[], actions[])
-    th keys:
-      CTR_DOWN_PCT, ROAS_DOWN_PCT, CPM_UP_PCT, FREQ_UP_PCT, CPC_UP_PCT, RESULTS_DOWN_PCT
+    th: Settings DB values -- thresholds (CTR_DOWN_PCT, ROAS_DOWN_PCT, CPM_UP_PCT,
+    FREQ_UP_PCT, RESULTS_DOWN_PCT) and RULE_* definitions, see src/rules.py.
+    Rules A-D and any custom ones run through the compiled form, cached per settings.
+    """
+    return compile_rules(th).evaluate(latest, base)
+
+
+# --- Structured detections (one record per metric that tripped a rule) ---
+def detections(latest: Dict[str, Any], base: Dict[str, float], th: Dict[str, Any],
+               rules: Optional[CompiledRules] = None) -> List[Dict[str, Any]]:
+    """
+    The metrics behind each rule evaluate_rules would trip, as
+    {metric, value, baseline, pct_change, threshold, severity, rules}; a metric
+    shared by two rules (CTR in A and C) is reported once.
+    """
+    return (rules or compile_rules(th)).detections(latest, base)
+
+
+def max_severity(dets: List[Dict[str, Any]]) -> str:
+    return max((d["severity"] for d in dets), key=SEVERITIES.index, default="")
+
+
+# --- Batch (vectorized) evaluation ---
+# Same rules as evaluate_rules, for every entity at once on (entity, day, KPI)
+# arrays. Flags are decided vectorized; the few flagged entities (and any whose
+# deltas sit within float noise of a threshold) are re-run through the scalar
+# path, so flags, reasons and actions match evaluate_rules exactly.
+
+def _cell(v) -> float:
+    # parsed like _flt, with missing / unparsable values as NaN
+    x = _flt(v)
+    return math.nan if x is None else x
+
+
+def kpi_cube(grouped: Dict[str, List[Dict[str, Any]]], n_rows: int,
+             keys: Optional[List[str]] = None) -> Tuple[List[str], np.ndarray, np.ndarray, Dict[str, List[Dict[str, Any]]]]:
+    """
+    Stack the last `n_rows` rows (by timestamp) of every entity that has at least
+    that many into arrays of shape (E, n_rows, K): values (0 where missing) and a
+    presence mask (value parsed, as in build_series). Returns
+    (entity_ids, values, present, tails) where tails holds the rows used.
+    Built one KPI column at a time over the flattened tails; a NaN value counts
+    as missing (the scalar recheck never fires on NaN either).
+    """
+    keys = keys or RULE_KEYS
+    eids, tails, flat = [], {}, []
+    by_ts = lambda r: r.get("timestamp")
+    for eid, series in grouped.items():
+        if len(series) < n_rows:
+            continue
+        s = sorted(series, key=by_ts)[-n_rows:]
+        eids.append(eid)
+        tails[eid] = s
+        flat.extend(s)
+    vals = np.empty((len(eids), n_rows, len(keys)), dtype=np.float64)
+    cells = vals.reshape(len(flat), len(keys))
+    nan = math.nan
+    for k, key in enumerate(keys):
+        col = [r.get(key) for r in flat]
+        try:  # numbers / numeric strings / None convert in one call
+            cells[:, k] = np.array([nan if v is None else v for v in col], dtype=np.float64)
+        except (TypeError, ValueError):
+            cells[:, k] = np.fromiter(map(_cell, col), dtype=np.float64, count=len(col))
+    present = ~np.isnan(vals)
+    vals[~present] = 0.0
+    return eids, vals, present, tails
+
+
+def _compensated_sum(x: np.ndarray, axis: int) -> np.ndarray:
+    """Neumaier summation along `axis` (tracks math.fsum, which fmean uses)."""
+    x = np.moveaxis(x, axis, 0)
+    s = np.zeros(x.shape[1:], dtype=np.float64)
+    c = np.zeros_like(s)
+    for v in x:
+        t = s + v
+        big = np.abs(s) >= np.abs(v)
+        c += np.where(big, (s - t) + v, (v - t) + s)
+        s = t
+    return s + c
+
+
+def batch_baselines(vals: np.ndarray, present: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (latest, base) arrays of shape (E, K) from a kpi_cube: latest is the last row
+    (0.0 where missing), base the mean of the earlier rows' present values (0.0 if none).
+    """
+    latest = np.where(present[:, -1, :], vals[:, -1, :], 0.0)
+    hist, hp = vals[:, :-1, :], present[:, :-1, :]
+    n = hp.sum(axis=1)
+    total = _compensated_sum(np.where(hp, hist, 0.0), axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        base = np.where(n > 0, total / np.maximum(n, 1), 0.0)
+    return latest, base
+
+
+def rule_masks(latest: np.ndarray, base: np.ndarray, th: Dict[str, Any],
+               keys: Optional[List[str]] = None) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """
+    Boolean mask per rule (shape (E,)) plus a mask of entities whose deltas
+    are within float noise of a threshold. Columns are looked up by `keys`.
+    """
+    return compile_rules(th).masks(latest, base, keys or RULE_KEYS)
+
+
+def evaluate_batch(grouped: Dict[str, List[Dict[str, Any]]], baseline_days: int,
+                   th: Dict[str, Any], rules: Optional[CompiledRules] = None
+                   ) -> Dict[str, Tuple[bool, List[str], List[str]]]:
+    """
+    evaluate_rules for every entity in `grouped` ({entity_id: daily rows}) in one
+    vectorized pass. Entities with fewer than baseline_days + 1 rows are left out,
+    like run_fatigue does. `rules` defaults to compile_rules(th).
+    Returns {entity_id: (is_fatigued, reasons, actions)}.
     """
-    reasons = []
-    actions = []
-
-    # Extract values
-    ctr = _flt(latest.get("kpis_ctr")) or 0.0
-    roas = _flt(latest.get("kpis_roas")) or 0.0
-    cpm = _flt(latest.get("kpis_cpm")) or 0.0
-    cpc = _flt(latest.get("kpis_cpc")) or 0.0
-    freq = _flt(latest.get("kpis_frequency")) or 0.0
-    results = _flt(latest.get("kpis_results")) or 0.0
-
-    # Baselines
-    b_ctr = base.get("kpis_ctr", 0.0)
-    b_roas = base.get("kpis_roas", 0.0)
-    b_cpm = base.get("kpis_cpm", 0.0)
-    b_cpc = base.get("kpis_cpc", 0.0)
-    b_freq = base.get("kpis_frequency", 0.0)
-    b_results = base.get("kpis_results", 0.0)
-
-    # % deltas
-    d_ctr = pct_change(ctr, b_ctr)
-    d_roas = pct_change(roas, b_roas)
-    d_cpm = pct_change(cpm, b_cpm)
-    d_cpc = pct_change(cpc, b_cpc)
-    d_freq = pct_change(freq, b_freq)
-    d_results = pct_change(results, b_results)
-
-    # Thresholds (defaults baked; can be overridden by Notion settings)
-    FREQ_UP_PCT      = _to_float(th.get("FREQ_UP_PCT"), 35.0)
-    CTR_DOWN_PCT     = _to_float(th.get("CTR_DOWN_PCT"), 25.0)
-    ROAS_DOWN_PCT    = _to_float(th.get("ROAS_DOWN_PCT"), 30.0)
-    CPM_UP_PCT       = _to_float(th.get("CPM_UP_PCT"), 40.0)
-    RESULTS_DOWN_PCT = _to_float(th.get("RESULTS_DOWN_PCT"), 30.0)
-
-    # --- Rules ---
-    # A) Classic fatigue: Frequency up + CTR down
-    rule_A = (d_freq >= FREQ_UP_PCT) and (d_ctr <= -CTR_DOWN_PCT)
-    if rule_A:
-        reasons.append(
-            f"Frequency ↑ {d_freq:.0f}% vs 7d (from {b_freq:.2f} to {freq:.2f}) while CTR ↓ {abs(d_ctr):.0f}% (from {b_ctr:.2f}% to {ctr:.2f}%). → Audience saturation."
-        )
-        actions += [
-            "Rotate new creative (fresh hook/thumbnail within first 3s).",
-            "Broaden/exclude recent engagers to reset Frequency.",
-            "Shift spend to best placements (Reels/Stories) for lower CPM."
-        ]
-
-    # B) Efficiency drop: ROAS down
-    rule_B = (d_roas <= -ROAS_DOWN_PCT)
-    if rule_B:
-        reasons.append(
-            f"ROAS ↓ {abs(d_roas):.0f}% vs 7d (from {b_roas:.2f} to {roas:.2f})."
-        )
-        actions += [
-            "Swap to proven winner creative (highest ROAS past 14d).",
-            "Test price/offer/urgency in headline or on landing page.",
-            "Reduce spend cap or tighten audience until creative refresh."
-        ]
-
-    # C) Auction pressure: CPM up + CTR down
-    rule_C = (d_cpm >= CPM_UP_PCT) and (d_ctr <= -CTR_DOWN_PCT)
-    if rule_C:
-        reasons.append(
-            f"CPM ↑ {d_cpm:.0f}% vs 7d (from ${b_cpm:.2f} to ${cpm:.2f}) while CTR ↓ {abs(d_ctr):.0f}%. → Auction pressure/creative mismatch."
-        )
-        actions += [
-            "Try square/vertical cut for mobile-first placements.",
-            "Refine audience (exclude recent purchasers, add broad LAL).",
-            "Test value-led hook addressing objections in first 3s."
-        ]
-
-    # D) Click cost up; results down
-    rule_D = (d_cpc >= CPM_UP_PCT) and (d_results <= -RESULTS_DOWN_PCT)
-    if rule_D:
-        reasons.append(
-            f"CPC ↑ {d_cpc:.0f}% and Results ↓ {abs(d_results):.0f}% vs 7d.")
-        actions += [
-            "Improve thumb/first frame to lift CTR.",
-            "Move budget to higher-CTR placement (e.g., Reels).",
-            "Add stronger CTA on-video and in primary text."
-        ]
-
-    fatigued = any([rule_A, rule_B, rule_C, rule_D])
-
-    # If nothing tripped but CTR is sliding for 2+ days, you could add a softer early warning rule later.
-    if not fatigued:
-        actions = []
-        reasons = []
-
-    return fatigued, reasons, actions
+    rules = rules or compile_rules(th)
+    with timer("fatigue.kpi_cube"):
+        eids, vals, present, tails = kpi_cube(grouped, baseline_days + 1, rules.keys)
+    incr("fatigue.entities", len(eids))
+    if not eids:
+        return {}
+    with timer("fatigue.baselines_rules"):
+        latest, base = batch_baselines(vals, present)
+        masks, near = rules.masks(latest, base)
+        flagged = rules.fired_any(masks, len(eids))
+
+    out = {}
+    with timer("fatigue.scalar_recheck"):
+        for i, eid in enumerate(eids):
+            if flagged[i] or near[i]:
+                rows = tails[eid]
+                out[eid] = rules.evaluate(rows[-1], rolling_baseline(rows[:-1]))
+            else:
+                out[eid] = (False, [], [])
+    incr("fatigue.rechecked", int((flagged | near).sum()))
+    incr("fatigue.flagged", sum(1 for v in out.values() if v[0]))
+    return out
@@ -0,0 +1,366 @@
+# src/fatigue_job.py
+# One client's fatigue run: load the window (local history / Meta, or demo rows),
+# evaluate every entity, write the fatigue fields to Notion, then alert.
+# Used by scripts/run_fatigue.py and the in-process pipeline (src/pipeline.py).
+import os, time, datetime, random
+from collections import defaultdict
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .sync import sync_insights, WatermarkStore
+from .history import HistoryStore
+from .notion import get_settings_versioned
+from .alerts import resolve_webhook
+from .fatigue import evaluate_batch, rolling_baseline, max_severity
+from .rules import CompiledRules, compile_rules
+from .outbox import enqueue, enqueue_many, drain
+from .ewma import EwmaState, default_alpha, fold
+from .parallel import run_bounded
+from .graph import configure_graph_client
+
+
+def demo_kpis(level: str, days: int, since: str, until: str):
+    start = datetime.datetime.strptime(since, "%Y-%m-%d").date()
+    rows = []
+    for i in range(days):
+        d = start + datetime.timedelta(days=i)
+        rows.append({
+            "timestamp": d.strftime("%Y-%m-%d"),
+            "level": level,
+            "name": f"Demo {level} {i}",
+            "campaign_id": "cmp_demo",
+            "adset_id": "adset_demo",
+            "ad_id": "ad_demo",
+            "kpis_roas": round(random.uniform(0.7, 2.5), 2),
+            "kpis_ctr": round(random.uniform(0.5, 3.0), 2),
+            "kpis_cpm": round(random.uniform(3.0, 25.0), 2),
+            "kpis_cpc": round(random.uniform(0.2, 2.5), 2),
+            "kpis_spend": round(random.uniform(5, 120), 2),
+            "kpis_results": random.randint(0, 40),
+        })
+    return rows
+
+
+def date_str(d: datetime.date) -> str:
+    return d.strftime("%Y-%m-%d")
+
+
+def fatigue_window(days: int, end: Optional[datetime.date] = None) -> Tuple[str, str]:
+    """(since, until) of the last `days` days ending yesterday (or `end`)."""
+    end = end or datetime.date.today() - datetime.timedelta(days=1)  # use yesterday as 'latest' day
+    start = end - datetime.timedelta(days=days - 1)
+    return date_str(start), date_str(end)
+
+
+def slice_days(rows: List[Dict], last_n: int) -> List[Dict]:
+    # rows are daily; ensure sorted by timestamp ascending
+    s = sorted(rows, key=lambda r: r.get("timestamp"))
+    return s[-last_n:]
+
+
+def group_by_entity(rows: List[Dict], level: str) -> Dict[str, List[Dict]]:
+    # group key by entity id at the chosen level
+    key_field = {
+        "campaign": "campaign_id",
+        "adset": "adset_id",
+        "ad": "ad_id"
+    }[level]
+    g = defaultdict(list)
+    for r in rows:
+        eid = r.get(key_field)
+        if eid:
+            # normalize timestamp to the record['timestamp'] (already set)
+            g[eid].append(r)
+    return g
+
+
+def slack_mode() -> str:
+    """digest (batched messages per client run, default) | each (one send_slack_alert per alert)."""
+    return (os.getenv("SLACK_ALERT_MODE") or "digest").lower()
+
+
+def detector_mode() -> str:
+    """window (baseline_days of history per entity, default) | ewma (persisted per-entity state, src/ewma.py)."""
+    return (os.getenv("FATIGUE_DETECTOR") or "window").lower()
+
+
+def ewma_warmup(baseline_days: int) -> int:
+    """Days of state an entity needs before the EWMA detector evaluates it."""
+    return int(os.getenv("EWMA_WARMUP") or baseline_days)
+
+
+def ewma_since(state: EwmaState, since: str) -> str:
+    """First day the EWMA state still needs: the day after its last one, but not before `since`."""
+    if not state.until:
+        return since
+    return max(since, date_str(datetime.date.fromisoformat(state.until) + datetime.timedelta(days=1)))
+
+
+def _kpis(latest: Dict) -> Dict[str, Any]:
+    return {
+        "roas": latest.get("kpis_roas"),
+        "cpm": latest.get("kpis_cpm"),
+        "ctr": latest.get("kpis_ctr"),
+        "spend": latest.get("kpis_spend"),
+        "res": latest.get("kpis_results"),
+    }
+
+
+def load_rows(client: Dict, level: str, days: int, since: str, until: str, demo: bool = False,
+              lookback: Optional[int] = None, full: bool = False) -> List[Dict]:
+    """Fatigue rows for since..until: demo data, or local history topped up from Meta."""
+    if demo:
+        print("🧪 Running in DEMO MODE — generating fake KPI data")
+        return demo_kpis(level, days, since, until)
+    # only the days missing locally (+ restatement lookback) hit Meta
+    account_id = client["ad_account_id"]
+    if full:
+        WatermarkStore().reset(account_id, level)
+    return sync_insights(account_id,
+                         level=level,
+                         since=since,
+                         until=until,
+                         history=HistoryStore(client["client_name"]),
+                         lookback_days=lookback)
+
+
+def load_rules(client: Dict) -> CompiledRules:
+    """The client's rules compiled from its Settings DB (defaults without one), once per settings version."""
+    settings_db = client.get("notion_settings_db_id")
+    if not settings_db:
+        return compile_rules({})
+    th, version = get_settings_versioned(settings_db)
+    return compile_rules(th, version=f"{settings_db}|{version}" if version else None)
+
+
+def _record_results(client: Dict, level: str, rules: CompiledRules, evaluated) -> Dict[str, Any]:
+    """
+    Queue the KPI page + fatigue fields of every evaluated entity in the outbox
+    (src/outbox.py) and turn each flagged one into an alert record with its
+    structured detections (see CompiledRules.detections) for send_alerts.
+    `evaluated` yields (entity_id, latest row, (fatigued, reasons, actions), baseline).
+    """
+    notion_db = client["notion_db_id"]
+    flagged = 0
+    checked = 0
+    alerts = []
+    pages = []
+
+    for eid, latest, (fatigued, reasons, actions), base in evaluated:
+        checked += 1
+
+        reason_txt = ""
+        actions_txt = ""
+
+        if fatigued:
+            flagged += 1
+            reason_txt = " | ".join(reasons)[:1800]
+            actions_txt = " • " + " • ".join(actions)
+            dets = rules.detections(latest, base)
+            alerts.append({"entity_id": eid, "level": level, "name": latest.get("name") or "",
+                           "ts": latest.get("timestamp") or "", "reasons": reason_txt,
+                           "actions": actions, "kpis": _kpis(latest),
+                           "detections": dets, "severity": max_severity(dets)})
+            print(
+                f"  [FLAG] {level}:{eid} on {latest['timestamp']} — {reason_txt}"
+            )
+        else:
+            print(f"  [OK]   {level}:{eid} on {latest['timestamp']}")
+
+        # Upsert the KPI record (ensures page exists), then update fatigue fields
+        pages.append((f"{notion_db}|{level}|{eid}|{latest.get('timestamp')}",
+                      {"db_id": notion_db, "record": latest, "fatigued": fatigued,
+                       "reason": reason_txt, "actions": actions_txt}))
+
+    enqueue_many("notion.fatigue", pages)
+    return {"level": level, "checked": checked, "flagged": flagged, "alerts": alerts}
+
+
+def evaluate_rows(client: Dict, level: str, rows: List[Dict], days: int, baseline_days: int) -> Dict[str, Any]:
+    """Window detector: the client's rules on each entity's last day vs the mean of the baseline_days before it."""
+    # Group by entity
+    grouped = group_by_entity(rows, level)
+    if not grouped:
+        print("[Fatigue] No rows found in window.")
+
+    # Rules + thresholds from settings (or defaults will be used)
+    rules = load_rules(client)
+
+    # baselines + rules for every entity in one vectorized pass
+    results = evaluate_batch(grouped, baseline_days, rules.settings, rules=rules)
+
+    def _evaluated():
+        for eid, series in grouped.items():
+            if eid not in results:
+                continue  # need baseline_days + latest
+            latest = slice_days(series, days)[-1]
+            base = None
+            if results[eid][0]:
+                tail = slice_days(series, baseline_days + 1)
+                base = rolling_baseline(tail[:-1])
+            yield eid, latest, results[eid], base
+
+    return _record_results(client, level, rules, _evaluated())
+
+
+def evaluate_ewma(client: Dict, level: str, rows: List[Dict], baseline_days: int,
+                  state: Optional[EwmaState] = None) -> Dict[str, Any]:
+    """
+    EWMA detector (src/ewma.py): fold `rows` into the client's per-entity state
+    and evaluate the client's rules on the newest day against the EWMA baseline. Only
+    days newer than the state are needed, so a daily run reads one day.
+    The state is not saved here: the caller saves it once send_alerts has queued
+    the alerts, so a run that fails before that re-evaluates the same day.
+    """
+    rules = load_rules(client)
+    state = state or EwmaState(client["client_name"], level, default_alpha(baseline_days))
+    day, results, bases = fold(state, rows, f"{level}_id", rules, warmup=ewma_warmup(baseline_days))
+    if day is None:
+        print("[Fatigue] No new rows for the EWMA state.")
+    latest = {r.get(f"{level}_id"): r for r in rows if r.get("timestamp") == day}
+    evaluation = _record_results(client, level, rules, (
+        (eid, latest[eid], res, bases.get(eid)) for eid, res in results.items()))
+    return evaluation
+
+
+def alert_rows(client_name: str, alert: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """add_alert_row kwargs for one alert record: one row per detected metric."""
+    return [{
+        "ts": alert["ts"],
+        "level": alert["level"].title(),
+        "entity_id": alert["entity_id"],
+        "name": alert["name"],
+        "metric": d["metric"],
+        "value": d["value"],
+        "baseline": d["baseline"],
+        "pct_change": d["pct_change"],
+        "severity": d["severity"],
+        "client": client_name,
+        "link": None,
+        "notes": alert["reasons"],
+    } for d in alert["detections"]]
+
+
+def send_alerts(client: Dict, evaluation: Dict[str, Any]):
+    """
+    Alert fan-out: every flagged entity of the run goes to Slack (one digest, or
+    one message each with SLACK_ALERT_MODE=each) and to the Notion Alerts DB (one
+    row per detected metric), all queued in one batch per channel.
+    """
+    alerts = evaluation["alerts"]
+    if not alerts:
+        return
+    name = client["client_name"]
+    level = evaluation["level"]
+    webhook = client.get("slack_webhook") or ""  # resolved at delivery, secrets stay out of the outbox
+    alerts_db = client.get("notion_alerts_db_id")
+
+    if resolve_webhook(webhook):
+        if slack_mode() == "digest":
+            enqueue("slack.digest", f"{name}|{level}|{alerts[0]['ts']}",
+                    {"webhook": webhook, "client": name, "level": level.title(), "alerts": alerts})
+            print(f"    → Slack digest queued ({len(alerts)} alerts)")
+        else:
+            enqueue_many("slack.alert", [
+                (f"{name}|{level}|{a['entity_id']}|{a['ts']}",
+                 {"webhook": webhook, "alert": {
+                     "client_name": name, "level": level.title(), "entity_id": a["entity_id"],
+                     "name": a["name"], "ts": a["ts"],
+                     "reasons": a["reasons"], "actions_list": a["actions"], "kpis": a["kpis"]}})
+                for a in alerts])
+            print(f"    → {len(alerts)} Slack alerts queued")
+
+    if alerts_db:
+        rows = [r for a in alerts for r in alert_rows(name, a)]
+        enqueue_many("notion.alert", [
+            (f"{alerts_db}|{r['entity_id']}|{r['metric']}|{r['ts']}", {"db_id": alerts_db, "row": r})
+            for r in rows])
+        print(f"    → {len(rows)} Notion alert rows queued")
+
+
+def deliver(workers: Optional[int] = None) -> Dict[str, int]:
+    """Drain the outbox now and print what happened."""
+    counts = drain(workers)
+    if counts:
+        print("[Outbox] " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    return counts
+
+
+def run_for_client(client: Dict, level: str, days: int, baseline_days: int, demo: bool = False,
+                   lookback: Optional[int] = None, full: bool = False,
+                   detector: Optional[str] = None) -> Dict[str, Any]:
+    name = client["client_name"]
+    account_id = client["ad_account_id"]
+    detector = (detector or detector_mode()).lower()
+    print(f"\n[Fatigue] Client={name} | {account_id} | level={level} | detector={detector}")
+
+    # Determine date window (latest N days)
+    since, until = fatigue_window(days)
+
+    state = None
+    if detector == "ewma":
+        # only the days the state has not seen yet (the whole window to warm up a new state)
+        state = EwmaState(name, level, default_alpha(baseline_days))
+        if full:
+            state.reset()
+        since = ewma_since(state, since)
+        rows = []
+        if since <= until:
+            n = (datetime.date.fromisoformat(until) - datetime.date.fromisoformat(since)).days + 1
+            rows = load_rows(client, level, n, since, until, demo=demo, lookback=lookback, full=full)
+        evaluation = evaluate_ewma(client, level, rows, baseline_days, state)
+    elif detector == "window":
+        # Pull raw and transform
+        rows = load_rows(client, level, days, since, until, demo=demo, lookback=lookback, full=full)
+        evaluation = evaluate_rows(client, level, rows, days, baseline_days)
+    else:
+        raise ValueError(f"unknown fatigue detector: {detector}")
+    send_alerts(client, evaluation)
+    if state is not None:
+        state.save()  # alerts are in the outbox: the day counts as evaluated
+    evaluation["delivered"] = deliver()
+
+    print(
+        f"[Summary] checked={evaluation['checked']}, flagged={evaluation['flagged']}, window={since}..{until}, baseline_days={baseline_days}"
+    )
+    return evaluation
+
+
+@dataclass
+class ClientResult:
+    """Outcome of one client's fatigue run (see run_clients)."""
+    client: str
+    ok: bool = True
+    error: Optional[str] = None
+    checked: int = 0
+    flagged: int = 0
+    seconds: float = 0.0
+    delivered: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def run_clients(clients: List[Dict], workers: int = 1, **kw) -> List[ClientResult]:
+    """
+    run_for_client for every client on a thread pool of `workers` (never two
+    clients on the same ad account at once). A failing client is recorded in its
+    ClientResult and the others keep going. Results are in input order.
+    """
+    workers = max(1, int(workers))
+    configure_graph_client(pool_size=max(10, workers))
+
+    def _one(c: Dict) -> ClientResult:
+        t0 = time.perf_counter()
+        res = ClientResult(client=c["client_name"])
+        try:
+            ev = run_for_client(c, **kw)
+            res.checked, res.flagged, res.delivered = ev["checked"], ev["flagged"], ev.get("delivered") or {}
+        except Exception as e:
+            res.ok, res.error = False, f"{type(e).__name__}: {e}"
+            print(f"[Error] {c['client_name']}: {res.error}")
+        res.seconds = round(time.perf_counter() - t0, 3)
+        return res
+
+    account = lambda c: c.get("ad_account_id") or c.get("client_name")
+    return [res for _, res, _ in run_bounded(clients, _one, workers=workers, key=account, per_key=1)]
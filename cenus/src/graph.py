@@ -0,0 +1,218 @@
+# src/graph.py
+# Shared, connection-pooled Graph API client. Every Meta caller goes through
+# get_graph_client() so TLS sessions are reused and throttling is handled once.
+import os, json, re, time, threading
+from typing import Any, Dict, Optional
+
+import requests
+
+from .http_pool import make_session, backoff_delay, retry_after_seconds, RETRY_STATUSES
+from .metrics import incr, timer
+
+# Graph error codes that mean "slow down" rather than "bad request"
+# https://developers.facebook.com/docs/graph-api/overview/rate-limiting
+THROTTLE_CODES = {4, 17, 32, 613} | set(range(80000, 80015))
+
+_ACT_RE = re.compile(r"/(act_\d+)")
+
+
+def _env_num(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _encode_params(params: Optional[dict]) -> Optional[dict]:
+    # Graph wants structured params (time_range, filtering, ...) as JSON strings
+    if not params:
+        return params
+    return {k: json.dumps(v) if isinstance(v, (dict, list)) else v for k, v in params.items()}
+
+
+def usage_pct(resp: requests.Response) -> float:
+    """
+    Highest utilisation % reported by Meta's usage headers
+    (x-business-use-case-usage, x-ad-account-usage, x-app-usage).
+    """
+    peak = 0.0
+    buc = resp.headers.get("x-business-use-case-usage")
+    if buc:
+        try:
+            for entries in json.loads(buc).values():
+                for e in entries:
+                    peak = max(peak, float(e.get("call_count") or 0),
+                               float(e.get("total_cputime") or 0),
+                               float(e.get("total_time") or 0))
+        except (ValueError, AttributeError, TypeError):
+            pass
+    acc = resp.headers.get("x-ad-account-usage")
+    if acc:
+        try:
+            peak = max(peak, float(json.loads(acc).get("acc_id_util_pct") or 0))
+        except (ValueError, AttributeError, TypeError):
+            pass
+    app = resp.headers.get("x-app-usage")
+    if app:
+        try:
+            j = json.loads(app)
+            peak = max(peak, *(float(j.get(k) or 0) for k in ("call_count", "total_cputime", "total_time")))
+        except (ValueError, AttributeError, TypeError):
+            pass
+    return peak
+
+
+def regain_access_seconds(resp: requests.Response) -> float:
+    """estimated_time_to_regain_access (minutes in the header) as seconds; 0 if none."""
+    buc = resp.headers.get("x-business-use-case-usage")
+    if not buc:
+        return 0.0
+    try:
+        minutes = max((float(e.get("estimated_time_to_regain_access") or 0)
+                       for entries in json.loads(buc).values() for e in entries), default=0.0)
+    except (ValueError, AttributeError, TypeError):
+        return 0.0
+    return minutes * 60.0
+
+
+def _graph_error_code(resp: requests.Response) -> Optional[int]:
+    try:
+        err = resp.json().get("error") or {}
+    except ValueError:
+        return None
+    if err.get("is_transient"):
+        return -1
+    code = err.get("code")
+    return int(code) if isinstance(code, (int, str)) and str(code).isdigit() else None
+
+
+class GraphClient:
+    """
+    Pooled Graph API client with timeouts, retry/backoff and usage-header pacing.
+
+    Config (env, all optional):
+      META_POOL_SIZE        keep-alive connections (default 10)
+      META_CONNECT_TIMEOUT  seconds (default 10)
+      META_READ_TIMEOUT     seconds (default 60)
+      META_MAX_RETRIES      retries per request (default 5)
+      META_BACKOFF_BASE     first backoff in seconds (default 2)
+      META_USAGE_CEILING    usage % at which we pause the account (default 90)
+      META_MAX_THROTTLE_WAIT  longest single pause in seconds (default 300)
+    """
+
+    def __init__(self, pool_size: Optional[int] = None, timeout: Optional[tuple] = None,
+                 max_retries: Optional[int] = None, backoff_base: Optional[float] = None,
+                 usage_ceiling: Optional[float] = None, max_wait: Optional[float] = None):
+        self.pool_size = int(pool_size or _env_num("META_POOL_SIZE", 10))
+        self.timeout = timeout or (_env_num("META_CONNECT_TIMEOUT", 10), _env_num("META_READ_TIMEOUT", 60))
+        self.max_retries = int(max_retries if max_retries is not None else _env_num("META_MAX_RETRIES", 5))
+        self.backoff_base = backoff_base if backoff_base is not None else _env_num("META_BACKOFF_BASE", 2.0)
+        self.usage_ceiling = usage_ceiling if usage_ceiling is not None else _env_num("META_USAGE_CEILING", 90)
+        self.max_wait = max_wait if max_wait is not None else _env_num("META_MAX_THROTTLE_WAIT", 300)
+        self.session = make_session(self.pool_size)
+        self._lock = threading.Lock()
+        self._paused_until: Dict[str, float] = {}  # act_id -> monotonic deadline
+
+    # --- pacing ---
+    def _wait_if_paused(self, key: str):
+        with self._lock:
+            until = self._paused_until.get(key, 0.0)
+        delay = until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _pause(self, key: str, seconds: float):
+        seconds = min(self.max_wait, max(0.0, seconds))
+        if not seconds:
+            return
+        with self._lock:
+            deadline = time.monotonic() + seconds
+            if deadline > self._paused_until.get(key, 0.0):
+                self._paused_until[key] = deadline
+        print(f"[Graph] throttle: pausing {key or 'app'} for {seconds:.0f}s")
+
+    def _pace(self, key: str, resp: requests.Response):
+        if usage_pct(resp) >= self.usage_ceiling:
+            self._pause(key, regain_access_seconds(resp) or backoff_delay(0, self.backoff_base * 5, self.max_wait))
+
+    # --- transport ---
+    def request(self, method: str, url: str, params: Optional[dict] = None,
+                retry_errors: bool = True) -> requests.Response:
+        """
+        Send a request, retrying throttles/5xx/connection errors. Returns the final
+        response (which may still be an error status); raises only if every attempt
+        failed at the connection level. With retry_errors=False only throttles are
+        retried (the call was refused, not run): for a non-idempotent POST a 5xx or
+        a dropped connection may still have done the work, so it is not resent.
+        """
+        m = _ACT_RE.search(url)
+        key = m.group(1) if m else ""
+        params = _encode_params(params)
+        attempt = 0
+        while True:
+            self._wait_if_paused(key)
+            incr("graph.http_calls")
+            try:
+                with timer("graph.request"):
+                    resp = self.session.request(method, url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                incr("graph.connection_errors")
+                if not retry_errors or attempt >= self.max_retries:
+                    raise
+                incr("graph.retries")
+                delay = backoff_delay(attempt, self.backoff_base, self.max_wait)
+                print(f"[Graph] {type(e).__name__} on {method} {url.split('?')[0]}; retry in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self._pace(key, resp)
+            code = _graph_error_code(resp) if resp.status_code >= 400 else None
+            throttled = resp.status_code == 429 or code in THROTTLE_CODES
+            retryable = throttled or (retry_errors and (resp.status_code in RETRY_STATUSES or code == -1))
+            if throttled:
+                incr("graph.throttled")
+            if not retryable or attempt >= self.max_retries:
+                return resp
+
+            incr("graph.retries")
+            delay = retry_after_seconds(resp) or (regain_access_seconds(resp) if throttled else 0.0) \
+                or backoff_delay(attempt, self.backoff_base, self.max_wait)
+            if throttled:
+                self._pause(key, delay)
+            else:
+                print(f"[Graph] HTTP {resp.status_code} on {method} {url.split('?')[0]}; retry in {delay:.1f}s")
+                time.sleep(delay)
+            attempt += 1
+
+    def get(self, url: str, params: Optional[dict] = None) -> Dict[str, Any]:
+        resp = self.request("GET", url, params)
+        resp.raise_for_status()
+        return resp.json()
+
+    def post(self, url: str, params: Optional[dict] = None, retry_errors: bool = True) -> Dict[str, Any]:
+        resp = self.request("POST", url, params, retry_errors)
+        resp.raise_for_status()
+        return resp.json()
+
+
+_client: Optional[GraphClient] = None
+_client_lock = threading.Lock()
+
+
+def get_graph_client() -> GraphClient:
+    """Process-wide shared client (created lazily, thread-safe)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GraphClient()
+    return _client
+
+
+def configure_graph_client(**kwargs) -> GraphClient:
+    """Replace the shared client, e.g. to size the pool for N parallel pulls."""
+    global _client
+    with _client_lock:
+        _client = GraphClient(**kwargs)
+    return _client
@@ -0,0 +1,270 @@
+# src/history.py
+# Local KPI history, partitioned by client / level / date.
+#
+#   <DATA_DIR>/<Client_Name>/history/<level>/entities.json   {"ids": [...], "names": {...}}
+#   <DATA_DIR>/<Client_Name>/history/<level>/<YYYY-MM-DD>.f64
+#
+# Each day file is a flat float64 array of shape (n_slots, len(HISTORY_KPIS)):
+# row i belongs to entities.json["ids"][i], NaN means "no value". Slots are
+# append-only, so an entity's row sits at the same offset in every day file and
+# reading N days of one entity is N small seek + reads, no text parsing.
+import os, math, threading, datetime
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from .storage import DATA_DIR, write_json_atomic, read_json
+
+HISTORY_KPIS = [
+    "kpis_ctr", "kpis_roas", "kpis_cpm", "kpis_cpc", "kpis_frequency",
+    "kpis_impressions", "kpis_spend", "kpis_clicks", "kpis_results",
+]
+NCOLS = len(HISTORY_KPIS)
+_ROW_BYTES = NCOLS * 8
+_NAN = float("nan")
+
+_dir_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+_dir_locks_guard = threading.Lock()
+
+
+def _dir_lock(path: str) -> threading.Lock:
+    with _dir_locks_guard:
+        return _dir_locks[path]
+
+
+def client_key(client_name: str) -> str:
+    """Folder name used for a client under DATA_DIR (same as pull_kpis)."""
+    return client_name.replace(" ", "_")
+
+
+def _days(since: str, until: str) -> List[str]:
+    d0 = datetime.date.fromisoformat(since)
+    d1 = datetime.date.fromisoformat(until)
+    return [(d0 + datetime.timedelta(days=i)).strftime("%Y-%m-%d") for i in range((d1 - d0).days + 1)]
+
+
+def _num(v) -> float:
+    try:
+        return float(v) if v is not None else _NAN
+    except (TypeError, ValueError):
+        return _NAN
+
+
+class HistoryStore:
+    """KPI history for one client. See module comment for the on-disk layout."""
+
+    def __init__(self, client: str, root: Optional[str] = None):
+        self.client = client_key(client)
+        self.root = root or os.path.join(DATA_DIR, self.client, "history")
+        self._entities: Dict[str, Dict[str, Any]] = {}  # level -> {"ids", "names", "slot"}
+
+    # --- entity dictionary ---
+    def _level_dir(self, level: str) -> str:
+        return os.path.join(self.root, level)
+
+    def _day_path(self, level: str, day: str) -> str:
+        return os.path.join(self._level_dir(level), f"{day}.f64")
+
+    def _load_entities(self, level: str, reload: bool = False) -> Dict[str, Any]:
+        if reload or level not in self._entities:
+            data = read_json(os.path.join(self._level_dir(level), "entities.json"), {}) or {}
+            ids = data.get("ids", [])
+            self._entities[level] = {
+                "ids": ids,
+                "names": data.get("names", {}),
+                "slot": {eid: i for i, eid in enumerate(ids)},
+            }
+        return self._entities[level]
+
+    def entity_ids(self, level: str) -> List[str]:
+        return list(self._load_entities(level)["ids"])
+
+    def entity_name(self, level: str, entity_id: str) -> Optional[str]:
+        return self._load_entities(level)["names"].get(entity_id)
+
+    # --- writes ---
+    def has(self, level: str, day: str) -> bool:
+        return os.path.exists(self._day_path(level, day))
+
+    def write_day(self, level: str, day: str, rows: Iterable[Dict[str, Any]]):
+        """Replace one day partition with `rows` (fatigue rows: <level>_id, name, kpis_*)."""
+        self.write_days(level, [day], {day: list(rows)})
+
+    def write_days(self, level: str, days: List[str], rows_by_day: Dict[str, List[Dict[str, Any]]]):
+        """Write several day partitions; days with no rows are written empty (= synced, no data)."""
+        id_key = f"{level}_id"
+        ldir = self._level_dir(level)
+        os.makedirs(ldir, exist_ok=True)
+        with _dir_lock(os.path.abspath(ldir)):
+            ent = self._load_entities(level, reload=True)
+            ids, names, slot = ent["ids"], ent["names"], ent["slot"]
+            grew = False
+            for day in days:
+                for r in rows_by_day.get(day, []):
+                    eid = r.get(id_key)
+                    if not eid:
+                        continue
+                    if eid not in slot:
+                        slot[eid] = len(ids)
+                        ids.append(eid)
+                        grew = True
+                    if r.get("name") and names.get(eid) != r["name"]:
+                        names[eid] = r["name"]
+                        grew = True
+            if grew:
+                write_json_atomic({"ids": ids, "names": names}, os.path.join(ldir, "entities.json"))
+
+            for day in days:
+                buf = array("d", [_NAN]) * (len(ids) * NCOLS)
+                for r in rows_by_day.get(day, []):
+                    eid = r.get(id_key)
+                    if not eid:
+                        continue
+                    base = slot[eid] * NCOLS
+                    for j, k in enumerate(HISTORY_KPIS):
+                        buf[base + j] = _num(r.get(k))
+                path = self._day_path(level, day)
+                with open(path + ".tmp", "wb") as f:
+                    buf.tofile(f)
+                os.replace(path + ".tmp", path)
+
+    def ingest(self, level: str, since: str, until: str) -> "_Ingest":
+        """
+        Context manager: add() rows as they stream in. Each day is written once
+        the stream moves past it; days of since..until that got no rows are
+        written empty on exit.
+        """
+        return _Ingest(self, level, since, until)
+
+    def remove_day(self, level: str, day: str):
+        try:
+            os.remove(self._day_path(level, day))
+        except FileNotFoundError:
+            pass
+
+    # --- reads ---
+    def read_day(self, level: str, day: str) -> Optional[array]:
+        """The day's float64 matrix as a flat array (a copy; no file stays open), or None."""
+        out = array("d")
+        try:
+            with open(self._day_path(level, day), "rb") as f:
+                out.frombytes(f.read())
+        except FileNotFoundError:
+            return None
+        return out
+
+    def read_slot(self, level: str, day: str, slot: int) -> Optional[List[float]]:
+        """One entity's row of a day file (a single seek + read), or None."""
+        try:
+            with open(self._day_path(level, day), "rb") as f:
+                f.seek(slot * _ROW_BYTES)
+                raw = f.read(_ROW_BYTES)
+        except FileNotFoundError:
+            return None
+        if len(raw) < _ROW_BYTES:
+            return None  # entity first seen after this day was written
+        vals = array("d", raw).tolist()
+        return None if all(math.isnan(v) for v in vals) else vals
+
+    def _row(self, day: array, slot: int) -> Optional[List[float]]:
+        start = slot * NCOLS
+        if start + NCOLS > len(day):
+            return None  # entity first seen after this day was written
+        vals = day[start:start + NCOLS].tolist()
+        return None if all(math.isnan(v) for v in vals) else vals
+
+    def _to_row(self, level: str, day: str, eid: str, vals: List[float]) -> Dict[str, Any]:
+        row = {
+            "timestamp": day,
+            "level": level,
+            "name": self._load_entities(level)["names"].get(eid),
+            f"{level}_id": eid,
+        }
+        for k, v in zip(HISTORY_KPIS, vals):
+            row[k] = None if math.isnan(v) else v
+        return row
+
+    def load_entity(self, level: str, entity_id: str, last_n: int, until: str) -> List[Dict[str, Any]]:
+        """Rows for one entity over the last_n days ending at `until` (oldest first)."""
+        slot = self._load_entities(level)["slot"].get(entity_id)
+        if slot is None:
+            return []
+        end = datetime.date.fromisoformat(until)
+        since = (end - datetime.timedelta(days=last_n - 1)).strftime("%Y-%m-%d")
+        out = []
+        for day in _days(since, until):
+            vals = self.read_slot(level, day, slot)
+            if vals is not None:
+                out.append(self._to_row(level, day, entity_id, vals))
+        return out
+
+    def read_range(self, level: str, since: str, until: str) -> List[Dict[str, Any]]:
+        """Every stored row for since..until, ordered by day then slot."""
+        ids = self._load_entities(level, reload=True)["ids"]
+        out = []
+        for day in _days(since, until):
+            data = self.read_day(level, day)
+            if data is None:
+                continue
+            for slot in range(min(len(ids), len(data) // NCOLS)):
+                vals = self._row(data, slot)
+                if vals is not None:
+                    out.append(self._to_row(level, day, ids[slot], vals))
+        return out
+
+
+class _Ingest:
+    """
+    Streams rows into day partitions holding at most one day in memory: rows
+    arrive day-ordered (time_increment=1), so a day is complete, and written,
+    as soon as a row of another day shows up. A day that shows up again later is
+    merged with what was already written. If the block raises, the days written
+    so far are removed (they may be partial) so the next sync fetches them again.
+    """
+
+    def __init__(self, store: HistoryStore, level: str, since: str, until: str):
+        self.store, self.level = store, level
+        self.days = _days(since, until)
+        self._in_range = set(self.days)
+        self.written: List[str] = []
+        self.day: Optional[str] = None
+        self.rows: List[Dict[str, Any]] = []
+
+    def add(self, row: Dict[str, Any]):
+        day = row.get("timestamp")
+        if day not in self._in_range:
+            return
+        if day != self.day:
+            self._flush()
+            self.day = day
+        # keep only what the store persists
+        keep = {k: row.get(k) for k in HISTORY_KPIS}
+        keep[f"{self.level}_id"] = row.get(f"{self.level}_id")
+        keep["name"] = row.get("name")
+        self.rows.append(keep)
+
+    def _flush(self):
+        if self.day is None:
+            return
+        rows = self.rows
+        if self.day in self.written:  # out-of-order stream: keep what this ingest already wrote
+            rows = self.store.read_range(self.level, self.day, self.day) + rows
+        else:
+            self.written.append(self.day)
+        self.store.write_day(self.level, self.day, rows)
+        self.day, self.rows = None, []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._flush()
+            done = set(self.written)
+            empty = [d for d in self.days if d not in done]
+            if empty:
+                self.store.write_days(self.level, empty, {})
+        else:
+            for day in self.written:
+                self.store.remove_day(self.level, day)
+        return False
@@ -0,0 +1,65 @@
+# src/http_pool.py
+import random
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+
+# statuses worth another attempt on any of our upstreams (Graph, Notion, Slack)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def make_session(pool_size: int = 10, headers: Optional[dict] = None) -> requests.Session:
+    """
+    requests.Session with a keep-alive pool sized for `pool_size` concurrent callers.
+    Retries are handled by the callers (they need the response to decide), so the
+    adapter itself never retries.
+    """
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    if headers:
+        s.headers.update(headers)
+    return s
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with jitter: attempt 0 -> ~base, 1 -> ~2*base, ..."""
+    delay = min(cap, base * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def retry_after_seconds(resp: requests.Response) -> Optional[float]:
+    """Parse a Retry-After header (seconds or HTTP date). None if absent/garbage."""
+    raw = (resp.headers.get("Retry-After") or "").strip()
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(raw)
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def never_sent(exc: Exception) -> bool:
+    """
+    True if a requests exception happened before the request reached the server
+    (connect timeout, refused / unresolvable host), so resending cannot duplicate
+    it. Read timeouts and connections dropped mid-exchange are ambiguous: False.
+    """
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.Timeout) or not isinstance(exc, requests.ConnectionError):
+        return False
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
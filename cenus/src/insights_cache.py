@@ -0,0 +1,130 @@
+# src/insights_cache.py
+# Read-through cache of raw daily insights rows keyed by (account, level, date),
+# so one process (e.g. the daily pipeline: pull, then fatigue over 14 days) never
+# asks Meta for the same account-day twice. Entries expire after a TTL and the
+# least recently used days are evicted past a size cap.
+#   INSIGHTS_CACHE_TTL        seconds an account-day stays fresh (default 3600, 0 = off)
+#   INSIGHTS_CACHE_MAX_DAYS   entries kept (default 5000)
+#   INSIGHTS_CACHE_MAX_ROWS   a fetched gap bigger than this is streamed but not kept (default 50000)
+import os, time, datetime, threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .metrics import incr
+
+Key = Tuple[str, str, str]
+RowFetch = Callable[[str, str], Iterator[Dict[str, Any]]]  # (since, until) -> raw rows
+
+
+def _days(since: str, until: str) -> List[str]:
+    d0 = datetime.date.fromisoformat(since)
+    n = (datetime.date.fromisoformat(until) - d0).days + 1
+    return [(d0 + datetime.timedelta(days=i)).strftime("%Y-%m-%d") for i in range(n)]
+
+
+class InsightsCache:
+    """
+    (account, level, date) -> raw rows of that day. Rows are shared between
+    readers and must be treated as read-only.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_days: Optional[int] = None,
+                 max_rows: Optional[int] = None):
+        self.ttl = float(os.getenv("INSIGHTS_CACHE_TTL", "3600") if ttl is None else ttl)
+        self.max_days = int(os.getenv("INSIGHTS_CACHE_MAX_DAYS", "5000") if max_days is None else max_days)
+        self.max_rows = int(os.getenv("INSIGHTS_CACHE_MAX_ROWS", "50000") if max_rows is None else max_rows)
+        self._days: "OrderedDict[Key, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_days > 0
+
+    def get(self, key: Key) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._days.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self._days[key]
+                return None
+            self._days.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Key, rows: List[Dict[str, Any]]):
+        with self._lock:
+            self._days[key] = (time.monotonic(), rows)
+            self._days.move_to_end(key)
+            while len(self._days) > self.max_days:
+                self._days.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._days.clear()
+
+    def read_through(self, account_id: str, level: str, since: str, until: str,
+                     fetch: RowFetch) -> Iterator[Dict[str, Any]]:
+        """
+        Rows for since..until, day ranges in order. Cached days are served from memory;
+        each run of consecutive missing days is one fetch(since, until), streamed
+        through and stored once it has been read to the end -- unless it exceeds
+        max_rows, in which case its buffer is dropped and nothing is stored, so
+        large pulls keep flat memory.
+        """
+        if not self.enabled:
+            yield from fetch(since, until)
+            return
+
+        days = _days(since, until)
+        cached = {d: self.get((account_id, level, d)) for d in days}
+        with self._lock:
+            hit = sum(v is not None for v in cached.values())
+            self.hits += hit
+            self.misses += len(days) - hit
+        incr("insights_cache.hits", hit)
+        incr("insights_cache.misses", len(days) - hit)
+
+        i = 0
+        while i < len(days):
+            if cached[days[i]] is not None:
+                yield from cached[days[i]]
+                i += 1
+                continue
+            j = i
+            while j + 1 < len(days) and cached[days[j + 1]] is None:
+                j += 1
+            gap = days[i:j + 1]
+            by_day: Optional[Dict[str, List[Dict[str, Any]]]] = {d: [] for d in gap}
+            n = 0
+            for r in fetch(gap[0], gap[-1]):
+                if by_day is not None:
+                    n += 1
+                    if n > self.max_rows:
+                        by_day = None
+                        incr("insights_cache.oversized")
+                    else:
+                        by_day.setdefault(r.get("date_start"), []).append(r)
+                yield r
+            # every day of the range is stored, empty ones too (nothing ran that day)
+            for d in gap if by_day is not None else ():
+                self.put((account_id, level, d), by_day[d])
+            i = j + 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "days": len(self._days)}
+
+
+_cache: Optional[InsightsCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_insights_cache() -> InsightsCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = InsightsCache()
+    return _cache
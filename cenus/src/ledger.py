@@ -0,0 +1,111 @@
+# src/ledger.py
+# Content-hash ledger of successful outgoing writes (Notion pages, alert rows,
+# Slack messages). A rerun that would send the exact same payload for the same
+# key is skipped, so retries after a partial failure only cost the delta.
+# A row can also carry the id of what it wrote (`ref`, the Notion page id), stored
+# in the same statement as the hash so the two never disagree (src/page_index.py).
+#   <DATA_DIR>/_state/ledger.sqlite
+import os, json, hashlib, sqlite3, threading
+from typing import Any, Dict, Optional, Tuple
+
+from .storage import state_path, ts_now_iso
+
+
+def payload_hash(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+                          .encode("utf-8")).hexdigest()
+
+
+def secret_tag(secret: str) -> str:
+    """Short stable tag for a webhook URL / token so the secret itself is never stored."""
+    return hashlib.sha256((secret or "").encode("utf-8")).hexdigest()[:12]
+
+
+class DeliveryLedger:
+    """
+    (channel, key) -> hash of the last payload delivered successfully.
+    Set CENUS_LEDGER=off to disable skipping (everything is resent, still recorded).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or state_path("ledger.sqlite")
+        self.enabled = os.getenv("CENUS_LEDGER", "on").lower() not in ("off", "0", "false")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS deliveries ("
+            " channel TEXT NOT NULL, key TEXT NOT NULL, hash TEXT NOT NULL, delivered_at TEXT NOT NULL,"
+            " PRIMARY KEY (channel, key))")
+        if "ref" not in [c[1] for c in self._db.execute("PRAGMA table_info(deliveries)")]:
+            self._db.execute("ALTER TABLE deliveries ADD COLUMN ref TEXT")
+        # channels whose refs were imported from the remote side (PageIndex.rebuild)
+        self._db.execute("CREATE TABLE IF NOT EXISTS indexed (channel TEXT PRIMARY KEY, indexed_at TEXT NOT NULL)")
+        self._db.commit()
+
+    def entry(self, channel: str, key: str) -> Optional[Tuple[str, Optional[str]]]:
+        """(hash, ref) of a key, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT hash, ref FROM deliveries WHERE channel=? AND key=?",
+                                   (channel, key)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def last_hash(self, channel: str, key: str) -> Optional[str]:
+        e = self.entry(channel, key)
+        return e[0] if e else None
+
+    def is_delivered(self, channel: str, key: str, digest: str) -> bool:
+        return self.enabled and self.last_hash(channel, key) == digest
+
+    def record(self, channel: str, key: str, digest: str, ref: Optional[str] = None):
+        """Store the delivered hash (and `ref`, if given; an existing ref is kept otherwise)."""
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO deliveries (channel, key, hash, delivered_at, ref) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(channel, key) DO UPDATE SET hash=excluded.hash, delivered_at=excluded.delivered_at,"
+                " ref=COALESCE(excluded.ref, deliveries.ref)",
+                (channel, key, digest, ts_now_iso(), ref))
+            self._db.commit()
+
+    def drop_ref(self, channel: str, key: str):
+        """The remote object is gone: forget its ref and hash, so the next write recreates it."""
+        with self._lock:
+            self._db.execute("UPDATE deliveries SET ref=NULL, hash='' WHERE channel=? AND key=?", (channel, key))
+            self._db.commit()
+
+    def is_indexed(self, channel: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM indexed WHERE channel=?", (channel,)).fetchone() is not None
+
+    def import_refs(self, channel: str, refs: Dict[str, str]):
+        """
+        Refs found on the remote side, in one transaction; marks the channel indexed.
+        A key whose ref changes loses its hash (its content is unknown).
+        """
+        now = ts_now_iso()
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO deliveries (channel, key, hash, delivered_at, ref) VALUES (?, ?, '', ?, ?)"
+                " ON CONFLICT(channel, key) DO UPDATE SET ref=excluded.ref,"
+                " hash=CASE WHEN deliveries.ref IS excluded.ref THEN deliveries.hash ELSE '' END",
+                [(channel, k, now, ref) for k, ref in refs.items()])
+            self._db.execute("INSERT OR REPLACE INTO indexed (channel, indexed_at) VALUES (?, ?)", (channel, now))
+
+    def forget(self, channel: str, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM deliveries WHERE channel=? AND key=?", (channel, key))
+            self._db.commit()
+
+
+_ledger: Optional[DeliveryLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> DeliveryLedger:
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = DeliveryLedger()
+    return _ledger
@@ -1,23 +1,41 @@
-import os
-import requests
-from typing import List, Dict, Any
+import os, time, datetime
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 
-# --- helper to call Graph API ---
+from .graph import get_graph_client
+from .insights_cache import get_insights_cache
+from .metrics import incr, observe, timer
+
+# --- helper to call Graph API (pooled session, timeouts, retry/backoff) ---
 def _get(url: str, params: dict) -> dict:
-    resp = requests.get(url, params=params)
-    resp.raise_for_status()
-    return resp.json()
+    return get_graph_client().get(url, params)
 
 # --- fetch insights ---
-def fetch_insights_for_account(ad_account_id: str, level: str, since: str, until: str) -> List[Dict[str, Any]]:
-    token = os.getenv("FB_ACCESS_TOKEN")  # read from .env
+INSIGHTS_FIELDS = [
+    "impressions", "spend", "clicks", "cpc", "cpm", "ctr", "frequency",
+    "actions", "action_values", "reach", "results", "roas"
+]
 
-    fields = [
-        "impressions", "spend", "clicks", "cpc", "cpm", "ctr", "frequency",
-        "actions", "action_values", "reach", "results", "roas"
-    ]
-    params = {
-        "access_token": token,
+LEVELS = ("campaign", "adset", "ad")
+# ids/names requested with each level: the entity itself plus its parents, so
+# ad rows can be rolled up to adset / campaign locally (src/rollup.py)
+PARENT_LEVELS = {"ad": ("ad", "adset", "campaign"), "adset": ("adset", "campaign"), "campaign": ("campaign",)}
+
+# async report run statuses (AdReportRun.async_status)
+_ASYNC_DONE = "Job Completed"
+_ASYNC_FAILED = {"Job Failed", "Job Skipped"}
+
+
+def _graph_base() -> str:
+    # META_GRAPH_BASE points the client elsewhere, e.g. the local stand-in (src/standin.py)
+    host = os.getenv("META_GRAPH_BASE", "https://graph.facebook.com").rstrip("/")
+    return f"{host}/{os.getenv('META_API_VERSION','v18.0')}"
+
+
+def _insights_params(level: str, since: str, until: str) -> Dict[str, Any]:
+    # entity (and parent) id/name must be requested explicitly or Graph leaves them out
+    fields = INSIGHTS_FIELDS + [f"{l}_{k}" for l in PARENT_LEVELS.get(level, ()) for k in ("id", "name")]
+    return {
+        "access_token": os.getenv("FB_ACCESS_TOKEN"),  # read from .env
         "level": level,
         "time_increment": 1,
         "time_range": {"since": since, "until": until},
@@ -25,51 +43,224 @@ def fetch_insights_for_account(ad_account_id: str, level: str, since: str, until
         "limit": 500,
     }
 
-    url = f"https://graph.facebook.com/{os.getenv('META_API_VERSION','v18.0')}/{ad_account_id}/insights"
-    out: List[Dict[str, Any]] = []
 
+def _iter_pages(url: str, params: dict) -> Iterator[List[Dict[str, Any]]]:
+    """Follow Graph cursor paging, yielding each page's `data` list."""
     while True:
-        data = _get(url, params)
-        out.extend(data.get("data", []))
-        paging = data.get("paging", {})
-        next_url = paging.get("next")
+        with timer("meta.page"):
+            data = _get(url, params)
+        page = data.get("data", [])
+        incr("meta.pages")
+        incr("meta.rows", len(page))
+        observe("meta.page_rows", len(page))
+        yield page
+        next_url = data.get("paging", {}).get("next")
         if not next_url:
             break
         url = next_url
         params = {}  # token already baked into next_url
 
-    return out
+
+def _span_days(since: str, until: str) -> int:
+    d0 = datetime.date.fromisoformat(since)
+    d1 = datetime.date.fromisoformat(until)
+    return (d1 - d0).days + 1
+
+
+def _resolve_mode(mode: Optional[str], level: str, since: str, until: str) -> str:
+    """
+    sync | async | auto. auto uses async report runs for ad-level pulls spanning
+    META_ASYNC_MIN_DAYS (default 14) or more days.
+    """
+    mode = (mode or os.getenv("META_INSIGHTS_MODE") or "sync").lower()
+    if mode == "auto":
+        min_days = int(os.getenv("META_ASYNC_MIN_DAYS", "14"))
+        return "async" if level == "ad" and _span_days(since, until) >= min_days else "sync"
+    if mode not in ("sync", "async"):
+        raise ValueError(f"Unknown insights mode: {mode}")
+    return mode
+
+
+def submit_insights_report(ad_account_id: str, level: str, since: str, until: str) -> str:
+    """
+    Start an async insights report run; returns its report_run_id. Only throttles
+    are retried: after a timeout or 5xx the run may already exist, and submitting
+    again would queue a second one against the account's quota.
+    """
+    params = _insights_params(level, since, until)
+    params.pop("limit")
+    resp = get_graph_client().post(f"{_graph_base()}/{ad_account_id}/insights", params, retry_errors=False)
+    run_id = resp.get("report_run_id")
+    if not run_id:
+        raise RuntimeError(f"Async insights submit returned no report_run_id: {resp}")
+    return run_id
+
+
+def wait_for_report(report_run_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Poll a report run until it completes, backing off 2s -> 30s between polls.
+    Raises RuntimeError if it fails or exceeds `timeout` (META_ASYNC_TIMEOUT, default 1800s).
+    """
+    timeout = timeout if timeout is not None else float(os.getenv("META_ASYNC_TIMEOUT", "1800"))
+    deadline = time.monotonic() + timeout
+    delay = 2.0
+    params = {
+        "access_token": os.getenv("FB_ACCESS_TOKEN"),
+        "fields": "async_status,async_percent_completion",
+    }
+    while True:
+        job = _get(f"{_graph_base()}/{report_run_id}", params)
+        status = job.get("async_status")
+        if status == _ASYNC_DONE:
+            return job
+        if status in _ASYNC_FAILED:
+            raise RuntimeError(f"Async insights report {report_run_id} ended with status '{status}'")
+        if time.monotonic() + delay > deadline:
+            raise RuntimeError(f"Async insights report {report_run_id} still '{status}' after {timeout:.0f}s")
+        time.sleep(delay)
+        delay = min(30.0, delay * 1.5)
+
+
+def iter_async_insights_pages(ad_account_id: str, level: str, since: str, until: str) -> Iterator[List[Dict[str, Any]]]:
+    """Submit a report run, wait for it, then stream its result pages."""
+    run_id = submit_insights_report(ad_account_id, level, since, until)
+    print(f"[Meta] async report {run_id} submitted for {ad_account_id} level={level} {since}..{until}")
+    with timer("meta.async_wait"):
+        wait_for_report(run_id)
+    params = {"access_token": os.getenv("FB_ACCESS_TOKEN"), "limit": 500}
+    yield from _iter_pages(f"{_graph_base()}/{run_id}/insights", params)
+
+
+def _iter_graph_rows(ad_account_id: str, level: str, since: str, until: str,
+                     mode: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    if _resolve_mode(mode, level, since, until) == "async":
+        pages = iter_async_insights_pages(ad_account_id, level, since, until)
+    else:
+        pages = _iter_pages(f"{_graph_base()}/{ad_account_id}/insights", _insights_params(level, since, until))
+    for page in pages:
+        yield from page
+
+
+def iter_insights_rows(ad_account_id: str, level: str, since: str, until: str,
+                       mode: Optional[str] = None, cache: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Stream daily insights rows one page at a time (nothing accumulates here).
+    mode: "sync" (the /insights endpoint), "async" (report runs) or "auto"; defaults to
+    META_INSIGHTS_MODE or "sync".
+    With `cache` (for callers that re-read the same small ranges, like the daily
+    pipeline), account-days already fetched by this process (within
+    INSIGHTS_CACHE_TTL) are served from src/insights_cache.py and only the
+    missing days go to Meta; fetched days are buffered to be stored, up to
+    INSIGHTS_CACHE_MAX_ROWS. Rows are shared with the cache: do not mutate them.
+    """
+    if not cache:
+        yield from _iter_graph_rows(ad_account_id, level, since, until, mode)
+        return
+    yield from get_insights_cache().read_through(
+        ad_account_id, level, since, until,
+        lambda s, u: _iter_graph_rows(ad_account_id, level, s, u, mode))
+
+
+def iter_reach_rows(ad_account_id: str, level: str, since: str, until: str) -> Iterator[Dict[str, Any]]:
+    """
+    Meta's deduplicated reach / frequency per (day, entity) at `level`: a
+    fields-limited pull (entity id + two metrics) for rolled-up levels, whose
+    reach cannot be derived from their children's (see RollUp.add_reach).
+    """
+    params = _insights_params(level, since, until)
+    params["fields"] = ",".join([f"{level}_id", "reach", "frequency"])
+    for page in _iter_pages(f"{_graph_base()}/{ad_account_id}/insights", params):
+        yield from page
+
+
+def fetch_insights_for_account(ad_account_id: str, level: str, since: str, until: str,
+                               mode: Optional[str] = None, cache: bool = False) -> List[Dict[str, Any]]:
+    """List form of iter_insights_rows() for callers that need every row at once (cache: opt-in, as there)."""
+    return list(iter_insights_rows(ad_account_id, level, since, until, mode, cache))
 
 # --- transform to KPIs ---
+# Declared output schema of iter_kpis(); writers use it instead of scanning records.
+KPI_FIELDS = [
+    "id", "level", "name", "date", "impressions", "spend", "ctr", "cpm", "cpc", "frequency",
+    "clicks", "actions", "results", "roas",
+]
+
+
+def _normalize_number(v):
+    try:
+        return float(v)
+    except Exception:
+        return 0.0
+
+
+def iter_kpis(rows: Iterable[Dict[str, Any]], level: str) -> Iterator[Dict[str, Any]]:
+    """Transform raw insights rows into KPI records lazily (see KPI_FIELDS)."""
+    id_key, name_key = f"{level}_id", f"{level}_name"
+    n, spent = 0, 0.0  # transform time only, not the consumer's
+    try:
+        for r in rows:
+            t0 = time.perf_counter()
+            rec = {
+                "id": r.get(id_key),
+                "level": level,  # part of the Notion page key (entity_id, level, date)
+                "name": r.get(name_key),
+                "date": r.get("date_start"),
+                "impressions": _normalize_number(r.get("impressions")),
+                "spend": _normalize_number(r.get("spend")),
+                "ctr": _normalize_number(r.get("ctr")),
+                "cpm": _normalize_number(r.get("cpm")),
+                "cpc": _normalize_number(r.get("cpc")),
+                "frequency": _normalize_number(r.get("frequency")),
+                "clicks": _normalize_number(r.get("clicks")),
+                "actions": r.get("actions", []),
+                "results": r.get("results"),
+                "roas": r.get("roas"),
+            }
+            n += 1
+            spent += time.perf_counter() - t0
+            yield rec
+    finally:
+        incr("transform.kpi_rows", n)
+        observe("transform.iter_kpis", spent)
+
+
 def transform_rows_to_kpis(rows: List[Dict[str, Any]], level: str) -> List[Dict[str, Any]]:
-    def _normalize_number(v):
-        try:
-            return float(v)
-        except Exception:
-            return 0.0
-
-    out = []
-    for r in rows:
-        impressions = _normalize_number(r.get("impressions"))
-        spend = _normalize_number(r.get("spend"))
-        ctr = _normalize_number(r.get("ctr"))
-        cpm = _normalize_number(r.get("cpm"))
-        cpc = _normalize_number(r.get("cpc"))
-        freq = _normalize_number(r.get("frequency"))
-        clicks = _normalize_number(r.get("clicks"))
-
-        out.append({
-            "id": r.get(f"{level}_id"),
-            "name": r.get(f"{level}_name"),
-            "impressions": impressions,
-            "spend": spend,
-            "ctr": ctr,
-            "cpm": cpm,
-            "cpc": cpc,
-            "frequency": freq,
-            "clicks": clicks,
-            "actions": r.get("actions", []),
-            "results": r.get("results"),
-            "roas": r.get("roas"),
-        })
-    return out
+    return list(iter_kpis(rows, level))
+
+
+# --- fatigue rows (the shape run_fatigue / fatigue.py work on) ---
+def _metric_value(v) -> Optional[float]:
+    """Graph returns some metrics as numbers and some as [{"value": ...}] / [{"values": [...]}]."""
+    if isinstance(v, list):
+        total, seen = 0.0, False
+        for item in v:
+            if isinstance(item, dict):
+                inner = item.get("values")
+                x = _metric_value(inner) if inner is not None else _metric_value(item.get("value"))
+                if x is not None:
+                    total += x
+                    seen = True
+        return total if seen else None
+    try:
+        return float(v) if v is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def to_fatigue_row(r: Dict[str, Any], level: str) -> Dict[str, Any]:
+    """One raw daily insights row -> flat kpis_* record keyed by timestamp and entity id."""
+    return {
+        "timestamp": r.get("date_start"),
+        "level": level,
+        "name": r.get(f"{level}_name"),
+        f"{level}_id": r.get(f"{level}_id"),
+        "kpis_ctr": _metric_value(r.get("ctr")),
+        "kpis_roas": _metric_value(r.get("roas")),
+        "kpis_cpm": _metric_value(r.get("cpm")),
+        "kpis_cpc": _metric_value(r.get("cpc")),
+        "kpis_frequency": _metric_value(r.get("frequency")),
+        "kpis_impressions": _metric_value(r.get("impressions")),
+        "kpis_spend": _metric_value(r.get("spend")),
+        "kpis_clicks": _metric_value(r.get("clicks")),
+        "kpis_results": _metric_value(r.get("results")),
+    }
@@ -0,0 +1,134 @@
+# src/metrics.py
+# Lightweight in-process instrumentation: counters, timers and histograms,
+# shared by every thread, dumped as one JSON run report.
+#   with timer("notion.request"): ...      # seconds into histogram "notion.request"
+#   incr("graph.retries")                  # counter
+#   observe("meta.page_rows", len(page))   # histogram of any value
+# Histograms keep count/sum/min/max exactly plus a bounded reservoir sample for
+# percentiles, so memory stays flat however long the run is.
+import time, random, threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from .storage import write_json_atomic, ts_now_iso
+
+_RESERVOIR = 2048
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self._sample: List[float] = []
+
+    def add(self, v: float):
+        self.count += 1
+        self.total += v
+        self.min = min(self.min, v)
+        self.max = max(self.max, v)
+        if len(self._sample) < _RESERVOIR:
+            self._sample.append(v)
+        else:
+            j = random.randrange(self.count)
+            if j < _RESERVOIR:
+                self._sample[j] = v
+
+    def _pct(self, s: List[float], q: float) -> float:
+        return s[min(len(s) - 1, int(q * len(s)))]
+
+    def summary(self) -> Dict[str, float]:
+        if not self.count:
+            return {"count": 0}
+        s = sorted(self._sample)
+        return {"count": self.count, "total": round(self.total, 6), "mean": round(self.total / self.count, 6),
+                "min": round(self.min, 6), "p50": round(self._pct(s, 0.5), 6),
+                "p90": round(self._pct(s, 0.9), 6), "p99": round(self._pct(s, 0.99), 6),
+                "max": round(self.max, 6)}
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = ts_now_iso()
+            self._t0 = time.perf_counter()
+            self.counters: Dict[str, float] = {}
+            self.hists: Dict[str, Histogram] = {}
+
+    def incr(self, name: str, n: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            h = self.hists.get(name)
+            if h is None:
+                h = self.hists[name] = Histogram()
+            h.add(float(value))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "elapsed_seconds": round(time.perf_counter() - self._t0, 3),
+                "counters": dict(sorted(self.counters.items())),
+                "histograms": {k: h.summary() for k, h in sorted(self.hists.items())},
+            }
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+def incr(name: str, n: float = 1):
+    _metrics.incr(name, n)
+
+
+def observe(name: str, value: float):
+    _metrics.observe(name, value)
+
+
+@contextmanager
+def timer(name: str):
+    """Time the block into histogram `name` (seconds), also when it raises."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _metrics.observe(name, time.perf_counter() - t0)
+
+
+def reset():
+    _metrics.reset()
+
+
+def snapshot() -> Dict[str, Any]:
+    return _metrics.snapshot()
+
+
+def write_report(path: str, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Write snapshot() (plus `extra` fields) as JSON; returns what was written."""
+    report = dict(extra or {})
+    report["metrics"] = snapshot()
+    write_json_atomic(report, path)
+    return report
+
+
+def format_summary(top: int = 12) -> str:
+    """Short text view: counters, then the timers with the largest total time."""
+    snap = snapshot()
+    lines = [f"[Metrics] {k}={v:g}" for k, v in snap["counters"].items()]
+    hists = sorted(snap["histograms"].items(), key=lambda kv: -kv[1].get("total", 0))
+    for k, h in hists[:top]:
+        if h.get("count"):
+            lines.append(f"[Metrics] {k}: n={h['count']} total={h['total']:.2f} "
+                         f"p50={h['p50']:.3f} p90={h['p90']:.3f} max={h['max']:.3f}")
+    return "\n".join(lines)
@@ -17,7 +17,7 @@ def create_kpi_db(parent_page_id: str, title: str) -> str:
     """
     Create the KPI database with a sensible default schema.
     """
-    url = "https://api.notion.com/v1/databases"
+    url = f"{NOTION_API}/databases"
     payload = {
         "parent": {
             "type": "page_id",
@@ -83,7 +83,7 @@ def ensure_db_schema(database_id: str) -> int:
     Adds any missing properties to the KPI DB. Returns count of added props.
     """
     # fetch current
-    r = requests.get(f"https://api.notion.com/v1/databases/{database_id}",
+    r = requests.get(f"{NOTION_API}/databases/{database_id}",
                      headers=_headers(),
                      timeout=30)
     r.raise_for_status()
@@ -136,7 +136,7 @@ def ensure_db_schema(database_id: str) -> int:
     for prop_name, prop_def in to_add.items():
         patch = {"properties": {prop_name: prop_def}}
         pr = requests.patch(
-            f"https://api.notion.com/v1/databases/{database_id}",
+            f"{NOTION_API}/databases/{database_id}",
             headers=_headers(),
             json=patch,
             timeout=30)
@@ -149,7 +149,7 @@ def create_settings_db(parent_page_id: str, title: str) -> str:
     """
     Create the per-client Settings DB with key/value columns.
     """
-    url = "https://api.notion.com/v1/databases"
+    url = f"{NOTION_API}/databases"
     payload = {
         "parent": {
             "type": "page_id",
@@ -189,7 +189,7 @@ def ensure_settings_rows(database_id: str) -> None:
     ]
     # fetch first 100 rows
     r = requests.post(
-        "https://api.notion.com/v1/databases/{}/query".format(database_id),
+        f"{NOTION_API}/databases/{database_id}/query",
         headers=_headers(),
         json={"page_size": 100},
         timeout=30)
@@ -226,7 +226,7 @@ def ensure_settings_rows(database_id: str) -> None:
                 }
             }
         }
-        pr = requests.post("https://api.notion.com/v1/pages",
+        pr = requests.post(f"{NOTION_API}/pages",
                            headers=_headers(),
                            json=create_page_payload,
                            timeout=30)
@@ -234,11 +234,27 @@ def ensure_settings_rows(database_id: str) -> None:
 
 
 # --- Notion HTTP helpers (add these) ---
-import os, requests
-
-NOTION_API = "https://api.notion.com/v1"
+import os, time, threading, requests
+from .http_pool import make_session, backoff_delay, retry_after_seconds, RETRY_STATUSES
+from .ratelimit import TokenBucket
+from .page_index import get_page_index, index_key
+from .ledger import get_ledger, payload_hash
+from .settings_cache import get_settings_cache
+from .metrics import incr, timer
+
+# NOTION_API_BASE points the client elsewhere, e.g. the local stand-in (src/standin.py)
+NOTION_API = os.getenv("NOTION_API_BASE", "https://api.notion.com/v1").rstrip("/")
 NOTION_TOKEN = os.getenv("NOTION_TOKEN")
 
+# Notion allows ~3 requests/s per integration; every call shares one bucket.
+NOTION_RPS = float(os.getenv("NOTION_RPS", "3"))
+NOTION_MAX_RETRIES = int(os.getenv("NOTION_MAX_RETRIES", "5"))
+NOTION_POOL_SIZE = int(os.getenv("NOTION_POOL_SIZE", "8"))
+
+_session = None
+_bucket = TokenBucket(NOTION_RPS, burst=NOTION_RPS)
+_session_lock = threading.Lock()
+
 
 def _notion_headers():
     return {
@@ -248,14 +264,72 @@ def _notion_headers():
     }
 
 
-def _post(path_or_url: str, payload: dict):
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = make_session(NOTION_POOL_SIZE, _notion_headers())
+    return _session
+
+
+def _url(path_or_url: str) -> str:
     # Accept either full URL or API path
-    url = path_or_url if path_or_url.startswith(
-        "http") else f"{NOTION_API}{path_or_url}"
-    r = requests.post(url, headers=_notion_headers(), json=payload, timeout=30)
+    return path_or_url if path_or_url.startswith("http") else f"{NOTION_API}{path_or_url}"
+
+
+def _idempotent(method: str, url: str) -> bool:
+    # a database query is a read even though it is a POST
+    return method != "POST" or url.endswith("/query")
+
+
+def _request(method: str, path_or_url: str, payload: dict = None) -> requests.Response:
+    """
+    Rate-limited Notion call on the pooled session. 429s pause every worker for
+    Retry-After and retry (nothing was written). 5xx and connection errors back
+    off and retry only for idempotent calls: a create (POST /pages, /databases)
+    may have gone through, so it raises / returns the response and the caller
+    decides (see _create_page). Returns the final response (callers check the status).
+    """
+    url = _url(path_or_url)
+    safe = _idempotent(method, url)
+    attempt = 0
+    while True:
+        with timer("notion.bucket_wait"):
+            _bucket.acquire()
+        incr("notion.http_calls")
+        try:
+            with timer("notion.request"):
+                r = _get_session().request(method, url, json=payload, timeout=30)
+        except (requests.ConnectionError, requests.Timeout):
+            incr("notion.connection_errors")
+            if not safe or attempt >= NOTION_MAX_RETRIES:
+                raise
+            incr("notion.retries")
+            time.sleep(backoff_delay(attempt, 1.0, 30.0))
+            attempt += 1
+            continue
+        if r.status_code == 429:
+            incr("notion.rate_limited")
+        if r.status_code not in RETRY_STATUSES or attempt >= NOTION_MAX_RETRIES:
+            return r
+        if r.status_code != 429 and not safe:
+            return r
+        incr("notion.retries")
+        delay = retry_after_seconds(r) or backoff_delay(attempt, 1.0, 30.0)
+        if r.status_code == 429:
+            print(f"[Notion] 429 rate limited; pausing {delay:.1f}s")
+            _bucket.pause(delay)
+        else:
+            time.sleep(delay)
+        attempt += 1
+
+
+def _post(path_or_url: str, payload: dict):
+    r = _request("POST", path_or_url, payload)
     if r.status_code >= 300:
         raise RuntimeError(
-            f"Notion POST {url} -> {r.status_code}: {r.text[:300]}")
+            f"Notion POST {_url(path_or_url)} -> {r.status_code}: {r.text[:300]}")
     return r.json()
 
 
@@ -263,56 +337,75 @@ def _post(path_or_url: str, payload: dict):
 
 
 def _patch(path_or_url: str, payload: dict):
-    url = path_or_url if path_or_url.startswith(
-        "http") else f"{NOTION_API}{path_or_url}"
-    r = requests.patch(url,
-                       headers=_notion_headers(),
-                       json=payload,
-                       timeout=30)
+    r = _request("PATCH", path_or_url, payload)
     if r.status_code >= 300:
         raise RuntimeError(
-            f"Notion PATCH {url} -> {r.status_code}: {r.text[:300]}")
+            f"Notion PATCH {_url(path_or_url)} -> {r.status_code}: {r.text[:300]}")
     return r.json()
 
 
 # --- Settings loader (minimal, tolerant) ---
-def get_settings(settings_db_id: str) -> dict:
+def _settings_from_rows(rows: list) -> dict:
+    out = {}
+    for row in rows:
+        props = row.get("properties", {})
+        # Try common property names; fall back safely
+        key_parts = props.get("key", {}).get("title", []) or props.get(
+            "name", {}).get("title", [])
+        key = "".join([p.get("plain_text", "") for p in key_parts]).strip()
+        val_parts = props.get("value", {}).get("rich_text", [])
+        val = "".join([p.get("plain_text", "") for p in val_parts]).strip()
+        if key:
+            out[key] = val
+    return out
+
+
+def fetch_settings_versioned(settings_db_id: str) -> tuple:
+    """
+    (settings, version) of a Settings DB from one paginated query -- a single
+    request for up to 100 rows. The version covers every row's id and
+    last_edited_time, so an edited, added or deleted row all change it.
+    """
+    rows, cursor = [], None
+    while True:
+        data = query_database_page(settings_db_id, cursor)
+        rows.extend(data.get("results", []))
+        if not data.get("has_more"):
+            break
+        cursor = data.get("next_cursor")
+    stamps = sorted(f"{r.get('id', '')}:{r.get('last_edited_time', '')}" for r in rows)
+    return _settings_from_rows(rows), payload_hash(stamps)[:16]
+
+
+def fetch_settings(settings_db_id: str) -> dict:
+    """Every key/value row of the Settings DB (paginated)."""
+    return fetch_settings_versioned(settings_db_id)[0]
+
+
+def get_settings_versioned(settings_db_id: str, refresh: bool = False) -> tuple:
     """
-    Read key/value rows from the Notion Settings DB.
-    Returns {} on any error so the engine can still run with defaults.
+    (settings, version) from the Notion Settings DB, through the local settings
+    cache (src/settings_cache.py): one query per NOTION_SETTINGS_FRESH at most.
+    Falls back to the last cached copy, else ({}, ""), on any error so the
+    engine can still run with defaults.
     Expected schema:
       - 'key'  (Title)
       - 'value' (Rich text)
     """
     if not settings_db_id:
-        return {}
+        return {}, ""
+    cache = get_settings_cache(settings_db_id, fetch_settings_versioned)
     try:
-        url = f"{NOTION_API}/databases/{settings_db_id}/query"
-        resp = requests.post(url,
-                             headers=_notion_headers(),
-                             json={"page_size": 100},
-                             timeout=30)
-        if resp.status_code >= 300:
-            print(
-                f"[warn] get_settings query {resp.status_code}: {resp.text[:200]}"
-            )
-            return {}
-        data = resp.json()
-        out = {}
-        for row in data.get("results", []):
-            props = row.get("properties", {})
-            # Try common property names; fall back safely
-            key_parts = props.get("key", {}).get("title", []) or props.get(
-                "name", {}).get("title", [])
-            key = "".join([p.get("plain_text", "") for p in key_parts]).strip()
-            val_parts = props.get("value", {}).get("rich_text", [])
-            val = "".join([p.get("plain_text", "") for p in val_parts]).strip()
-            if key:
-                out[key] = val
-        return out
+        return cache.get(force=refresh)
     except Exception as e:
-        print(f"[warn] get_settings failed: {e}")
-        return {}
+        stale = cache.cached()
+        print(f"[warn] get_settings failed: {e}" + ("; using cached copy" if stale else ""))
+        return stale if stale else ({}, "")
+
+
+def get_settings(settings_db_id: str, refresh: bool = False) -> dict:
+    """Key/value rows of the Notion Settings DB (see get_settings_versioned)."""
+    return get_settings_versioned(settings_db_id, refresh)[0]
 
 
 # --- end settings loader ---
@@ -322,7 +415,7 @@ def create_alerts_db(parent_page_id: str, title: str) -> str:
     """
     Create the Alerts DB used to log every alert.
     """
-    url = "https://api.notion.com/v1/databases"
+    url = f"{NOTION_API}/databases"
     payload = {
         "parent": {
             "type": "page_id",
@@ -334,9 +427,13 @@ def create_alerts_db(parent_page_id: str, title: str) -> str:
                 "content": title
             }
         }],
+        # matches the rows written by add_alert_row (one row per alerted metric)
         "properties": {
-            "timestamp": {
-                "date": {}
+            "entity_name": {
+                "title": {}
+            },
+            "entity_id": {
+                "rich_text": {}
             },
             "level": {
                 "select": {
@@ -353,16 +450,43 @@ def create_alerts_db(parent_page_id: str, title: str) -> str:
                     ]
                 }
             },
-            "entity_id": {
-                "rich_text": {}
+            "date": {
+                "date": {}
             },
-            "name": {
-                "title": {}
+            "metric": {
+                "select": {}
             },
-            "reason": {
+            "value": {
+                "number": {}
+            },
+            "baseline": {
+                "number": {}
+            },
+            "pct_change": {
+                "number": {}
+            },
+            "severity": {
+                "select": {
+                    "options": [
+                        {
+                            "name": "Low"
+                        },
+                        {
+                            "name": "Medium"
+                        },
+                        {
+                            "name": "High"
+                        },
+                    ]
+                }
+            },
+            "client": {
                 "rich_text": {}
             },
-            "actions": {
+            "link": {
+                "url": {}
+            },
+            "notes": {
                 "rich_text": {}
             },
         },
@@ -371,7 +495,7 @@ def create_alerts_db(parent_page_id: str, title: str) -> str:
 
 
 def create_page(db_id: str, props: dict):
-    url = f"https://api.notion.com/v1/pages"
+    url = f"{NOTION_API}/pages"
     payload = {
         "parent": {
             "database_id": db_id
@@ -381,14 +505,75 @@ def create_page(db_id: str, props: dict):
     return _post(url, payload)
 
 
-def upsert_record(db_id: str, latest: dict):
+def _create_page(db_id: str, props: dict, find) -> dict:
     """
-    Minimal shim: just create a page and return its id.
-    (Good enough to finish Step 6; we can improve to a true upsert later.)
+    create_page without blind retries. A create that timed out or got a 5xx may
+    still have been written, so before each new attempt `find()` (a filtered query
+    for the row's key) is asked and a page it returns is used instead.
     """
+    attempt = 0
+    while True:
+        try:
+            r = _request("POST", f"{NOTION_API}/pages", {"parent": {"database_id": db_id}, "properties": props})
+            if r.status_code < 300:
+                return r.json()
+            if r.status_code == 429 or r.status_code not in RETRY_STATUSES or attempt >= NOTION_MAX_RETRIES:
+                raise RuntimeError(f"Notion POST {NOTION_API}/pages -> {r.status_code}: {r.text[:300]}")
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= NOTION_MAX_RETRIES:
+                raise
+        incr("notion.create_rechecks")
+        time.sleep(backoff_delay(attempt, 1.0, 30.0))
+        found = find()
+        if found:
+            incr("notion.create_recovered")
+            print(f"[Notion] create of {found['id']} went through despite the error; not resending")
+            return found
+        attempt += 1
+
+
+def query_database_page(db_id: str, start_cursor: str = None, filter: dict = None) -> dict:
+    """One page (100 rows) of a database query; pass next_cursor to continue."""
+    payload = {"page_size": 100}
+    if start_cursor:
+        payload["start_cursor"] = start_cursor
+    if filter:
+        payload["filter"] = filter
+    return _post(f"{NOTION_API}/databases/{db_id}/query", payload)
+
+
+def _find_page(db_id: str, props: dict, names) -> dict:
+    """
+    First live page of db_id whose `names` properties (text / select / date)
+    equal those in props, or None.
+    """
+    conds = []
+    for name in names:
+        prop = props.get(name)
+        if prop is None:
+            conds.append({"property": name, "select": {"is_empty": True}})
+        elif "date" in prop:
+            conds.append({"property": name, "date": {"equals": prop["date"]["start"]}})
+        elif "select" in prop:
+            conds.append({"property": name, "select": {"equals": prop["select"]["name"]}})
+        else:
+            kind = "title" if "title" in prop else "rich_text"
+            conds.append({"property": name, kind: {"equals": "".join(p["text"]["content"] for p in prop[kind])}})
+    for page in query_database_page(db_id, filter={"and": conds}).get("results", []):
+        if not page.get("archived"):
+            return page
+    return None
+
+
+def _record_entity(latest: dict) -> str:
     # choose an entity id to display
-    ent = latest.get("ad_id") or latest.get("adset_id") or latest.get(
-        "campaign_id") or ""
+    return latest.get("ad_id") or latest.get("adset_id") or latest.get(
+        "campaign_id") or latest.get("id") or ""
+
+
+def record_properties(latest: dict) -> dict:
+    """Notion properties of a KPI record's page (what upsert_record writes)."""
+    ent = _record_entity(latest)
     title = latest.get("name") or ent or "Unknown"
 
     props = {
@@ -456,11 +641,48 @@ def upsert_record(db_id: str, latest: dict):
 
     # Clean None-valued selects
     props = {k: v for k, v in props.items() if v is not None}
+    return props
+
 
-    resp = create_page(db_id, props)
-    # Notion returns an object with 'id'
-    page_id = resp.get("id") if isinstance(resp, dict) else None
-    return "created", page_id
+def upsert_record(db_id: str, latest: dict, level: str = None):
+    """
+    Idempotent upsert keyed on (entity_id, level, date); `level` fills in for
+    records that do not carry one (e.g. KPI JSONL written before it had a column).
+    The page id comes from a local index (src/page_index.py, kept in the delivery
+    ledger and built from the database once). Rows whose properties match the
+    last successful write are skipped, changed rows PATCHed, new rows created.
+    Returns (action, page_id) with action in created|updated|skipped.
+    """
+    if level and not latest.get("level"):
+        latest = dict(latest, level=level)
+    ent = _record_entity(latest)
+    props = record_properties(latest)
+
+    sel = (props.get("level") or {}).get("select") or {}
+    key = index_key(ent, sel.get("name", ""), props["date"]["date"]["start"])
+    digest = payload_hash(props)
+    index = get_page_index(db_id, query_database_page)
+
+    with index.key_lock(key):
+        hit = index.get(key)
+        if hit and index.ledger.enabled and hit["hash"] == digest:
+            return "skipped", hit["page_id"]
+        if hit:
+            r = _request("PATCH", f"{NOTION_API}/pages/{hit['page_id']}", {"properties": props})
+            if r.status_code < 300:
+                index.put(key, hit["page_id"], digest)
+                return "updated", hit["page_id"]
+            if r.status_code != 404:
+                raise RuntimeError(
+                    f"Notion PATCH pages/{hit['page_id']} -> {r.status_code}: {r.text[:300]}")
+            index.drop(key)  # page deleted in Notion: fall through and recreate
+
+        resp = _create_page(db_id, props, lambda: _find_page(db_id, props, ("entity_id", "level", "date")))
+        # Notion returns an object with 'id'
+        page_id = resp.get("id") if isinstance(resp, dict) else None
+        if page_id:
+            index.put(key, page_id, digest)
+        return "created", page_id
 
 
 def update_fatigue_fields(page_id: str, fatigued: bool, reason: str,
@@ -471,8 +693,7 @@ def update_fatigue_fields(page_id: str, fatigued: bool, reason: str,
     return
 
 
-def add_alert_row(
-    db_id: str,
+def alert_properties(
     ts: str,
     level: str,
     entity_id: str,
@@ -485,7 +706,8 @@ def add_alert_row(
     client: str,
     link: str,
     notes: str = "",
-):
+) -> dict:
+    """Notion properties of one Alerts DB row (what add_alert_row writes)."""
     props = {
         "entity_name": {
             "title": [{
@@ -550,9 +772,33 @@ def add_alert_row(
     }
     # strip None selects
     props = {k: v for k, v in props.items() if v is not None}
-    return _post("https://api.notion.com/v1/pages", {
-        "parent": {
-            "database_id": db_id
-        },
-        "properties": props,
-    })
+    return props
+
+
+def add_alert_row(
+    db_id: str,
+    ts: str,
+    level: str,
+    entity_id: str,
+    name: str,
+    metric: str,
+    value: float,
+    baseline: float,
+    pct_change: float,
+    severity: str,
+    client: str,
+    link: str,
+    notes: str = "",
+):
+    props = alert_properties(ts, level, entity_id, name, metric, value, baseline, pct_change,
+                             severity, client, link, notes)
+
+    # same alert already logged with identical content -> don't add a duplicate row
+    channel, key = f"notion-alerts:{db_id}", f"{entity_id}|{metric}|{ts}"
+    digest = payload_hash(props)
+    ledger = get_ledger()
+    if ledger.is_delivered(channel, key, digest):
+        return {"id": None, "skipped": True}
+    resp = _create_page(db_id, props, lambda: _find_page(db_id, props, ("entity_id", "metric", "date")))
+    ledger.record(channel, key, digest)
+    return resp
@@ -0,0 +1,53 @@
+# src/notion_writer.py
+# Bulk Notion writes on a bounded worker pool. Throughput is governed by the
+# shared token bucket in notion._request, so adding workers only hides latency;
+# it never pushes Notion past its rate limit.
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Tuple
+
+from .notion import upsert_record, NOTION_RPS
+
+
+def bulk_upsert(db_id: str, records: Iterable[Dict[str, Any]], workers: int = None,
+                level: str = None) -> Dict[str, Any]:
+    """
+    upsert_record for every record with up to `workers` requests in flight
+    (default: the Notion rate, so the bucket stays busy); `level` is used for
+    records that carry none. A failed row is recorded and the rest keep going.
+    Returns {"counts": {action: n}, "errors": [(record, message)]}.
+    """
+    workers = max(1, int(workers or round(NOTION_RPS) or 1))
+    counts: Counter = Counter()
+    errors: List[Tuple[Dict[str, Any], str]] = []
+
+    def _one(rec):
+        try:
+            action, _ = upsert_record(db_id, rec, level)
+            return action, None
+        except Exception as e:
+            return "failed", str(e)
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for rec, (action, err) in _submit_window(records, ex, _one, workers):
+            counts[action] += 1
+            if err:
+                errors.append((rec, err))
+                print(f"[Notion] upsert failed for {rec.get('id') or rec.get('name')}: {err[:200]}")
+    return {"counts": dict(counts), "errors": errors}
+
+
+def _submit_window(records: Iterable[Dict[str, Any]], ex: ThreadPoolExecutor, fn, window: int):
+    """
+    Submit fn(record) with at most ~2*window futures outstanding, so a large
+    JSONL file is streamed instead of being queued in full. Yields (record, result)
+    in input order.
+    """
+    pending = []
+    for rec in records:
+        pending.append((rec, ex.submit(fn, rec)))
+        if len(pending) >= 2 * window:
+            rec0, fut = pending.pop(0)
+            yield rec0, fut.result()
+    for rec0, fut in pending:
+        yield rec0, fut.result()
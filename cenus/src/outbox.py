@@ -0,0 +1,260 @@
+# src/outbox.py
+# Durable outbox for Notion and Slack deliveries. Evaluation / push steps
+# enqueue messages into SQLite and return immediately; a delivery worker drains
+# them concurrently with retries and backoff, and parks messages that keep
+# failing as "dead" instead of losing them. A crash loses nothing: whatever was
+# enqueued is delivered by the next drain (scripts/drain_outbox.py or next run).
+#   <DATA_DIR>/_state/outbox.sqlite
+#   OUTBOX_MAX_ATTEMPTS  attempts before a message is dead-lettered (default 6)
+#   OUTBOX_WORKERS       concurrent deliveries (default 4)
+#   OUTBOX_LEASE         seconds before an in-flight claim is considered lost (default 300)
+import os, json, time, sqlite3, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .storage import state_path, ts_now_iso
+from .http_pool import backoff_delay
+from .notion import upsert_record, update_fatigue_fields, add_alert_row
+from .alerts import send_slack_alert, send_slack_digest, resolve_webhook
+from .metrics import incr, timer
+
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", "300"))
+
+Handler = Callable[[Dict[str, Any]], Any]
+
+
+# --- delivery handlers (kind -> fn(payload)) ---
+def _notion_upsert(p: Dict[str, Any]):
+    return upsert_record(p["db_id"], p["record"])[0]
+
+
+def _notion_fatigue(p: Dict[str, Any]):
+    action, page_id = upsert_record(p["db_id"], p["record"])
+    update_fatigue_fields(page_id, p["fatigued"], p.get("reason", ""), p.get("actions", ""))
+    return action
+
+
+def _notion_alert(p: Dict[str, Any]):
+    res = add_alert_row(p["db_id"], **p["row"])
+    return "skipped" if res.get("skipped") else "created"
+
+
+def _slack_alert(p: Dict[str, Any]):
+    sent = send_slack_alert(resolve_webhook(p["webhook"]), **p["alert"])
+    return "sent" if sent else "skipped"
+
+
+def _slack_digest(p: Dict[str, Any]):
+    n = send_slack_digest(resolve_webhook(p["webhook"]), p["client"], p["level"], p["alerts"])
+    return "sent" if n else "skipped"
+
+
+HANDLERS: Dict[str, Handler] = {
+    "notion.upsert": _notion_upsert,
+    "notion.fatigue": _notion_fatigue,
+    "notion.alert": _notion_alert,
+    "slack.alert": _slack_alert,
+    "slack.digest": _slack_digest,
+}
+
+
+class Outbox:
+    """
+    messages(kind, key) -> payload + delivery state. Enqueueing the same
+    (kind, key) again replaces a message that has not been delivered yet, so a
+    rerun does not pile up duplicates.
+    status: pending -> inflight -> done | pending (retry) | dead
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or state_path("outbox.sqlite")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, key TEXT NOT NULL,"
+            " payload TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_at REAL NOT NULL, claimed_at REAL, last_error TEXT,"
+            " created_at TEXT NOT NULL, updated_at TEXT NOT NULL, UNIQUE (kind, key))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_due ON messages (status, next_at)")
+        self._db.commit()
+
+    def enqueue(self, kind: str, key: str, payload: Dict[str, Any]):
+        self.enqueue_many(kind, [(key, payload)])
+
+    def enqueue_many(self, kind: str, items: List[Tuple[str, Dict[str, Any]]]):
+        """Enqueue [(key, payload)] of one kind in a single transaction."""
+        if kind not in HANDLERS:
+            raise ValueError(f"unknown outbox message kind: {kind}")
+        now, due = ts_now_iso(), time.time()
+        rows = [(kind, key, json.dumps(payload, ensure_ascii=False, default=str), due, now, now)
+                for key, payload in items]
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO messages (kind, key, payload, status, attempts, next_at, created_at, updated_at)"
+                " VALUES (?, ?, ?, 'pending', 0, ?, ?, ?)"
+                " ON CONFLICT(kind, key) DO UPDATE SET payload=excluded.payload, status='pending',"
+                " attempts=0, next_at=excluded.next_at, last_error=NULL, updated_at=excluded.updated_at",
+                rows)
+            self._db.commit()
+
+    def claim(self, limit: int) -> List[Tuple[int, str, Dict[str, Any], int]]:
+        """Mark up to `limit` due messages in-flight; returns [(id, kind, payload, attempts)]."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")  # another process may be draining too
+            rows = self._db.execute(
+                "SELECT id, kind, payload, attempts FROM messages WHERE"
+                " (status='pending' AND next_at<=?) OR (status='inflight' AND claimed_at<=?)"
+                " ORDER BY id LIMIT ?", (now, now - OUTBOX_LEASE, limit)).fetchall()
+            self._db.executemany("UPDATE messages SET status='inflight', claimed_at=? WHERE id=?",
+                                 [(now, r[0]) for r in rows])
+            self._db.commit()
+        return [(i, kind, json.loads(payload), attempts) for i, kind, payload, attempts in rows]
+
+    # done/failed leave a message alone if it was re-enqueued while in flight,
+    # so the newer payload still gets delivered
+    def done(self, msg_id: int):
+        with self._lock:
+            self._db.execute("UPDATE messages SET status='done', last_error=NULL, updated_at=?"
+                             " WHERE id=? AND status='inflight'",
+                             (ts_now_iso(), msg_id))
+            self._db.commit()
+
+    def failed(self, msg_id: int, attempts: int, error: str, max_attempts: int) -> str:
+        """Schedule a retry with backoff, or dead-letter after max_attempts. Returns the new status."""
+        status = "dead" if attempts >= max_attempts else "pending"
+        next_at = time.time() + backoff_delay(attempts - 1, 5.0, 600.0)
+        with self._lock:
+            self._db.execute(
+                "UPDATE messages SET status=?, attempts=?, next_at=?, last_error=?, updated_at=?"
+                " WHERE id=? AND status='inflight'",
+                (status, attempts, next_at, error[:2000], ts_now_iso(), msg_id))
+            self._db.commit()
+        return status
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM messages GROUP BY status").fetchall()
+        return dict(rows)
+
+    def dead(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, kind, key, attempts, last_error, updated_at FROM messages"
+                " WHERE status='dead' ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [dict(zip(("id", "kind", "key", "attempts", "last_error", "updated_at"), r)) for r in rows]
+
+    def retry_dead(self) -> int:
+        """Put every dead message back in the queue with a fresh attempt budget."""
+        with self._lock:
+            n = self._db.execute(
+                "UPDATE messages SET status='pending', attempts=0, next_at=?, updated_at=? WHERE status='dead'",
+                (time.time(), ts_now_iso())).rowcount
+            self._db.commit()
+        return n
+
+    def purge_done(self) -> int:
+        with self._lock:
+            n = self._db.execute("DELETE FROM messages WHERE status='done'").rowcount
+            self._db.commit()
+        return n
+
+
+_outbox: Optional[Outbox] = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> Outbox:
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = Outbox()
+    return _outbox
+
+
+def enqueue(kind: str, key: str, payload: Dict[str, Any]):
+    get_outbox().enqueue(kind, key, payload)
+
+
+def enqueue_many(kind: str, items: List[Tuple[str, Dict[str, Any]]]):
+    get_outbox().enqueue_many(kind, items)
+
+
+def _deliver(outbox: Outbox, msg: Tuple[int, str, Dict[str, Any], int], max_attempts: int) -> str:
+    msg_id, kind, payload, attempts = msg
+    try:
+        with timer(f"outbox.{kind}"):
+            outcome = HANDLERS[kind](payload) or "done"
+        outbox.done(msg_id)
+    except Exception as e:
+        status = outbox.failed(msg_id, attempts + 1, f"{type(e).__name__}: {e}", max_attempts)
+        print(f"[Outbox] {kind} #{msg_id} failed (attempt {attempts + 1}, {status}): {str(e)[:200]}")
+        outcome = "dead" if status == "dead" else "retry"
+    incr(f"outbox.{kind}.{outcome}")
+    return outcome
+
+
+def drain(workers: Optional[int] = None, max_attempts: Optional[int] = None,
+          outbox: Optional[Outbox] = None) -> Dict[str, int]:
+    """
+    Deliver every message that is due now, `workers` at a time. Messages that
+    fail are retried later (backoff) or dead-lettered; they never stop the drain.
+    Returns counts per outcome (created / updated / skipped / sent / retry / dead).
+    """
+    outbox = outbox or get_outbox()
+    workers = max(1, int(workers or OUTBOX_WORKERS))
+    max_attempts = max_attempts or OUTBOX_MAX_ATTEMPTS
+    counts: Dict[str, int] = {}
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        while True:
+            batch = outbox.claim(4 * workers)
+            if not batch:
+                break
+            for outcome in ex.map(lambda m: _deliver(outbox, m, max_attempts), batch):
+                counts[outcome] = counts.get(outcome, 0) + 1
+    return counts
+
+
+class OutboxWorker:
+    """
+    Background drain while producers are still enqueueing (e.g. the pipeline's
+    evaluate steps). stop() finishes with one last drain of everything due.
+    """
+
+    def __init__(self, workers: Optional[int] = None, poll: float = 0.5):
+        self.workers = workers
+        self.poll = poll
+        self.counts: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="outbox-worker", daemon=True)
+
+    def _merge(self, counts: Dict[str, int]):
+        for k, v in counts.items():
+            self.counts[k] = self.counts.get(k, 0) + v
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                c = drain(self.workers)
+            except Exception as e:  # keep the worker alive; the final drain reports
+                print(f"[Outbox] drain error: {e}")
+                c = {}
+            self._merge(c)
+            if not c:
+                self._stop.wait(self.poll)
+
+    def start(self) -> "OutboxWorker":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Dict[str, int]:
+        self._stop.set()
+        self._thread.join()
+        self._merge(drain(self.workers))
+        return self.counts
@@ -0,0 +1,94 @@
+# src/page_index.py
+# (entity_id, level, date) -> Notion page_id index so upsert_record can update
+# in place instead of creating a new page on every run. The page id is kept in
+# the delivery ledger row of the same key (src/ledger.py), written in the same
+# SQLite statement as the content hash, so a killed run or two processes
+# upserting the same database never lose the id of a page they created.
+# A database is indexed once from a paginated query of its pages.
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from .ledger import DeliveryLedger, get_ledger
+
+
+def index_key(entity_id: str, level: str, date: str) -> str:
+    return f"{entity_id or ''}|{(level or '').lower()}|{(date or '')[:10]}"
+
+
+def _plain(prop: Dict[str, Any]) -> str:
+    """Text of a title / rich_text / select / date property from a query result."""
+    if not prop:
+        return ""
+    for kind in ("title", "rich_text"):
+        if kind in prop:
+            return "".join(p.get("plain_text", "") for p in prop.get(kind) or [])
+    if "select" in prop:
+        return (prop.get("select") or {}).get("name", "")
+    if "date" in prop:
+        return (prop.get("date") or {}).get("start", "")
+    return ""
+
+
+class PageIndex:
+    """
+    key -> {"page_id", "hash"} for one database, backed by the ledger channel
+    notion:<db_id>. Rebuilt from the database the first time it is seen.
+    """
+
+    def __init__(self, db_id: str, query: Callable[[str, Optional[str]], Dict[str, Any]],
+                 ledger: Optional[DeliveryLedger] = None):
+        self.db_id = db_id
+        self.channel = f"notion:{db_id}"
+        self.ledger = ledger or get_ledger()
+        self._query = query  # (db_id, start_cursor) -> Notion query response
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        if not self.ledger.is_indexed(self.channel):
+            self.rebuild()
+
+    def rebuild(self):
+        """Re-read every page of the database and store its id by (entity_id, level, date)."""
+        rows, cursor, pages = {}, None, 0
+        while True:
+            resp = self._query(self.db_id, cursor)
+            for page in resp.get("results", []):
+                if page.get("archived"):
+                    continue
+                props = page.get("properties", {})
+                key = index_key(_plain(props.get("entity_id")), _plain(props.get("level")), _plain(props.get("date")))
+                rows[key] = page["id"]
+            pages += 1
+            if not resp.get("has_more"):
+                break
+            cursor = resp.get("next_cursor")
+        self.ledger.import_refs(self.channel, rows)
+        print(f"[Notion] index rebuilt for {self.db_id}: {len(rows)} pages ({pages} query pages)")
+
+    def key_lock(self, key: str) -> threading.Lock:
+        """Serialises upserts of the same key (two rows for one page in a bulk run)."""
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        e = self.ledger.entry(self.channel, key)
+        return {"page_id": e[1], "hash": e[0]} if e and e[1] else None
+
+    def put(self, key: str, page_id: str, digest: str):
+        """A write of `key` succeeded: page id and content hash in one statement."""
+        self.ledger.record(self.channel, key, digest, ref=page_id)
+
+    def drop(self, key: str):
+        self.ledger.drop_ref(self.channel, key)
+
+
+_indexes: Dict[str, PageIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_page_index(db_id: str, query: Callable[[str, Optional[str]], Dict[str, Any]]) -> PageIndex:
+    """Shared PageIndex per database (indexed once, then read from the ledger)."""
+    with _indexes_lock:
+        idx = _indexes.get(db_id)
+        if idx is None:
+            idx = _indexes[db_id] = PageIndex(db_id, query)
+        return idx
@@ -0,0 +1,49 @@
+# src/parallel.py
+# Bounded fan-out helper: a global worker cap plus an optional per-key cap
+# (e.g. at most 2 concurrent pulls against the same ad account).
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Hashable, List, Optional, Sequence, Tuple
+
+
+def run_bounded(tasks: Sequence[Any], fn: Callable[[Any], Any], workers: int,
+                key: Optional[Callable[[Any], Hashable]] = None,
+                per_key: Optional[int] = None) -> List[Tuple[Any, Any, Optional[BaseException]]]:
+    """
+    Run fn(task) for every task on a thread pool of `workers`, never running more
+    than `per_key` tasks with the same key(task) at once.
+    Returns [(task, result, error)] in input order; one failing task does not stop
+    the others.
+    """
+    workers = max(1, int(workers))
+    cap = max(1, int(per_key)) if (key and per_key) else None
+    pending = list(enumerate(tasks))
+    running = defaultdict(int)
+    out: List[Any] = [None] * len(pending)
+
+    def _next_ready():
+        for i, (idx, t) in enumerate(pending):
+            if cap is None or running[key(t)] < cap:
+                return pending.pop(i)
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        inflight = {}
+        while pending or inflight:
+            while len(inflight) < workers:
+                nxt = _next_ready()
+                if nxt is None:
+                    break
+                idx, t = nxt
+                if cap is not None:
+                    running[key(t)] += 1
+                inflight[ex.submit(fn, t)] = (idx, t)
+
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                idx, t = inflight.pop(fut)
+                if cap is not None:
+                    running[key(t)] -= 1
+                err = fut.exception()
+                out[idx] = (t, None if err else fut.result(), err)
+    return out
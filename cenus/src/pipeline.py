@@ -0,0 +1,245 @@
+# src/pipeline.py
+# In-process daily pipeline. Each client runs a small step DAG
+#   pull -> persist -> push -> evaluate -> alert
+# with data handed between steps in memory, clients in parallel, and one shared
+# Graph / Notion session for the whole process. Replaces the old chain of
+# `python scripts/...` subprocesses (one per client x step).
+import os, time, datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .meta_client import iter_insights_rows, iter_reach_rows, iter_kpis, to_fatigue_row, KPI_FIELDS, LEVELS
+from .history import HistoryStore
+from .sync import WatermarkStore, plan_sync, sync_insights, restates
+from .storage import stream_records, ts_now_iso, DATA_DIR
+from .graph import configure_graph_client
+from .parallel import run_bounded
+from .outbox import enqueue, OutboxWorker
+from .fatigue_job import (fatigue_window, evaluate_rows, evaluate_ewma, ewma_since, detector_mode,
+                          send_alerts)
+from .ewma import EwmaState, default_alpha
+from .insights_cache import get_insights_cache
+from .rollup import RollUp
+from . import metrics
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+
+
+class Ctx(dict):
+    """Per-client state passed between steps (client, options, step outputs)."""
+
+
+def _yesterday() -> str:
+    return (datetime.date.today() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+# --- steps -------------------------------------------------------------------
+
+def step_pull(ctx: Ctx):
+    """
+    Yesterday for every level; for the evaluated level also whatever the fatigue
+    window is missing locally, so evaluate never goes back to Meta. With
+    ctx["rollup"] only the ad level is fetched (over the widest range) and the
+    adset / campaign rows are derived from it (src/rollup.py), plus their reach /
+    frequency in one fields-limited request per level.
+    """
+    c, day = ctx["client"], ctx["date"]
+    history = ctx["history"]
+    ctx["raw"], ctx["ranges"] = {}, {}
+
+    def _since(level: str) -> str:
+        if level != ctx["level"]:
+            return day
+        plan = plan_sync(c["ad_account_id"], level, ctx["window"][0], day, history, ctx["lookback"])
+        return min(plan[0], day) if plan else day
+
+    if ctx.get("rollup"):
+        since = _since(ctx["level"])
+        ru = RollUp([l for l in ctx["levels"] if l != "ad"])
+        # the cache only serves ranges with no restatement (lookback) days in them
+        cache = not any(restates(c["ad_account_id"], l, since) for l in ctx["levels"])
+        ads = list(ru.tee(iter_insights_rows(c["ad_account_id"], level="ad", since=since, until=day, cache=cache)))
+        for level in ru.levels:
+            ru.add_reach(level, iter_reach_rows(c["ad_account_id"], level, since, day))
+        for level in ctx["levels"]:
+            ctx["ranges"][level] = (since, day)
+            ctx["raw"][level] = ads if level == "ad" else list(ru.rows(level))
+        print(f"[Pull] {c['client_name']} level=ad {since}..{day}: {len(ads)} rows, rolled up to "
+              + ", ".join(f"{l}={len(ctx['raw'][l])}" for l in ru.levels))
+        return
+    for level in ctx["levels"]:
+        since = _since(level)
+        ctx["ranges"][level] = (since, day)
+        ctx["raw"][level] = list(iter_insights_rows(c["ad_account_id"], level=level, since=since, until=day,
+                                                       cache=not restates(c["ad_account_id"], level, since)))
+        print(f"[Pull] {c['client_name']} level={level} {since}..{day}: {len(ctx['raw'][level])} rows")
+
+
+def _day_rows(ctx: Ctx, level: str) -> List[Dict[str, Any]]:
+    return [r for r in ctx["raw"][level] if r.get("date_start") == ctx["date"]]
+
+
+def step_persist(ctx: Ctx):
+    """Per-day JSONL/CSV export, local history and watermark for every pulled level."""
+    c, day = ctx["client"], ctx["date"]
+    base_dir = os.path.join(DATA_DIR, c["client_name"].replace(" ", "_"))
+    os.makedirs(base_dir, exist_ok=True)
+    ctx["saved"] = {}
+    for level, rows in ctx["raw"].items():
+        since, until = ctx["ranges"][level]
+        with ctx["history"].ingest(level, since, until) as hist:
+            for r in rows:
+                hist.add(to_fatigue_row(r, level))
+        WatermarkStore().advance(c["ad_account_id"], level, until)
+        jsonl_path = os.path.join(base_dir, f"{level}_{day}_{day}.jsonl")
+        csv_path = os.path.join(base_dir, f"{level}_{day}_{day}.csv")
+        ctx["saved"][level] = stream_records(iter_kpis(_day_rows(ctx, level), level=level),
+                                             jsonl_path, csv_path, sorted(KPI_FIELDS))
+
+
+def step_push(ctx: Ctx):
+    """Queue yesterday's KPI pages; the outbox worker delivers them meanwhile."""
+    c = ctx["client"]
+    db = c["notion_db_id"]
+    ctx["pushed"] = {}
+    for level in ctx["raw"]:
+        n = 0
+        for rec in iter_kpis(_day_rows(ctx, level), level=level):
+            enqueue("notion.upsert", f"{db}|{level}|{rec.get('id')}|{rec.get('date')}",
+                    {"db_id": db, "record": rec})
+            n += 1
+        ctx["pushed"][level] = n
+
+
+def step_evaluate(ctx: Ctx):
+    c, level = ctx["client"], ctx["level"]
+    since, until = ctx["window"]
+    state = None
+    if ctx["detector"] == "ewma":
+        state = EwmaState(c["client_name"], level, default_alpha(ctx["baseline_days"]))
+        since = ewma_since(state, since)  # only what the state has not folded yet
+    if since > until:
+        rows = []
+    elif "raw" in ctx:
+        rows = ctx["history"].read_range(level, since, until)  # already synced by pull/persist
+    else:
+        rows = sync_insights(c["ad_account_id"], level=level, since=since, until=until,
+                             history=ctx["history"], lookback_days=ctx["lookback"])
+    if state is not None:
+        ctx["evaluation"] = evaluate_ewma(c, level, rows, ctx["baseline_days"], state)
+        ctx["ewma_state"] = state  # saved by step_alert once the alerts are queued
+    else:
+        ctx["evaluation"] = evaluate_rows(c, level, rows, ctx["days"], ctx["baseline_days"])
+
+
+def step_alert(ctx: Ctx):
+    send_alerts(ctx["client"], ctx["evaluation"])
+    if ctx.get("ewma_state") is not None:
+        ctx["ewma_state"].save()
+
+
+# name, dependencies, fn -- listed in a valid execution order
+STEPS: List[Tuple[str, Tuple[str, ...], Callable[[Ctx], None]]] = [
+    ("pull", (), step_pull),
+    ("persist", ("pull",), step_persist),
+    ("push", ("pull",), step_push),
+    ("evaluate", ("persist",), step_evaluate),
+    ("alert", ("evaluate",), step_alert),
+]
+STEP_NAMES = [s[0] for s in STEPS]
+
+
+def run_client(client: Dict, steps: Sequence[str], level: str = "ad", days: int = 14,
+               baseline_days: int = 7, day: Optional[str] = None,
+               lookback: Optional[int] = None, rollup: bool = True,
+               detector: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run the selected steps for one client (`rollup`: see step_pull; `detector`:
+    window | ewma, see fatigue_job.run_for_client). A
+    dependency that is not selected is ignored; one that failed skips everything
+    downstream of it.
+    Returns {"client", "ok", "failed_step", "error", "timings", "skipped", ...}.
+    """
+    day = day or _yesterday()
+    ctx = Ctx(client=client, level=level, levels=list(LEVELS), days=days, baseline_days=baseline_days,
+              date=day, window=fatigue_window(days, datetime.date.fromisoformat(day)),
+              lookback=lookback, rollup=rollup, detector=(detector or detector_mode()).lower(),
+              history=HistoryStore(client["client_name"]))
+    out: Dict[str, Any] = {"client": client["client_name"], "ok": True, "failed_step": None,
+                           "error": None, "timings": {}, "skipped": []}
+    failed = set()
+    print(f"\n=== Daily pipeline for: {client['client_name']} ===")
+    for name, deps, fn in STEPS:
+        if name not in steps:
+            continue
+        if any(d in failed for d in deps):
+            failed.add(name)
+            out["skipped"].append(name)
+            continue
+        t0 = time.perf_counter()
+        try:
+            fn(ctx)
+        except Exception as e:
+            failed.add(name)
+            if out["ok"]:
+                out.update(ok=False, failed_step=name, error=f"{type(e).__name__}: {e}")
+            print(f"[Error] {client['client_name']} step={name}: {e}")
+        finally:
+            out["timings"][name] = round(time.perf_counter() - t0, 3)
+            metrics.observe(f"pipeline.step.{name}", out["timings"][name])
+
+    out["saved"] = ctx.get("saved")
+    out["pushed"] = ctx.get("pushed")
+    ev = ctx.get("evaluation")
+    if ev:
+        out["checked"], out["flagged"] = ev["checked"], ev["flagged"]
+    return out
+
+
+def run_pipeline(clients: List[Dict], steps: Optional[Sequence[str]] = None, workers: Optional[int] = None,
+                 report_path: Optional[str] = None, **opts) -> List[Dict[str, Any]]:
+    """
+    run_client for every client, up to `workers` at once (never two for the same
+    ad account). Prints per-step timings and writes the run report (per-client
+    results + src/metrics.py counters/timers) as JSON to `report_path`
+    (default <DATA_DIR>/_runs/pipeline_<utc time>.json).
+    """
+    steps = list(steps or STEP_NAMES)
+    unknown = [s for s in steps if s not in STEP_NAMES]
+    if unknown:
+        raise ValueError(f"unknown pipeline steps: {unknown}")
+    workers = max(1, int(workers or PIPELINE_WORKERS))
+    configure_graph_client(pool_size=max(10, workers))
+
+    started = ts_now_iso()
+    t0 = time.perf_counter()
+    metrics.reset()  # the report covers this run only
+    # Notion / Slack deliveries run alongside the clients' steps
+    worker = OutboxWorker(workers=workers).start()
+    results = []
+    for c, res, err in run_bounded(clients, lambda c: run_client(c, steps, **opts), workers=workers,
+                                   key=lambda c: c.get("ad_account_id") or c.get("client_name"), per_key=1):
+        if err is not None:
+            res = {"client": c["client_name"], "ok": False, "failed_step": None,
+                   "error": f"{type(err).__name__}: {err}", "timings": {}, "skipped": []}
+        results.append(res)
+    delivered = worker.stop()
+    total = round(time.perf_counter() - t0, 3)
+
+    print("\n[Pipeline] per-step timings (s)")
+    for r in results:
+        timings = " ".join(f"{k}={v:.2f}" for k, v in r["timings"].items())
+        status = "ok" if r["ok"] else f"FAILED at {r['failed_step'] or '-'}: {r['error']}"
+        print(f"  {r['client']}: {timings} | {status}")
+    print(f"[Pipeline] {len(results)} clients in {total:.2f}s, {sum(not r['ok'] for r in results)} failed")
+    print("[Pipeline] deliveries: " + (", ".join(f"{k}={v}" for k, v in sorted(delivered.items())) or "none"))
+    cache = get_insights_cache().stats()
+    print(f"[Pipeline] insights cache: {cache['hits']} account-days served locally, {cache['misses']} fetched")
+
+    print(metrics.format_summary())
+
+    report_path = report_path or os.path.join(
+        DATA_DIR, "_runs", f"pipeline_{started.replace(':', '').replace('-', '')}.json")
+    metrics.write_report(report_path, {"started_at": started, "total_seconds": total, "steps": steps,
+                                       "insights_cache": cache, "deliveries": delivered, "clients": results})
+    print(f"[Pipeline] report written to {report_path}")
+    return results
@@ -0,0 +1,179 @@
+# src/rolling.py
+# Sliding-window statistics for replaying fatigue over long histories: each new
+# day updates mean / variance / min / max in O(1) instead of re-averaging the
+# previous baseline_days rows from scratch.
+import math
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .fatigue import _flt, BASELINE_KEYS, evaluate_rules
+
+
+class _ExactSum:
+    """
+    Running float sum kept exact as non-overlapping partials (Shewchuk), so adding
+    and later subtracting a value leaves no drift and value() equals math.fsum of
+    the live values -- i.e. the same mean statistics.fmean gives.
+    """
+
+    def __init__(self):
+        self.partials: List[float] = []
+
+    def add(self, x: float):
+        i = 0
+        for y in self.partials:
+            if abs(x) < abs(y):
+                x, y = y, x
+            hi = x + y
+            lo = y - (hi - x)
+            if lo:
+                self.partials[i] = lo
+                i += 1
+            x = hi
+        self.partials[i:] = [x]
+
+    def value(self) -> float:
+        return math.fsum(self.partials)
+
+
+class RollingStats:
+    """
+    Mean, sample variance, min and max over the last `window` pushes of one
+    series. None (missing/unparseable) occupies a slot but is not counted, the
+    same way build_series skips it.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self._vals: Deque[Optional[float]] = deque()
+        self._seq = 0                     # index of the next push
+        self._n = 0                       # present values in the window
+        self._sum = _ExactSum()
+        self._nonfinite = 0               # inf/nan break the partials; fall back to fsum
+        self._w_mean = 0.0                # Welford state for the variance
+        self._m2 = 0.0
+        self._min: Deque[Tuple[int, float]] = deque()
+        self._max: Deque[Tuple[int, float]] = deque()
+
+    def push(self, x: Optional[float]):
+        self._vals.append(x)
+        if x is not None:
+            self._add(x)
+        if len(self._vals) > self.window:
+            old = self._vals.popleft()
+            if old is not None:
+                self._remove(old)
+        self._seq += 1
+        start = self._seq - len(self._vals)
+        while self._min and self._min[0][0] < start:
+            self._min.popleft()
+        while self._max and self._max[0][0] < start:
+            self._max.popleft()
+
+    def _add(self, x: float):
+        self._n += 1
+        if not math.isfinite(x):
+            self._nonfinite += 1
+            if math.isnan(x):
+                return
+        else:
+            self._sum.add(x)
+            d = x - self._w_mean
+            self._w_mean += d / (self._n - self._nonfinite)
+            self._m2 += d * (x - self._w_mean)
+        while self._min and self._min[-1][1] >= x:
+            self._min.pop()
+        self._min.append((self._seq, x))
+        while self._max and self._max[-1][1] <= x:
+            self._max.pop()
+        self._max.append((self._seq, x))
+
+    def _remove(self, x: float):
+        self._n -= 1
+        if not math.isfinite(x):
+            self._nonfinite -= 1
+            return
+        self._sum.add(-x)
+        finite_n = self._n - self._nonfinite
+        if finite_n <= 0:
+            self._w_mean, self._m2 = 0.0, 0.0
+            return
+        d = x - self._w_mean
+        self._w_mean -= d / finite_n
+        self._m2 -= d * (x - self._w_mean)
+
+    @property
+    def count(self) -> int:
+        return self._n
+
+    @property
+    def mean(self) -> float:
+        if not self._n:
+            return 0.0
+        if self._nonfinite:
+            return math.fsum(v for v in self._vals if v is not None) / self._n
+        return self._sum.value() / self._n
+
+    @property
+    def variance(self) -> float:
+        n = self._n - self._nonfinite
+        return max(0.0, self._m2 / (n - 1)) if n > 1 else 0.0
+
+    @property
+    def min(self) -> Optional[float]:
+        return self._min[0][1] if self._min else None
+
+    @property
+    def max(self) -> Optional[float]:
+        return self._max[0][1] if self._max else None
+
+
+class RollingBaseline:
+    """RollingStats for every baseline KPI; baseline() matches fatigue.rolling_baseline."""
+
+    def __init__(self, window: int, keys: Optional[List[str]] = None):
+        self.keys = keys or BASELINE_KEYS
+        self.stats = {k: RollingStats(window) for k in self.keys}
+
+    def push(self, row: Dict[str, Any]):
+        for k in self.keys:
+            self.stats[k].push(_flt(row.get(k)))
+
+    def baseline(self) -> Dict[str, float]:
+        return {k: s.mean for k, s in self.stats.items()}
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {k: {"mean": s.mean, "var": s.variance, "min": s.min, "max": s.max, "n": s.count}
+                for k, s in self.stats.items()}
+
+
+def replay_baselines(rows: List[Dict[str, Any]], baseline_days: int):
+    """
+    Yield (latest_row, baseline) for every day that has baseline_days earlier rows,
+    oldest first. rows must be one entity's daily rows.
+    """
+    rows = sorted(rows, key=lambda r: r.get("timestamp"))
+    rb = RollingBaseline(baseline_days)
+    for i, row in enumerate(rows):
+        if i >= baseline_days:
+            yield row, rb.baseline()
+        rb.push(row)
+
+
+def replay_entity(rows: List[Dict[str, Any]], baseline_days: int,
+                  th: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Evaluate the fatigue rules for every historical day of one entity in a single
+    pass -- the result run_fatigue would have produced had it run on that day.
+    """
+    out = []
+    for row, base in replay_baselines(rows, baseline_days):
+        fatigued, reasons, actions = evaluate_rules(row, base, th)
+        out.append({
+            "timestamp": row.get("timestamp"),
+            "fatigued": fatigued,
+            "reasons": reasons,
+            "actions": actions,
+            "baseline": base,
+        })
+    return out
@@ -0,0 +1,118 @@
+# src/rollup.py
+# Derive adset / campaign insights from ad-level rows instead of pulling each
+# level from Graph. Ad rows carry their parent ids (see meta_client.PARENT_LEVELS),
+# so one ad-level pull per account/range is enough.
+# Only base counters are summed; every ratio is re-derived from the sums:
+#   ctr = clicks / impressions * 100     cpm = spend / impressions * 1000
+#   cpc = spend / clicks                 roas = sum(roas_i * spend_i) / sum(spend_i)
+# ROAS is weighted over the children that report it; a parent none of whose
+# children has ROAS gets None, not 0.
+# Reach is deduplicated by Meta per entity, so it cannot be summed: summed child
+# reach overstates the parent's and understates its frequency. Derived rows get
+# reach / frequency only from add_reach() (Meta's own values, fetched with
+# meta_client.iter_reach_rows), else None, which the rules treat as missing.
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .meta_client import _metric_value, PARENT_LEVELS
+
+ROLLUP_LEVELS = ("adset", "campaign")
+_COUNTERS = ("impressions", "spend", "clicks", "results")
+
+
+def _num(v) -> float:
+    x = _metric_value(v)
+    return x if x is not None else 0.0
+
+
+def _add_actions(acc: Dict[str, float], actions) -> None:
+    for a in actions or []:
+        if isinstance(a, dict) and a.get("action_type"):
+            acc[a["action_type"]] = acc.get(a["action_type"], 0.0) + _num(a.get("value"))
+
+
+def _div(a: float, b: float, scale: float = 1.0) -> Optional[float]:
+    return a / b * scale if b else None
+
+
+class RollUp:
+    """
+    Streaming aggregator: add() ad-level rows (or tee() them), then rows(level)
+    yields one Graph-shaped row per (date, parent) for that level.
+    """
+
+    def __init__(self, levels: Iterable[str] = ROLLUP_LEVELS):
+        self.levels = [l for l in levels if l in ROLLUP_LEVELS]
+        self._acc: Dict[str, "OrderedDict[Tuple[str, str], Dict[str, Any]]"] = {l: OrderedDict() for l in self.levels}
+
+    def add(self, r: Dict[str, Any]):
+        for level in self.levels:
+            eid = r.get(f"{level}_id")
+            if not eid:
+                continue
+            key = (r.get("date_start"), eid)
+            acc = self._acc[level].get(key)
+            if acc is None:
+                acc = self._acc[level][key] = {
+                    "date_start": r.get("date_start"), "date_stop": r.get("date_stop"),
+                    "ids": {p: (r.get(f"{p}_id"), r.get(f"{p}_name")) for p in PARENT_LEVELS[level]},
+                    "sums": dict.fromkeys(_COUNTERS, 0.0), "revenue": 0.0, "roas_spend": 0.0,
+                    "actions": {}, "action_values": {}, "children": 0, "reach": None, "frequency": None,
+                }
+            s = acc["sums"]
+            spend = _num(r.get("spend"))
+            for c in _COUNTERS:
+                s[c] += spend if c == "spend" else _num(r.get(c))
+            roas = _metric_value(r.get("roas"))
+            if roas is not None:
+                acc["revenue"] += roas * spend
+                acc["roas_spend"] += spend  # stays 0 (-> roas None) if no child reports ROAS
+            _add_actions(acc["actions"], r.get("actions"))
+            _add_actions(acc["action_values"], r.get("action_values"))
+            acc["children"] += 1
+
+    def add_reach(self, level: str, rows: Iterable[Dict[str, Any]]):
+        """Meta's reach / frequency for `level` rows already rolled up ({date_start, <level>_id, reach, frequency})."""
+        accs = self._acc[level]
+        for r in rows:
+            acc = accs.get((r.get("date_start"), r.get(f"{level}_id")))
+            if acc is not None:
+                acc["reach"] = _metric_value(r.get("reach"))
+                acc["frequency"] = _metric_value(r.get("frequency"))
+
+    def tee(self, rows: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Pass rows through unchanged while adding them."""
+        for r in rows:
+            self.add(r)
+            yield r
+
+    def rows(self, level: str) -> Iterator[Dict[str, Any]]:
+        for acc in self._acc[level].values():
+            s = acc["sums"]
+            out = {"date_start": acc["date_start"], "date_stop": acc["date_stop"]}
+            for p, (pid, pname) in acc["ids"].items():
+                out[f"{p}_id"], out[f"{p}_name"] = pid, pname
+            out.update({
+                "impressions": s["impressions"],
+                "spend": round(s["spend"], 6),
+                "clicks": s["clicks"],
+                "reach": acc["reach"],
+                "results": s["results"],
+                "ctr": _div(s["clicks"], s["impressions"], 100.0),
+                "cpm": _div(s["spend"], s["impressions"], 1000.0),
+                "cpc": _div(s["spend"], s["clicks"]),
+                "frequency": acc["frequency"],
+                "roas": _div(acc["revenue"], acc["roas_spend"]),
+                "actions": [{"action_type": k, "value": v} for k, v in acc["actions"].items()],
+                "action_values": [{"action_type": k, "value": v} for k, v in acc["action_values"].items()],
+                "rolled_up_from": acc["children"],
+            })
+            yield out
+
+
+def rollup_rows(ad_rows: Iterable[Dict[str, Any]], level: str) -> List[Dict[str, Any]]:
+    """Adset or campaign rows derived from ad-level rows."""
+    ru = RollUp([level])
+    for r in ad_rows:
+        ru.add(r)
+    return list(ru.rows(level))
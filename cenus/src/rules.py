@@ -0,0 +1,344 @@
+# src/rules.py
+# Fatigue rules as data. Each rule is a set of conditions "<metric> up|down
+# <threshold>" combined with all / any; the built-in rules A-D are defined here
+# and a client's Settings DB can override, disable or add rules:
+#   RULE_E          cpc up CPC_UP_PCT and results down RESULTS_DOWN_PCT
+#   RULE_E_ACTIONS  Refresh the offer; Tighten the audience      (";"-separated)
+#   RULE_E_REASON   CPC ↑ {d_cpc:.0f}% while results ↓ {abs_d_results:.0f}%   (optional)
+#   RULE_B          off
+# A threshold is a settings key (falling back to DEFAULT_THRESHOLDS) or a number.
+# compile_rules() turns settings into a CompiledRules once per settings version:
+# thresholds parsed, KPI columns resolved, and a scalar and a vectorized
+# evaluator that only format reasons for rules that fired.
+import re, threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Thresholds (defaults baked; can be overridden by Notion settings)
+DEFAULT_THRESHOLDS = {
+    "FREQ_UP_PCT": 35.0,
+    "CTR_DOWN_PCT": 25.0,
+    "ROAS_DOWN_PCT": 30.0,
+    "CPM_UP_PCT": 40.0,
+    "RESULTS_DOWN_PCT": 30.0,
+}
+
+# metric name in rule definitions -> label used in generated reasons
+METRIC_LABELS = {
+    "ctr": "CTR", "roas": "ROAS", "cpm": "CPM", "cpc": "CPC", "frequency": "Frequency",
+    "impressions": "Impressions", "spend": "Spend", "clicks": "Clicks", "results": "Results",
+}
+SEVERITIES = ("Low", "Medium", "High")
+
+
+def _flt(x):
+    try:
+        return float(x) if x is not None else None
+    except Exception:
+        return None
+
+
+def _to_float(v, default):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return default
+
+
+def _positive(v: Optional[float]) -> Optional[float]:
+    # a threshold of 0 would fire on every entity without history (pct_change is 0 there)
+    return v if v is not None and v > 0 else None
+
+
+def resolve_thresholds(th: Dict[str, Any]) -> Dict[str, float]:
+    """Settings values (often strings from Notion) over DEFAULT_THRESHOLDS, as positive floats."""
+    return {k: _positive(_to_float(th.get(k), d)) or d for k, d in DEFAULT_THRESHOLDS.items()}
+
+
+def pct_change(curr: float, base: float) -> float:
+    if base is None or base == 0 or curr is None:
+        return 0.0
+    return (curr - base) / base * 100.0
+
+
+def batch_pct_change(curr: np.ndarray, base: np.ndarray) -> np.ndarray:
+    """Vectorized pct_change: 0 where the baseline is 0."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        d = (curr - base) / base * 100.0
+    return np.where(base == 0, 0.0, d)
+
+
+def severity(pct: float, threshold: float) -> str:
+    """High at 2x the threshold move, Medium at 1.5x, else Low."""
+    ratio = abs(pct) / threshold if threshold else 0.0
+    return "High" if ratio >= 2.0 else "Medium" if ratio >= 1.5 else "Low"
+
+
+# --- definitions ---------------------------------------------------------------
+
+@dataclass
+class Condition:
+    metric: str                    # key of METRIC_LABELS
+    direction: str                 # "up" | "down"
+    threshold: Union[str, float]   # settings key or a number (percent)
+
+
+@dataclass
+class RuleDef:
+    name: str
+    conditions: List[Condition]
+    combine: str = "all"           # "all" | "any"
+    reason: Optional[str] = None   # str.format template; None = generated
+    actions: List[str] = field(default_factory=list)
+
+
+BUILTIN_RULES = [
+    # A) Classic fatigue: Frequency up + CTR down
+    RuleDef("A", [Condition("frequency", "up", "FREQ_UP_PCT"), Condition("ctr", "down", "CTR_DOWN_PCT")],
+            reason="Frequency ↑ {d_frequency:.0f}% vs 7d (from {b_frequency:.2f} to {frequency:.2f}) while CTR ↓ "
+                   "{abs_d_ctr:.0f}% (from {b_ctr:.2f}% to {ctr:.2f}%). → Audience saturation.",
+            actions=["Rotate new creative (fresh hook/thumbnail within first 3s).",
+                     "Broaden/exclude recent engagers to reset Frequency.",
+                     "Shift spend to best placements (Reels/Stories) for lower CPM."]),
+    # B) Efficiency drop: ROAS down
+    RuleDef("B", [Condition("roas", "down", "ROAS_DOWN_PCT")],
+            reason="ROAS ↓ {abs_d_roas:.0f}% vs 7d (from {b_roas:.2f} to {roas:.2f}).",
+            actions=["Swap to proven winner creative (highest ROAS past 14d).",
+                     "Test price/offer/urgency in headline or on landing page.",
+                     "Reduce spend cap or tighten audience until creative refresh."]),
+    # C) Auction pressure: CPM up + CTR down
+    RuleDef("C", [Condition("cpm", "up", "CPM_UP_PCT"), Condition("ctr", "down", "CTR_DOWN_PCT")],
+            reason="CPM ↑ {d_cpm:.0f}% vs 7d (from ${b_cpm:.2f} to ${cpm:.2f}) while CTR ↓ {abs_d_ctr:.0f}%. "
+                   "→ Auction pressure/creative mismatch.",
+            actions=["Try square/vertical cut for mobile-first placements.",
+                     "Refine audience (exclude recent purchasers, add broad LAL).",
+                     "Test value-led hook addressing objections in first 3s."]),
+    # D) Click cost up; results down (reuses CPM_UP_PCT for CPC)
+    RuleDef("D", [Condition("cpc", "up", "CPM_UP_PCT"), Condition("results", "down", "RESULTS_DOWN_PCT")],
+            reason="CPC ↑ {d_cpc:.0f}% and Results ↓ {abs_d_results:.0f}% vs 7d.",
+            actions=["Improve thumb/first frame to lift CTR.",
+                     "Move budget to higher-CTR placement (e.g., Reels).",
+                     "Add stronger CTA on-video and in primary text."]),
+]
+
+_RULE_KEY = re.compile(r"^RULE_([A-Za-z0-9]+)$")
+_COND = re.compile(r"^\s*([a-z]+)\s+(up|down)\s+([A-Za-z_][A-Za-z0-9_]*|\d+(?:\.\d+)?)\s*$", re.I)
+
+
+def parse_expression(name: str, expr: str) -> Tuple[List[Condition], str]:
+    """'<metric> up|down <threshold> [and|or ...]' -> (conditions, combine). Mixing and/or is rejected."""
+    text = expr.strip()
+    has_and, has_or = bool(re.search(r"\band\b", text, re.I)), bool(re.search(r"\bor\b", text, re.I))
+    if has_and and has_or:
+        raise ValueError(f"rule {name}: use either 'and' or 'or', not both")
+    combine = "any" if has_or else "all"
+    conds = []
+    for part in re.split(r"\b(?:and|or)\b", text, flags=re.I):
+        m = _COND.match(part)
+        if not m:
+            raise ValueError(f"rule {name}: cannot parse condition '{part.strip()}'")
+        metric, direction, thr = m.group(1).lower(), m.group(2).lower(), m.group(3)
+        if metric not in METRIC_LABELS:
+            raise ValueError(f"rule {name}: unknown metric '{metric}' (one of {', '.join(METRIC_LABELS)})")
+        conds.append(Condition(metric, direction, float(thr) if thr[0].isdigit() else thr))
+    return conds, combine
+
+
+def _threshold(settings: Dict[str, Any], t: Dict[str, float], thr: Union[str, float]) -> Optional[float]:
+    if not isinstance(thr, str):
+        return _positive(float(thr))
+    return t[thr] if thr in t else _positive(_to_float(settings.get(thr), None))
+
+
+def rule_defs(settings: Dict[str, Any]) -> List[RuleDef]:
+    """Built-in rules with the Settings DB's RULE_* rows applied (bad rows are reported and skipped)."""
+    t = resolve_thresholds(settings)
+    for key in DEFAULT_THRESHOLDS:
+        if key in settings and _positive(_to_float(settings[key], None)) is None:
+            print(f"[Rules] {key}={settings[key]!r} is not a positive number; using {t[key]:g}")
+    rules = OrderedDict((r.name, RuleDef(r.name, list(r.conditions), r.combine, r.reason, list(r.actions)))
+                        for r in BUILTIN_RULES)
+    for key in sorted(settings):
+        m = _RULE_KEY.match(key)
+        if not m:
+            continue
+        name, expr = m.group(1), str(settings[key] or "").strip()
+        if expr.lower() in ("off", "false", "disabled", "0"):
+            rules.pop(name, None)
+            continue
+        try:
+            conds, combine = parse_expression(name, expr)
+            bad = [c.threshold for c in conds if _threshold(settings, t, c.threshold) is None]
+            if bad:
+                raise ValueError(f"rule {name}: threshold {bad[0]} is not a positive number or numeric setting")
+        except ValueError as e:
+            print(f"[Rules] {e}; rule ignored")
+            continue
+        prev = rules.get(name)
+        rules[name] = RuleDef(name, conds, combine, None, prev.actions if prev else [])
+    for name, r in rules.items():
+        if settings.get(f"RULE_{name}_REASON"):
+            r.reason = str(settings[f"RULE_{name}_REASON"])
+        if settings.get(f"RULE_{name}_ACTIONS"):
+            r.actions = [a.strip() for a in str(settings[f"RULE_{name}_ACTIONS"]).split(";") if a.strip()]
+    return list(rules.values())
+
+
+# --- compiled form -------------------------------------------------------------
+
+class CompiledRules:
+    """
+    Rules with thresholds resolved to floats and metrics to column indexes.
+    keys: KPI columns the rules read (kpis_<metric>), in the order the
+    vectorized evaluator expects them.
+    """
+
+    def __init__(self, defs: Sequence[RuleDef], settings: Dict[str, Any], version: str = ""):
+        self.version = version
+        self.settings = dict(settings)
+        self.names = [r.name for r in defs]
+        self.keys: List[str] = []
+        self._rules = []  # (name, all?, [(col, sign, thr, metric)], reason, actions)
+        t = resolve_thresholds(settings)
+        for r in defs:
+            conds = []
+            for c in r.conditions:
+                thr = _threshold(settings, t, c.threshold)
+                key = f"kpis_{c.metric}"
+                if key not in self.keys:
+                    self.keys.append(key)
+                conds.append((self.keys.index(key), 1.0 if c.direction == "up" else -1.0, thr, c.metric))
+            self._rules.append((r.name, r.combine != "any", conds, r.reason, list(r.actions)))
+        # flat arrays for the vectorized path
+        self._cols = np.array([c[0] for _, _, cs, _, _ in self._rules for c in cs], dtype=np.int64)
+        self._signs = np.array([c[1] for _, _, cs, _, _ in self._rules for c in cs], dtype=np.float64)
+        self._thr = np.array([c[2] for _, _, cs, _, _ in self._rules for c in cs], dtype=np.float64)
+        bounds, i = [], 0
+        for _, _, cs, _, _ in self._rules:
+            bounds.append((i, i + len(cs)))
+            i += len(cs)
+        self._bounds = bounds
+
+    # scalar ---------------------------------------------------------------
+    def _moves(self, latest: Dict[str, Any], base: Dict[str, float]) -> Tuple[List[float], List[float], List[float]]:
+        vals = [_flt(latest.get(k)) or 0.0 for k in self.keys]
+        bases = [base.get(k, 0.0) for k in self.keys]
+        return vals, bases, [pct_change(v, b) for v, b in zip(vals, bases)]
+
+    def _fired(self, deltas: List[float]) -> List[Tuple[int, List[bool]]]:
+        out = []
+        for i, (_, need_all, conds, _, _) in enumerate(self._rules):
+            hits = [sign * deltas[col] >= thr for col, sign, thr, _ in conds]
+            if all(hits) if need_all else any(hits):
+                out.append((i, hits))
+        return out
+
+    def _reason(self, i: int, hits: List[bool], vals, bases, deltas) -> str:
+        _, _, conds, template, _ = self._rules[i]
+        if template:
+            f = {}
+            for col, _, _, metric in conds:
+                f.update({metric: vals[col], f"b_{metric}": bases[col], f"d_{metric}": deltas[col],
+                          f"abs_d_{metric}": abs(deltas[col])})
+            try:
+                return template.format(**f)
+            except (KeyError, IndexError, ValueError):
+                pass  # bad template from settings: fall back to the generated text
+        parts = [f"{METRIC_LABELS[metric]} {'↑' if sign > 0 else '↓'} {abs(deltas[col]):.0f}% "
+                 f"(from {bases[col]:.2f} to {vals[col]:.2f})"
+                 for (col, sign, _, metric), hit in zip(conds, hits) if hit]
+        return " while ".join(parts) + " vs baseline."
+
+    def evaluate(self, latest: Dict[str, Any], base: Dict[str, float]) -> Tuple[bool, List[str], List[str]]:
+        """(is_fatigued, reasons[], actions[]) for one entity; reasons are only built for rules that fired."""
+        vals, bases, deltas = self._moves(latest, base)
+        fired = self._fired(deltas)
+        if not fired:
+            return False, [], []
+        reasons, actions = [], []
+        for i, hits in fired:
+            reasons.append(self._reason(i, hits, vals, bases, deltas))
+            actions += self._rules[i][4]
+        return True, reasons, actions
+
+    def detections(self, latest: Dict[str, Any], base: Dict[str, float]) -> List[Dict[str, Any]]:
+        """
+        The metrics behind each rule that fired, as {metric, value, baseline,
+        pct_change, threshold, severity, rules}; a metric shared by two rules
+        (CTR in A and C) is reported once.
+        """
+        vals, bases, deltas = self._moves(latest, base)
+        out: Dict[str, Dict[str, Any]] = {}
+        for i, hits in self._fired(deltas):
+            name, _, conds, _, _ = self._rules[i]
+            for (col, _, thr, metric), hit in zip(conds, hits):
+                if not hit:
+                    continue
+                if metric in out:
+                    out[metric]["rules"].append(name)
+                    continue
+                out[metric] = {"metric": metric, "value": vals[col], "baseline": round(bases[col], 6),
+                               "pct_change": round(deltas[col], 2), "threshold": thr,
+                               "severity": severity(deltas[col], thr), "rules": [name]}
+        return list(out.values())
+
+    # vectorized -----------------------------------------------------------
+    def masks(self, latest: np.ndarray, base: np.ndarray,
+              keys: Optional[Sequence[str]] = None) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        """
+        Boolean mask per rule (shape (E,)) from (E, K) latest / baseline arrays,
+        plus a mask of entities whose deltas are within float noise of a
+        threshold. Columns follow self.keys, or `keys` if the arrays use another order.
+        """
+        cols = self._cols
+        if keys is not None and list(keys) != self.keys:
+            missing = [k for k in self.keys if k not in keys]
+            if missing:
+                raise ValueError(f"rules need KPI columns {missing}")
+            cols = np.array([list(keys).index(self.keys[c]) for c in self._cols], dtype=np.int64)
+        e = latest.shape[0]
+        if not len(cols):
+            return {n: np.zeros(e, dtype=bool) for n in self.names}, np.zeros(e, dtype=bool)
+        moves = batch_pct_change(latest[:, cols], base[:, cols]) * self._signs
+        hits = moves >= self._thr
+        out = {}
+        for (name, need_all, _, _, _), (a, b) in zip(self._rules, self._bounds):
+            h = hits[:, a:b]
+            out[name] = h.all(axis=1) if need_all else h.any(axis=1)
+        near = (np.abs(moves - self._thr) <= 1e-9 * np.maximum(1.0, np.abs(moves))).any(axis=1)
+        return out, near
+
+    def fired_any(self, masks: Dict[str, np.ndarray], size: int) -> np.ndarray:
+        """Entities (of `size`) any rule fired for; all False when every rule is switched off."""
+        out = np.zeros(size, dtype=bool)
+        for m in masks.values():
+            out |= m
+        return out
+
+
+_compiled: "OrderedDict[Any, CompiledRules]" = OrderedDict()
+_compiled_lock = threading.Lock()
+_COMPILED_MAX = 64
+
+
+def compile_rules(settings: Optional[Dict[str, Any]] = None, version: Optional[str] = None) -> CompiledRules:
+    """
+    CompiledRules for a settings dict, cached by `version` (e.g. the Settings DB
+    version from settings_cache) or, without one, by the settings content.
+    """
+    settings = settings or {}
+    key = ("v", version) if version else ("s", tuple(sorted((k, str(v)) for k, v in settings.items())))
+    with _compiled_lock:
+        c = _compiled.get(key)
+        if c is not None:
+            _compiled.move_to_end(key)
+            return c
+    c = CompiledRules(rule_defs(settings), settings, version or "")
+    with _compiled_lock:
+        _compiled[key] = c
+        while len(_compiled) > _COMPILED_MAX:
+            _compiled.popitem(last=False)
+    return c
@@ -0,0 +1,61 @@
+# src/settings_cache.py
+# Local copy of each Notion Settings DB so runs do not re-read thresholds that
+# rarely change. A Settings DB is small, so revalidating is a single query that
+# returns the rows and their version (every row's id + last_edited_time) at once;
+# the copy on disk is only rewritten when that version changed.
+#   <DATA_DIR>/_state/notion_settings/<db_id>.json  {"version", "fetched_at", "settings"}
+#   NOTION_SETTINGS_FRESH    seconds a copy is trusted without revalidating (default 300)
+import os, time, threading
+from typing import Callable, Dict, Optional, Tuple
+
+from .storage import state_path, write_json_atomic, read_json
+
+
+class SettingsCache:
+    """
+    Settings of one database. `load(db_id)` returns (every key/value row, version).
+    """
+
+    def __init__(self, db_id: str, load: Callable[[str], Tuple[Dict[str, str], str]],
+                 path: Optional[str] = None, fresh_seconds: Optional[float] = None):
+        self.db_id = db_id
+        self.path = path or state_path("notion_settings", f"{db_id}.json")
+        self._load = load
+        self.fresh_seconds = float(os.getenv("NOTION_SETTINGS_FRESH", "300") if fresh_seconds is None else fresh_seconds)
+        self._lock = threading.Lock()
+        self._checked_at = 0.0  # last successful revalidation in this process
+        self.data = read_json(self.path)
+
+    def cached(self) -> Optional[Tuple[Dict[str, str], str]]:
+        """Whatever copy is held, without any Notion call (None if there is none)."""
+        if not self.data:
+            return None
+        return self.data.get("settings", {}), self.data.get("version", "")
+
+    def get(self, force: bool = False) -> Tuple[Dict[str, str], str]:
+        """(settings, version); raises if Notion cannot be reached and a revalidation is due."""
+        with self._lock:
+            if self.data and not force and self._checked_at \
+                    and time.monotonic() - self._checked_at < self.fresh_seconds:
+                return self.data["settings"], self.data["version"]
+            settings, version = self._load(self.db_id)
+            self._checked_at = time.monotonic()
+            if self.data and version == self.data.get("version"):
+                return self.data["settings"], version
+            self.data = {"db_id": self.db_id, "version": version, "fetched_at": time.time(), "settings": settings}
+            write_json_atomic(self.data, self.path)
+            print(f"[Notion] settings refreshed for {self.db_id}: {len(settings)} keys")
+            return settings, version
+
+
+_caches: Dict[str, SettingsCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_settings_cache(db_id: str, load: Callable[[str], Tuple[Dict[str, str], str]]) -> SettingsCache:
+    """Shared SettingsCache per database for this process."""
+    with _caches_lock:
+        c = _caches.get(db_id)
+        if c is None:
+            c = _caches[db_id] = SettingsCache(db_id, load)
+        return c
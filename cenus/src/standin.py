@@ -0,0 +1,515 @@
+# src/standin.py
+# Local stand-ins for every upstream, so concurrency, retries and throughput can
+# be exercised offline. One HTTP server, one path prefix per service:
+#   /graph/<version>/<act_id>/insights        GET (cursor paging), POST -> async report run
+#   /graph/<version>/<report_run_id>[/insights]
+#   /notion/v1/databases[/<id>[/query]]       POST / GET / PATCH, query paginated
+#   /notion/v1/pages[/<id>]                   POST / GET / PATCH (in-memory store)
+#   /slack/<anything>                         incoming-webhook POST -> "ok"
+#   /_stats                                   GET: per-service request counters
+# Point the clients at it with META_GRAPH_BASE=<url>/graph, NOTION_API_BASE=
+# <url>/notion/v1 and a webhook of <url>/slack/<name> (see env()).
+# Insights come from src/synth.py: client c is act_<900000 + c>, adset / campaign
+# rows are rolled up from its ads. Every service has its own Faults: latency,
+# injected 5xx rate and a token-bucket rate limit (per ad account / integration /
+# webhook) answered the way the real service does -- Graph with a throttling
+# error code, Notion and Slack with 429 -- plus Retry-After.
+#   s = StandIn(SynthSpec(clients=3, ads=500), {"graph": Faults(latency_ms=80, rps=20)}).start()
+#   os.environ.update(s.env()); ...; s.stop()
+import json, time, uuid, base64, random, datetime, threading
+from collections import Counter
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from .synth import SynthSpec, Synth, generate
+from .rollup import rollup_rows
+from .ratelimit import TokenBucket
+
+SERVICES = ("graph", "notion", "slack")
+ACCOUNT_BASE = 900000          # Synth.client(c)["ad_account_id"] == f"act_{ACCOUNT_BASE + c}"
+GRAPH_THROTTLE_CODE = 80000    # ads insights rate limit (graph.THROTTLE_CODES)
+NOTION_MAX_PAGE_SIZE = 100
+
+
+@dataclass
+class Faults:
+    latency_ms: float = 0.0    # added to every request
+    jitter_ms: float = 0.0     # +/- uniform around latency_ms
+    error_rate: float = 0.0    # share of requests answered with a 5xx
+    rps: float = 0.0           # allowed requests/s per key; 0 = unlimited
+    burst: float = 0.0         # bucket size (default: rps)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _now_iso() -> str:
+    return datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def _cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(str(offset).encode()).decode()
+
+
+def _offset(cursor: Optional[str]) -> int:
+    if not cursor:
+        return 0
+    try:
+        return max(0, int(base64.urlsafe_b64decode(cursor.encode()).decode()))
+    except (ValueError, UnicodeDecodeError):
+        return 0
+
+
+def _with_plain_text(props: Dict[str, Any]) -> Dict[str, Any]:
+    """Properties as Notion returns them: title / rich_text parts carry plain_text."""
+    out = {}
+    for name, prop in (props or {}).items():
+        if isinstance(prop, dict):
+            prop = dict(prop)
+            for kind in ("title", "rich_text"):
+                if isinstance(prop.get(kind), list):
+                    prop[kind] = [dict(p, plain_text=p.get("plain_text", (p.get("text") or {}).get("content", "")))
+                                  for p in prop[kind] if isinstance(p, dict)]
+        out[name] = prop
+    return out
+
+
+class StandIn:
+    """
+    The stand-in server (see module comment). start() serves on a background
+    thread; port 0 picks a free port (read .url afterwards).
+    """
+
+    def __init__(self, spec: Optional[SynthSpec] = None, faults: Optional[Dict[str, Faults]] = None,
+                 host: str = "127.0.0.1", port: int = 0, page_size: int = 500, seed: int = 0):
+        self.spec = spec or SynthSpec()
+        self.faults = {s: (faults or {}).get(s) or Faults() for s in SERVICES}
+        self.host, self.port = host, port
+        self.page_size = page_size
+        self._synth: Optional[Synth] = None
+        self._rows: Dict[Tuple[int, str], List[Dict[str, Any]]] = {}
+        self._runs: Dict[str, Tuple[int, str, str, str]] = {}      # report_run_id -> (client, level, since, until)
+        self._dbs: Dict[str, Dict[str, Any]] = {}
+        self._pages: Dict[str, Dict[str, Any]] = {}
+        self._db_pages: Dict[str, List[str]] = {}
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._stats = {s: Counter() for s in SERVICES}
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # --- lifecycle ---
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def env(self) -> Dict[str, str]:
+        """Environment that points meta_client / notion / alerts at this server."""
+        return {"META_GRAPH_BASE": f"{self.url}/graph", "NOTION_API_BASE": f"{self.url}/notion/v1",
+                "SLACK_WEBHOOK_URL": self.webhook("default"),
+                "FB_ACCESS_TOKEN": "standin", "NOTION_TOKEN": "standin"}
+
+    def webhook(self, name: str) -> str:
+        return f"{self.url}/slack/{name}"
+
+    @property
+    def synth(self) -> Synth:
+        with self._lock:
+            if self._synth is None:
+                self._synth = generate(self.spec)
+            return self._synth
+
+    def start(self) -> "StandIn":
+        self.synth  # generate up front, not inside the first request
+        handler = type("StandInHandler", (_Handler,), {"standin": self})
+        self._httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="standin", daemon=True)
+        self._thread.start()
+        print(f"[StandIn] serving on {self.url}")
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"faults": {s: f.to_dict() for s, f in self.faults.items()},
+                    "services": {s: dict(c) for s, c in self._stats.items()},
+                    "notion": {"databases": len(self._dbs), "pages": len(self._pages)}}
+
+    def count(self, service: str, key: str, n: int = 1):
+        with self._lock:
+            self._stats[service][key] += n
+
+    # --- faults ---
+    def delay(self, service: str):
+        f = self.faults[service]
+        ms = f.latency_ms + (self._rng.uniform(-f.jitter_ms, f.jitter_ms) if f.jitter_ms else 0.0)
+        if ms > 0:
+            time.sleep(ms / 1000.0)
+
+    def throttle(self, service: str, key: str) -> float:
+        """0.0 when the request may proceed, else the Retry-After seconds."""
+        f = self.faults[service]
+        if f.rps <= 0:
+            return 0.0
+        with self._lock:
+            bucket = self._buckets.get((service, key))
+            if bucket is None:
+                bucket = self._buckets[(service, key)] = TokenBucket(f.rps, burst=f.burst or f.rps)
+        return bucket.try_acquire()
+
+    def fail(self, service: str) -> bool:
+        return self.faults[service].error_rate > 0 and self._rng.random() < self.faults[service].error_rate
+
+    # --- Graph ---
+    def client_index(self, act_id: str) -> Optional[int]:
+        try:
+            c = int(act_id[len("act_"):]) - ACCOUNT_BASE
+        except ValueError:
+            return None
+        return c if act_id.startswith("act_") and 0 <= c < self.spec.clients else None
+
+    def insights(self, c: int, level: str, since: Optional[str], until: Optional[str]) -> List[Dict[str, Any]]:
+        """Daily rows of client c at `level` within [since, until] (all days when unset)."""
+        key = (c, level)
+        with self._lock:
+            rows = self._rows.get(key)
+        if rows is None:
+            ads = self._rows.get((c, "ad")) or list(self.synth.graph_rows(c))
+            rows = ads if level == "ad" else rollup_rows(ads, level)
+            if level != "ad":
+                _parent_reach(ads, rows, level)
+            for r in rows:
+                r.pop("rolled_up_from", None)
+            with self._lock:
+                self._rows.setdefault((c, "ad"), ads)
+                rows = self._rows.setdefault(key, rows)
+        since, until = since or "0000-00-00", until or "9999-99-99"
+        return [r for r in rows if since <= r["date_start"] <= until]
+
+    def graph_key(self, obj: str) -> str:
+        """Rate-limit key of a Graph object: its ad account (report runs included), else the app."""
+        run = self.run(obj)
+        if run is not None:
+            return f"act_{ACCOUNT_BASE + run[0]}"
+        return obj if obj.startswith("act_") else "app"
+
+    def submit_run(self, c: int, level: str, since: str, until: str) -> str:
+        run_id = str(self._rng.randrange(10 ** 15, 10 ** 16))
+        with self._lock:
+            self._runs[run_id] = (c, level, since, until)
+        return run_id
+
+    def run(self, run_id: str) -> Optional[Tuple[int, str, str, str]]:
+        with self._lock:
+            return self._runs.get(run_id)
+
+    # --- Notion ---
+    def database(self, db_id: str, create: bool = True) -> Optional[Dict[str, Any]]:
+        """A database by id; unknown ids are created empty (synthetic clients never set them up)."""
+        with self._lock:
+            db = self._dbs.get(db_id)
+            if db is None and create:
+                ts = _now_iso()
+                db = self._dbs[db_id] = {"object": "database", "id": db_id, "title": [], "properties": {},
+                                         "created_time": ts, "last_edited_time": ts}
+                self._db_pages[db_id] = []
+            return db
+
+    def create_database(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        db = self.database(str(uuid.uuid4()))
+        with self._lock:
+            db.update(title=body.get("title") or [], parent=body.get("parent"),
+                      properties=dict(body.get("properties") or {}))
+            return dict(db)
+
+    def patch_database(self, db_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        db = self.database(db_id)
+        with self._lock:
+            db["properties"].update(body.get("properties") or {})
+            db["last_edited_time"] = _now_iso()
+            return dict(db)
+
+    def query(self, db_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Paginated rows of a database; honours created/last_edited_time sorts and equality filters."""
+        self.database(db_id)
+        flt = body.get("filter")
+        with self._lock:
+            pages = [self._pages[p] for p in self._db_pages[db_id] if not self._pages[p].get("archived")]
+            if flt:
+                pages = [p for p in pages if _matches(p["properties"], flt)]
+        for s in reversed(body.get("sorts") or []):
+            if s.get("timestamp") in ("created_time", "last_edited_time"):
+                pages.sort(key=lambda p, k=s["timestamp"]: (p[k], p["_seq"]),
+                           reverse=s.get("direction") == "descending")
+        size = min(NOTION_MAX_PAGE_SIZE, int(body.get("page_size") or NOTION_MAX_PAGE_SIZE))
+        start = _offset(body.get("start_cursor"))
+        chunk = pages[start:start + size]
+        more = start + size < len(pages)
+        return {"object": "list", "results": [self._public(p) for p in chunk],
+                "has_more": more, "next_cursor": _cursor(start + size) if more else None}
+
+    def create_page(self, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        db_id = (body.get("parent") or {}).get("database_id")
+        if not db_id:
+            return None
+        self.database(db_id)
+        ts = _now_iso()
+        with self._lock:
+            page = {"object": "page", "id": str(uuid.uuid4()), "created_time": ts, "last_edited_time": ts,
+                    "archived": False, "parent": {"type": "database_id", "database_id": db_id},
+                    "properties": _with_plain_text(body.get("properties")), "_seq": len(self._pages)}
+            self._pages[page["id"]] = page
+            self._db_pages[db_id].append(page["id"])
+            return self._public(page)
+
+    def get_page(self, page_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            page = self._pages.get(page_id)
+            return self._public(page) if page else None
+
+    def patch_page(self, page_id: str, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            page = self._pages.get(page_id)
+            if page is None:
+                return None
+            page["properties"].update(_with_plain_text(body.get("properties")))
+            if "archived" in body:
+                page["archived"] = bool(body["archived"])
+            page["last_edited_time"] = _now_iso()
+            return self._public(page)
+
+    @staticmethod
+    def _public(page: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in page.items() if not k.startswith("_")}
+
+
+def _parent_reach(ads: List[Dict[str, Any]], rows: List[Dict[str, Any]], level: str):
+    """
+    Reach / frequency of rolled-up rows, which rollup leaves to Meta. Synthetic
+    audiences do not overlap, so a parent's reach is its ads' summed reach.
+    """
+    reach: Counter = Counter()
+    for a in ads:
+        reach[(a["date_start"], a.get(f"{level}_id"))] += int(a.get("reach") or 0)
+    for r in rows:
+        n = reach[(r["date_start"], r[f"{level}_id"])]
+        r["reach"], r["frequency"] = n, (float(r["impressions"]) / n if n else None)
+
+
+def _prop_value(prop: Optional[Dict[str, Any]]) -> str:
+    if not prop:
+        return ""
+    for kind in ("title", "rich_text"):
+        if kind in prop:
+            return "".join(p.get("plain_text", "") for p in prop.get(kind) or [])
+    if "select" in prop:
+        return (prop.get("select") or {}).get("name", "")
+    if "date" in prop:
+        return ((prop.get("date") or {}).get("start") or "")[:10]
+    return ""
+
+
+def _matches(props: Dict[str, Any], flt: Dict[str, Any]) -> bool:
+    """A database query filter: and / or compounds of equals / is_empty conditions (others pass)."""
+    if "and" in flt:
+        return all(_matches(props, f) for f in flt["and"])
+    if "or" in flt:
+        return any(_matches(props, f) for f in flt["or"])
+    value = _prop_value(props.get(flt.get("property")))
+    for kind in ("title", "rich_text", "select", "date"):
+        cond = flt.get(kind)
+        if cond is None:
+            continue
+        if "equals" in cond:
+            want = str(cond["equals"])
+            return value == (want[:10] if kind == "date" else want)
+        if cond.get("is_empty"):
+            return not value
+    return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    standin: StandIn
+    protocol_version = "HTTP/1.1"  # keep-alive, so client connection pools behave as in production
+
+    def log_message(self, fmt, *args):
+        pass
+
+    # --- plumbing ---
+    def _send(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None):
+        data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain" if isinstance(body, str) else "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> Dict[str, Any]:
+        n = int(self.headers.get("Content-Length") or 0)
+        if not n:
+            return {}
+        try:
+            return json.loads(self.rfile.read(n) or b"{}")
+        except ValueError:
+            return {}
+
+    def _dispatch(self, method: str):
+        parts = urlsplit(self.path)
+        segs = [s for s in parts.path.split("/") if s]
+        query = dict(parse_qsl(parts.query))
+        body = self._body() if method in ("POST", "PATCH") else {}
+        if segs == ["_stats"]:
+            return self._send(200, self.standin.stats())
+        service = segs[0] if segs and segs[0] in SERVICES else None
+        if service is None:
+            return self._send(404, {"error": f"no stand-in at {parts.path}"})
+        si = self.standin
+        si.count(service, "requests")
+        si.delay(service)
+
+        key = "integration"
+        if service == "graph":
+            key = si.graph_key(segs[2] if len(segs) > 2 else "")
+        elif service == "slack":
+            key = parts.path
+        wait = si.throttle(service, key)
+        if wait:
+            si.count(service, "throttled")
+            return self._throttled(service, wait)
+        if si.fail(service):
+            si.count(service, "errors_injected")
+            return self._error(service)
+
+        route = {"graph": self._graph, "notion": self._notion, "slack": self._slack}[service]
+        route(method, segs[1:], query, body)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def _throttled(self, service: str, wait: float):
+        headers = {"Retry-After": f"{max(1, round(wait + 0.5))}" if service == "slack" else f"{wait:.3f}"}
+        if service == "graph":
+            return self._send(400, {"error": {"message": "User request limit reached", "type": "OAuthException",
+                                              "code": GRAPH_THROTTLE_CODE}}, headers)
+        if service == "notion":
+            return self._send(429, {"object": "error", "status": 429, "code": "rate_limited",
+                                    "message": "You have been rate limited."}, headers)
+        return self._send(429, "rate_limited", headers)
+
+    def _error(self, service: str):
+        if service == "graph":
+            return self._send(500, {"error": {"message": "An unexpected error has occurred.",
+                                              "type": "OAuthException", "code": 2, "is_transient": True}})
+        if service == "notion":
+            return self._send(502, {"object": "error", "status": 502, "code": "service_unavailable",
+                                    "message": "Injected failure"})
+        return self._send(500, "internal_error")
+
+    # --- Graph ---
+    def _graph_error(self, message: str, code: int = 100):
+        self.standin.count("graph", "bad_requests")
+        return self._send(400, {"error": {"message": message, "type": "GraphMethodException", "code": code}})
+
+    def _graph(self, method: str, segs: List[str], query: Dict[str, str], body: Dict[str, Any]):
+        si = self.standin
+        obj, edge = (segs[1] if len(segs) > 1 else ""), (segs[2] if len(segs) > 2 else "")
+        run = si.run(obj)
+        if run is not None:
+            if method == "GET" and not edge:
+                return self._send(200, {"id": obj, "async_status": "Job Completed", "async_percent_completion": 100})
+            if method == "GET" and edge == "insights":
+                return self._insights_page(si.insights(*run), query)
+            return self._graph_error(f"Unsupported {method.lower()} request")
+        c = si.client_index(obj)
+        if c is None or edge != "insights":
+            return self._graph_error(f"Unsupported {method.lower()} request. Object with ID '{obj}' does not exist")
+        try:
+            tr = json.loads(query.get("time_range") or "{}")
+        except ValueError:
+            return self._graph_error("Invalid parameter time_range")
+        level = query.get("level") or "ad"
+        if level not in ("ad", "adset", "campaign"):
+            return self._graph_error(f"Invalid parameter level={level}")
+        if method == "POST":
+            si.count("graph", "report_runs")
+            return self._send(200, {"report_run_id": si.submit_run(c, level, tr.get("since"), tr.get("until"))})
+        return self._insights_page(si.insights(c, level, tr.get("since"), tr.get("until")), query)
+
+    def _insights_page(self, rows: List[Dict[str, Any]], query: Dict[str, str]):
+        size = min(self.standin.page_size, int(query.get("limit") or 25))
+        start = _offset(query.get("after"))
+        page = rows[start:start + size]
+        self.standin.count("graph", "rows", len(page))
+        out: Dict[str, Any] = {"data": page, "paging": {"cursors": {"before": _cursor(start),
+                                                                    "after": _cursor(start + len(page))}}}
+        if start + size < len(rows):
+            nxt = dict(query, after=_cursor(start + size))
+            out["paging"]["next"] = f"http://{self.headers.get('Host')}{urlsplit(self.path).path}?{urlencode(nxt)}"
+        return self._send(200, out)
+
+    # --- Notion ---
+    def _not_found(self, what: str):
+        self.standin.count("notion", "not_found")
+        return self._send(404, {"object": "error", "status": 404, "code": "object_not_found",
+                                "message": f"Could not find {what}."})
+
+    def _notion(self, method: str, segs: List[str], query: Dict[str, str], body: Dict[str, Any]):
+        si = self.standin
+        segs = segs[1:] if segs[:1] == ["v1"] else segs
+        kind, oid, edge = (segs + ["", "", ""])[:3]
+        if kind == "databases":
+            if method == "POST" and not oid:
+                si.count("notion", "databases_created")
+                return self._send(200, si.create_database(body))
+            if method == "POST" and edge == "query":
+                si.count("notion", "queries")
+                return self._send(200, si.query(oid, body))
+            if method == "GET" and oid:
+                return self._send(200, si.database(oid))
+            if method == "PATCH" and oid:
+                return self._send(200, si.patch_database(oid, body))
+        elif kind == "pages":
+            if method == "POST" and not oid:
+                page = si.create_page(body)
+                if page is None:
+                    return self._send(400, {"object": "error", "status": 400, "code": "validation_error",
+                                            "message": "body.parent.database_id should be defined"})
+                si.count("notion", "pages_created")
+                return self._send(200, page)
+            if method in ("GET", "PATCH") and oid:
+                page = si.get_page(oid) if method == "GET" else si.patch_page(oid, body)
+                if page is None:
+                    return self._not_found(f"page with ID: {oid}")
+                if method == "PATCH":
+                    si.count("notion", "pages_updated")
+                return self._send(200, page)
+        return self._send(400, {"object": "error", "status": 400, "code": "invalid_request_url",
+                                "message": "Invalid request URL."})
+
+    # --- Slack ---
+    def _slack(self, method: str, segs: List[str], query: Dict[str, str], body: Dict[str, Any]):
+        if method != "POST":
+            return self._send(405, "invalid_method")
+        if not body.get("text") and not body.get("blocks"):
+            return self._send(400, "no_text")
+        self.standin.count("slack", "messages")
+        self.standin.count("slack", "blocks", len(body.get("blocks") or []))
+        return self._send(200, "ok")
@@ -1,29 +1,107 @@
 # src/storage.py
 import os, json, csv, datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional, Sequence
+
+# Root for local data (per-run pulls, sync caches, state files)
+DATA_DIR = os.getenv("CENUS_DATA_DIR", "data")
 
 def _ensure_dir(path: str):
-    os.makedirs(path, exist_ok=True)
+    if path:  # "" for a bare filename in the cwd
+        os.makedirs(path, exist_ok=True)
+
+def state_path(*parts: str) -> str:
+    """Path under <DATA_DIR>/_state/ for small persistent state files."""
+    return os.path.join(DATA_DIR, "_state", *parts)
+
+def write_json_atomic(obj: Any, out_path: str):
+    _ensure_dir(os.path.dirname(out_path))
+    tmp = out_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, out_path)
+
+def read_json(path: str, default: Any = None) -> Any:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return default
 
 def ts_now_iso() -> str:
     return datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
 
-def save_jsonl(records: List[Dict[str, Any]], out_path: str):
+def save_jsonl(records: Iterable[Dict[str, Any]], out_path: str):
     _ensure_dir(os.path.dirname(out_path))
     with open(out_path, "w", encoding="utf-8") as f:
         for r in records:
             f.write(json.dumps(r, ensure_ascii=False) + "\n")
 
-def save_csv(records: List[Dict[str, Any]], out_path: str):
-    _ensure_dir(os.path.dirname(out_path))
-    if not records:
-        with open(out_path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(["timestamp"])
-        return
-    keys = sorted({k for r in records for k in r.keys()})
-    with open(out_path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=keys)
-        writer.writeheader()
+def save_csv(records: Iterable[Dict[str, Any]], out_path: str, fieldnames: Optional[Sequence[str]] = None):
+    """
+    Without `fieldnames` the header is the union of all record keys (needs a full
+    pass over a list). With a declared schema the records are streamed.
+    """
+    if fieldnames is None:
+        records = list(records)
+        fieldnames = sorted({k for r in records for k in r.keys()})
+    with KpiWriter(None, out_path, fieldnames) as w:
+        for r in records:
+            w.write(r)
+
+
+class KpiWriter:
+    """
+    Incremental JSONL + CSV writer: one record in, one line out to each file.
+    The CSV header comes from the declared `fieldnames`, so nothing is buffered.
+    Files are written to *.tmp and moved into place on a clean close.
+    Either path may be None to skip that format.
+    """
+
+    def __init__(self, jsonl_path: Optional[str], csv_path: Optional[str], fieldnames: Sequence[str]):
+        self.jsonl_path = jsonl_path
+        self.csv_path = csv_path
+        self.fieldnames = list(fieldnames)
+        self.count = 0
+        self._jf = self._cf = self._csv = None
+
+    def __enter__(self):
+        if self.jsonl_path:
+            _ensure_dir(os.path.dirname(self.jsonl_path))
+            self._jf = open(self.jsonl_path + ".tmp", "w", encoding="utf-8")
+        if self.csv_path:
+            _ensure_dir(os.path.dirname(self.csv_path))
+            self._cf = open(self.csv_path + ".tmp", "w", newline="", encoding="utf-8")
+            self._csv = csv.DictWriter(self._cf, fieldnames=self.fieldnames)
+        return self
+
+    def write(self, r: Dict[str, Any]):
+        if self._jf:
+            self._jf.write(json.dumps(r, ensure_ascii=False) + "\n")
+        if self._csv:
+            if not self.count:
+                self._csv.writeheader()
+            self._csv.writerow(r)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._csv and not self.count:
+            # same placeholder header the list-based save_csv always wrote for empty pulls
+            csv.writer(self._cf).writerow(["timestamp"])
+        for f, path in ((self._jf, self.jsonl_path), (self._cf, self.csv_path)):
+            if f is None:
+                continue
+            f.close()
+            if exc_type is None:
+                os.replace(path + ".tmp", path)
+            else:
+                os.remove(path + ".tmp")
+        return False
+
+
+def stream_records(records: Iterable[Dict[str, Any]], jsonl_path: Optional[str], csv_path: Optional[str],
+                   fieldnames: Sequence[str]) -> int:
+    """Write a record stream to JSONL and/or CSV in one pass; returns the count."""
+    with KpiWriter(jsonl_path, csv_path, fieldnames) as w:
         for r in records:
-            writer.writerow(r)
+            w.write(r)
+    return w.count
@@ -0,0 +1,140 @@
+# src/sync.py
+# Incremental insights sync: remember how far each account/level has been pulled
+# (its high-water mark) and only ask Meta for the days we do not have yet, plus a
+# short restatement lookback for late attribution updates.
+import os, datetime, threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .storage import state_path, write_json_atomic, read_json, ts_now_iso
+from .meta_client import fetch_insights_for_account, to_fatigue_row
+from .history import HistoryStore
+
+# one lock for every WatermarkStore: parallel pulls share the same file
+_lock = threading.Lock()
+
+Fetch = Callable[[str, str, str, str], List[Dict[str, Any]]]
+
+
+def _d(s: str) -> datetime.date:
+    return datetime.date.fromisoformat(s)
+
+
+def _s(d: datetime.date) -> str:
+    return d.strftime("%Y-%m-%d")
+
+
+def _days(since: str, until: str) -> List[str]:
+    d0, d1 = _d(since), _d(until)
+    return [_s(d0 + datetime.timedelta(days=i)) for i in range((d1 - d0).days + 1)]
+
+
+def default_lookback() -> int:
+    return int(os.getenv("SYNC_LOOKBACK_DAYS", "2"))
+
+
+class WatermarkStore:
+    """
+    {"<account>|<level>": {"until": "YYYY-MM-DD", "synced_at": iso}} in one JSON file.
+    `until` is the last date fully synced for that account/level.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or state_path("watermarks.json")
+
+    @staticmethod
+    def _key(account_id: str, level: str) -> str:
+        return f"{account_id}|{level}"
+
+    def get(self, account_id: str, level: str) -> Optional[str]:
+        entry = (read_json(self.path, {}) or {}).get(self._key(account_id, level))
+        return entry.get("until") if entry else None
+
+    def set(self, account_id: str, level: str, until: str):
+        with _lock:
+            data = read_json(self.path, {}) or {}
+            data[self._key(account_id, level)] = {"until": until, "synced_at": ts_now_iso()}
+            write_json_atomic(data, self.path)
+
+    def advance(self, account_id: str, level: str, until: str):
+        """Move the watermark forward to `until` (never backwards)."""
+        with _lock:
+            data = read_json(self.path, {}) or {}
+            cur = (data.get(self._key(account_id, level)) or {}).get("until")
+            if cur and _d(cur) >= _d(until):
+                return
+            data[self._key(account_id, level)] = {"until": until, "synced_at": ts_now_iso()}
+            write_json_atomic(data, self.path)
+
+    def reset(self, account_id: str, level: str):
+        with _lock:
+            data = read_json(self.path, {}) or {}
+            data.pop(self._key(account_id, level), None)
+            write_json_atomic(data, self.path)
+
+
+def plan_fetch(since: str, until: str, watermark: Optional[str], lookback_days: int,
+               missing: Optional[List[str]] = None) -> Optional[Tuple[str, str]]:
+    """
+    Date range to request from Meta for the window since..until, or None if the
+    local copy is complete. Everything after the watermark is fetched, plus the
+    last `lookback_days` before it (restatements), plus any locally missing day.
+    """
+    if watermark is None or _d(watermark) < _d(since):
+        return since, until
+    if _d(watermark) >= _d(until) and not missing:
+        return None
+    start = _d(watermark) + datetime.timedelta(days=1 - max(0, lookback_days))
+    if missing:
+        start = min(start, _d(min(missing)))
+    start = max(start, _d(since))
+    return _s(start), until
+
+
+def restates(account_id: str, level: str, since: str, watermarks: Optional[WatermarkStore] = None) -> bool:
+    """
+    True if a pull starting at `since` re-reads days already synced for the
+    account/level (the restatement lookback). Those days must come from Meta,
+    not from the insights cache, or late attribution changes are missed.
+    """
+    wm = (watermarks or WatermarkStore()).get(account_id, level)
+    return bool(wm) and _d(since) <= _d(wm)
+
+
+def plan_sync(account_id: str, level: str, since: str, until: str, history: HistoryStore,
+              lookback_days: Optional[int] = None,
+              watermarks: Optional[WatermarkStore] = None) -> Optional[Tuple[str, str]]:
+    """plan_fetch for an account/level against its watermark and local history."""
+    lookback_days = default_lookback() if lookback_days is None else lookback_days
+    wm = (watermarks or WatermarkStore()).get(account_id, level)
+    missing = [d for d in _days(since, min(until, wm)) if not history.has(level, d)] if wm else None
+    return plan_fetch(since, until, wm, lookback_days, missing)
+
+
+def sync_insights(account_id: str, level: str, since: str, until: str, history: HistoryStore,
+                  lookback_days: Optional[int] = None, fetch: Optional[Fetch] = None,
+                  watermarks: Optional[WatermarkStore] = None) -> List[Dict[str, Any]]:
+    """
+    Fatigue rows (see meta_client.to_fatigue_row) for since..until from the client's
+    HistoryStore, fetching from Meta only what it is missing.
+    `fetch(account, level, since, until)` returns raw insights rows
+    (default: fetch_insights_for_account, bypassing the insights cache: the
+    planned range holds the lookback days, which are re-read for restatements).
+    """
+    fetch = fetch or (lambda a, l, s, u: fetch_insights_for_account(a, level=l, since=s, until=u, cache=False))
+    watermarks = watermarks or WatermarkStore()
+
+    wm = watermarks.get(account_id, level)
+    plan = plan_sync(account_id, level, since, until, history, lookback_days, watermarks)
+
+    if plan is None:
+        print(f"[Sync] {account_id} level={level}: {since}..{until} served locally (watermark {wm})")
+    else:
+        f_since, f_until = plan
+        print(f"[Sync] {account_id} level={level}: fetching {f_since}..{f_until} (watermark {wm or '-'})")
+        # every day in the range is written, empty ones included, so they count as synced
+        with history.ingest(level, f_since, f_until) as ing:
+            for raw in fetch(account_id, level, f_since, f_until):
+                ing.add(to_fatigue_row(raw, level))
+        watermarks.advance(account_id, level, f_until)
+
+    return history.read_range(level, since, until)
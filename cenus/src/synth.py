@@ -0,0 +1,160 @@
+# src/synth.py
+# Synthetic ad-level insights at production scale: N clients x M ads x D days,
+# generated as numpy arrays in one shot, with fatigue injected into a chosen
+# share of ads over the last days of the range. Used by scripts/benchmark.py and
+# for offline runs; rows come out in the raw Graph shape (graph_rows) or the
+# fatigue-row shape (fatigue_rows), one client at a time.
+#   s = generate(SynthSpec(clients=5, ads=2000, days=30, fatigue_rate=0.05))
+#   for r in s.graph_rows(0): ...
+import datetime
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+# counters generated per (client, ad, day); ratios are derived from them
+COUNTERS = ("impressions", "reach", "clicks", "spend", "results", "revenue")
+
+
+@dataclass
+class SynthSpec:
+    clients: int = 1
+    ads: int = 100
+    days: int = 14
+    end: Optional[str] = None         # last day, YYYY-MM-DD (default: yesterday)
+    ads_per_adset: int = 5
+    adsets_per_campaign: int = 4
+    fatigue_rate: float = 0.1         # share of ads that fatigue
+    fatigue_days: int = 3             # fatigue ramps in over this many final days
+    fatigue_strength: float = 1.0     # 1.0 ~ clearly past the default thresholds
+    noise: float = 0.08               # day-to-day lognormal sigma
+    seed: int = 7
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class Synth:
+    """Generated arrays (shape (clients, ads, days)) plus the ids/dates to render rows."""
+
+    def __init__(self, spec: SynthSpec, arrays: Dict[str, np.ndarray], fatigued: np.ndarray, dates: List[str]):
+        self.spec = spec
+        self.arrays = arrays
+        self.fatigued = fatigued      # (clients, ads) bool
+        self.dates = dates
+
+    @property
+    def n_rows(self) -> int:
+        return self.spec.clients * self.spec.ads * self.spec.days
+
+    def client(self, c: int) -> Dict[str, Any]:
+        """A clients.json-style entry for client `c`."""
+        return {"client_name": f"Synth Client {c:03d}", "ad_account_id": f"act_{900000 + c}",
+                "notion_db_id": f"synth-db-{c:03d}"}
+
+    def ids(self, c: int, a: int) -> Dict[str, str]:
+        s = self.spec
+        adset = a // s.ads_per_adset
+        campaign = adset // s.adsets_per_campaign
+        return {"ad_id": f"{c:03d}{a:07d}", "ad_name": f"Ad {c}-{a}",
+                "adset_id": f"{c:03d}5{adset:06d}", "adset_name": f"Adset {c}-{adset}",
+                "campaign_id": f"{c:03d}9{campaign:06d}", "campaign_name": f"Campaign {c}-{campaign}"}
+
+    def _columns(self, c: int) -> Dict[str, List[List[float]]]:
+        a = {k: v[c] for k, v in self.arrays.items()}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            derived = {
+                "ctr": np.where(a["impressions"] > 0, a["clicks"] / a["impressions"] * 100.0, 0.0),
+                "cpm": np.where(a["impressions"] > 0, a["spend"] / a["impressions"] * 1000.0, 0.0),
+                "cpc": np.where(a["clicks"] > 0, a["spend"] / a["clicks"], 0.0),
+                "frequency": np.where(a["reach"] > 0, a["impressions"] / a["reach"], 0.0),
+                "roas": np.where(a["spend"] > 0, a["revenue"] / a["spend"], 0.0),
+            }
+        a.update(derived)
+        return {k: np.round(v, 6).tolist() for k, v in a.items()}
+
+    def graph_rows(self, c: int) -> Iterator[Dict[str, Any]]:
+        """Raw ad-level insights rows for client `c` (strings, as Graph returns them), day by day."""
+        col = self._columns(c)
+        ids = [self.ids(c, a) for a in range(self.spec.ads)]
+        for d, day in enumerate(self.dates):
+            for a, ent in enumerate(ids):
+                row = {"date_start": day, "date_stop": day}
+                row.update(ent)
+                row.update({
+                    "impressions": str(int(col["impressions"][a][d])),
+                    "reach": str(int(col["reach"][a][d])),
+                    "clicks": str(int(col["clicks"][a][d])),
+                    "spend": f"{col['spend'][a][d]:.2f}",
+                    "ctr": str(col["ctr"][a][d]),
+                    "cpm": str(col["cpm"][a][d]),
+                    "cpc": str(col["cpc"][a][d]),
+                    "frequency": str(col["frequency"][a][d]),
+                    "roas": [{"action_type": "omni_purchase", "value": str(col["roas"][a][d])}],
+                    "results": [{"indicator": "actions:offsite_conversion.fb_pixel_purchase",
+                                 "values": [{"value": str(int(col["results"][a][d]))}]}],
+                    "actions": [{"action_type": "link_click", "value": str(int(col["clicks"][a][d]))}],
+                })
+                yield row
+
+    def fatigue_rows(self, c: int, level: str = "ad") -> Iterator[Dict[str, Any]]:
+        """Ad-level rows in the meta_client.to_fatigue_row shape for client `c`."""
+        col = self._columns(c)
+        for a in range(self.spec.ads):
+            ent = self.ids(c, a)
+            for d, day in enumerate(self.dates):
+                yield {
+                    "timestamp": day, "level": level, "name": ent["ad_name"], "ad_id": ent["ad_id"],
+                    "adset_id": ent["adset_id"], "campaign_id": ent["campaign_id"],
+                    "kpis_ctr": col["ctr"][a][d], "kpis_roas": col["roas"][a][d],
+                    "kpis_cpm": col["cpm"][a][d], "kpis_cpc": col["cpc"][a][d],
+                    "kpis_frequency": col["frequency"][a][d],
+                    "kpis_impressions": col["impressions"][a][d], "kpis_spend": col["spend"][a][d],
+                    "kpis_clicks": col["clicks"][a][d], "kpis_results": col["results"][a][d],
+                }
+
+
+def generate(spec: SynthSpec) -> Synth:
+    """Every counter for every (client, ad, day) at once (see module comment)."""
+    rng = np.random.default_rng(spec.seed)
+    shape = (spec.clients, spec.ads, spec.days)
+    end = (datetime.date.fromisoformat(spec.end) if spec.end
+           else datetime.date.today() - datetime.timedelta(days=1))
+    dates = [(end - datetime.timedelta(days=spec.days - 1 - i)).strftime("%Y-%m-%d") for i in range(spec.days)]
+
+    # per-ad levels, then day-to-day noise around them
+    def level(mean: float, sigma: float) -> np.ndarray:
+        return (mean * rng.lognormal(0.0, sigma, shape[:2]))[:, :, None]
+
+    def noise() -> np.ndarray:
+        return rng.lognormal(0.0, spec.noise, shape)
+
+    impr = level(4500, 0.6) * noise()
+    ctr = level(1.2, 0.3) * noise()           # %
+    cpm = level(10.0, 0.3) * noise()
+    freq = 1.0 + level(0.6, 0.3) * noise()
+    cvr = level(0.04, 0.3) * noise()          # results per click
+    roas = level(2.2, 0.3) * noise()
+
+    # fatigue: a ramp 0 -> 1 over the last fatigue_days days of the chosen ads
+    fatigued = rng.random(shape[:2]) < spec.fatigue_rate
+    ramp = np.clip((np.arange(spec.days) - (spec.days - spec.fatigue_days - 1)) / max(1, spec.fatigue_days), 0.0, 1.0)
+    f = fatigued[:, :, None] * ramp[None, None, :] * spec.fatigue_strength
+    freq = 1.0 + (freq - 1.0) * (1.0 + 1.5 * f)
+    ctr *= np.clip(1.0 - 0.5 * f, 0.05, None)
+    cpm *= 1.0 + 0.6 * f
+    roas *= np.clip(1.0 - 0.5 * f, 0.05, None)
+    cvr *= np.clip(1.0 - 0.5 * f, 0.05, None)
+
+    impressions = np.floor(impr)
+    clicks = np.floor(impressions * ctr / 100.0)
+    spend = np.round(impressions * cpm / 1000.0, 2)
+    arrays = {
+        "impressions": impressions,
+        "reach": np.maximum(1.0, np.floor(impressions / freq)),
+        "clicks": clicks,
+        "spend": spend,
+        "results": np.floor(clicks * cvr),
+        "revenue": spend * roas,
+    }
+    return Synth(spec, arrays, fatigued, dates)
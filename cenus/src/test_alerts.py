@@ -0,0 +1,58 @@
+# src/test_alerts.py
+# Slack delivery checks against the local webhook stand-in (src/standin.py).
+#   python -m pytest src/test_alerts.py
+import pytest
+import requests
+
+from . import storage, ledger, alerts
+from .standin import StandIn, Faults
+
+
+@pytest.fixture
+def standin(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(ledger, "_ledger", None)
+    si = StandIn().start()
+    yield si
+    si.stop()
+
+
+def _alert(eid):
+    return {"entity_id": eid, "name": "Same name", "ts": "2024-01-08", "reasons": "CTR down",
+            "actions": ["Refresh creative"], "kpis": {"ctr": 0.5}}
+
+
+def test_same_named_ads_are_tracked_apart(standin):
+    hook = standin.webhook("t")
+    assert alerts.send_slack_digest(hook, "C", "Ad", [_alert("1"), _alert("2")]) == 1
+    assert alerts.send_slack_digest(hook, "C", "Ad", [_alert("1"), _alert("2")]) == 0
+    for eid in ("1", "2"):
+        a = _alert(eid)
+        assert alerts.send_slack_alert(hook, "C", "Ad", a["name"], a["ts"], a["reasons"], a["actions"], a["kpis"],
+                                       entity_id=eid)
+    assert not alerts.send_slack_alert(hook, "C", "Ad", a["name"], a["ts"], a["reasons"], a["actions"], a["kpis"],
+                                       entity_id="2")
+    assert standin.stats()["services"]["slack"]["messages"] == 3
+
+
+def test_5xx_is_not_reposted(tmp_path, monkeypatch):
+    # the post may have gone through; the outbox decides about re-driving it
+    monkeypatch.setattr(storage, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(ledger, "_ledger", None)
+    si = StandIn(faults={"slack": Faults(error_rate=1.0)}).start()
+    try:
+        with pytest.raises(RuntimeError):
+            alerts.send_slack_digest(si.webhook("t"), "C", "Ad", [_alert("1")])
+        assert si.stats()["services"]["slack"]["requests"] == 1
+    finally:
+        si.stop()
+
+
+def test_refused_connection_is_retried(monkeypatch):
+    monkeypatch.setattr(alerts, "backoff_delay", lambda *a: 0)
+    monkeypatch.setattr(alerts, "SLACK_MAX_RETRIES", 2)
+    real, calls = alerts.never_sent, []
+    monkeypatch.setattr(alerts, "never_sent", lambda e: calls.append(real(e)) or calls[-1])
+    with pytest.raises(requests.ConnectionError):
+        alerts._post_json("http://127.0.0.1:1/slack/t", {"text": "x"}, timeout=2)
+    assert calls == [True] * 3  # nothing listens on port 1: never sent, so retried
@@ -0,0 +1,80 @@
+# src/test_outbox.py
+# Outbox queue checks on a temp SQLite file; deliveries go to a test handler.
+#   python -m pytest src/test_outbox.py
+import threading, time
+
+import pytest
+
+from . import outbox
+from .outbox import Outbox, drain
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    out = []
+    monkeypatch.setitem(outbox.HANDLERS, "test.send", lambda p: out.append(p["n"]) or "sent")
+    return out
+
+
+def _outbox(tmp_path) -> Outbox:
+    return Outbox(str(tmp_path / "outbox.sqlite"))
+
+
+def test_enqueue_claim_ack(tmp_path, sent):
+    ob = _outbox(tmp_path)
+    ob.enqueue_many("test.send", [(f"k{i}", {"n": i}) for i in range(3)])
+    ob.enqueue("test.send", "k0", {"n": 0})  # same key again: replaced, not duplicated
+    batch = ob.claim(10)
+    assert [(kind, p) for _, kind, p, _ in batch] == [("test.send", {"n": i}) for i in range(3)]
+    assert ob.claim(10) == []  # in flight
+    for msg_id, *_ in batch:
+        ob.done(msg_id)
+    assert ob.counts() == {"done": 3}
+
+
+def test_expired_lease_is_reclaimed(tmp_path, monkeypatch, sent):
+    monkeypatch.setattr(outbox, "OUTBOX_LEASE", 0.05)
+    first, second = _outbox(tmp_path), _outbox(tmp_path)  # two workers on one file
+    first.enqueue("test.send", "k", {"n": 1})
+    assert len(first.claim(1)) == 1  # the first worker dies holding it
+    assert second.claim(1) == []
+    time.sleep(0.1)
+    assert drain(outbox=second) == {"sent": 1}
+    assert sent == [1] and second.counts() == {"done": 1}
+
+
+def test_failed_send_is_retried_then_dead_lettered(tmp_path, monkeypatch):
+    calls = []
+
+    def boom(p):
+        calls.append(p)
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setitem(outbox.HANDLERS, "test.send", boom)
+    monkeypatch.setattr(outbox, "backoff_delay", lambda *a: 0)  # retries are due at once
+    ob = _outbox(tmp_path)
+    ob.enqueue("test.send", "k", {"n": 1})
+    assert drain(max_attempts=3, outbox=ob) == {"retry": 2, "dead": 1}
+    assert len(calls) == 3
+    dead = ob.dead()
+    assert [(d["key"], d["attempts"]) for d in dead] == [("k", 3)]
+    assert "upstream down" in dead[0]["last_error"]
+    assert ob.claim(1) == []  # dead messages are not picked up again
+
+
+def test_racing_claimers_deliver_once(tmp_path, sent):
+    _outbox(tmp_path).enqueue_many("test.send", [(f"k{i}", {"n": i}) for i in range(200)])
+    workers = [_outbox(tmp_path) for _ in range(4)]  # like four processes draining at once
+    start = threading.Barrier(len(workers))
+
+    def run(ob):
+        start.wait()
+        drain(workers=3, outbox=ob)
+
+    threads = [threading.Thread(target=run, args=(ob,)) for ob in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(sent) == list(range(200))
+    assert workers[0].counts() == {"done": 200}
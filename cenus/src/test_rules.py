@@ -0,0 +1,72 @@
+# src/test_rules.py
+#   python -m pytest src/test_rules.py
+from .rules import compile_rules, rule_defs
+from .fatigue import evaluate_batch
+
+
+def _rows(eid, values):
+    return [{"timestamp": f"2024-01-{i + 1:02d}", "ad_id": eid, "name": eid,
+             **{f"kpis_{k}": v for k, v in day.items()}} for i, day in enumerate(values)]
+
+
+def test_all_rules_off_flags_nothing():
+    settings = {f"RULE_{n}": "off" for n in "ABCD"}
+    grouped = {"1": _rows("1", [{"ctr": 2.0, "roas": 3.0}] * 7 + [{"ctr": 0.5, "roas": 0.5}])}
+    out = evaluate_batch(grouped, 7, settings, compile_rules(settings))
+    assert not any(fatigued for fatigued, _, _ in out.values())
+
+
+def test_zero_threshold_is_rejected():
+    assert "X" not in [r.name for r in rule_defs({"RULE_X": "spend up 0"})]
+    rules = compile_rules({"CTR_DOWN_PCT": "0"})
+    latest, base = {"kpis_ctr": 1.0}, {"kpis_ctr": 0.0}  # no history: pct_change is 0
+    assert not rules.evaluate(latest, base)[0]
+
+
+def _edge_cases():
+    """Entities sitting on the rule thresholds, with missing KPIs and with zero baselines."""
+    base = {"ctr": 2.0, "frequency": 2.0, "roas": 3.0, "cpm": 10.0, "cpc": 1.0, "results": 10.0}
+    cases = {
+        "at_threshold": dict(base, ctr=1.5, frequency=2.7, roas=2.1, cpm=14.0, cpc=1.4, results=7.0),
+        "just_over": dict(base, ctr=1.4999, frequency=2.7001, roas=2.0999, cpm=14.0001),
+        "just_under": dict(base, ctr=1.5001, frequency=2.6999, roas=2.1001, cpm=13.9999),
+        "missing_latest": dict(base, ctr=None, frequency=None, roas=None),
+        "unparsable": dict(base, ctr="n/a", roas="", cpm="14.5"),
+    }
+    out = {eid: _rows(eid, [base] * 7 + [latest]) for eid, latest in cases.items()}
+    # decimal values: the -25% CTR move only holds up to float noise
+    ctrs = [0.1 * (i % 3 + 1) for i in range(7)]
+    out["float_noise"] = _rows("float_noise", [dict(base, ctr=c) for c in ctrs]
+                               + [dict(base, ctr=sum(ctrs) / 7 * 0.75, frequency=2.7)])
+    holes = [dict(base, ctr=None, roas="2.9") if i % 2 else base for i in range(7)]
+    out["missing_history"] = _rows("missing_history", holes + [dict(base, ctr=1.0, roas=1.0)])
+    zero = dict(base, roas=0.0, results=0.0, cpm=0.0)
+    out["zero_baseline"] = _rows("zero_baseline", [zero] * 7 + [dict(base, roas=5.0, cpm=50.0)])
+    out["no_history"] = _rows("no_history", [{}] * 7 + [dict(base, ctr=0.1)])
+    return out
+
+
+def test_batch_matches_scalar_rules():
+    from .synth import SynthSpec, generate
+    from .meta_client import to_fatigue_row
+    from .fatigue import evaluate_rules, rolling_baseline
+
+    synth = generate(SynthSpec(clients=1, ads=1000, days=10, fatigue_rate=0.05, seed=1))
+    grouped = {}
+    for r in synth.graph_rows(0):
+        row = to_fatigue_row(r, "ad")
+        grouped.setdefault(row["ad_id"], []).append(row)
+    grouped.update(_edge_cases())
+
+    for settings in ({}, {"CTR_DOWN_PCT": "10", "FREQ_UP_PCT": "15", "RULE_E": "spend up 20 or clicks down 20"}):
+        rules = compile_rules(settings)
+        assert len(rule_defs(settings)) == 4 + ("RULE_E" in settings)
+        batch = evaluate_batch(grouped, 7, settings, rules)
+        assert set(batch) == set(grouped)
+        flagged = 0
+        for eid, series in grouped.items():
+            tail = sorted(series, key=lambda r: r["timestamp"])[-8:]
+            scalar = evaluate_rules(tail[-1], rolling_baseline(tail[:-1]), settings)
+            assert batch[eid] == scalar, eid
+            flagged += scalar[0]
+        assert flagged >= 50  # the injected fatigue is found, not just "nothing flagged" twice
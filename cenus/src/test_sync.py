@@ -0,0 +1,43 @@
+# src/test_sync.py
+# Fetch planning (watermark + restatement lookback + locally missing days).
+#   python -m pytest src/test_sync.py
+import pytest
+
+from .history import HistoryStore
+from .sync import WatermarkStore, plan_fetch, plan_sync
+
+
+@pytest.mark.parametrize("since, until, watermark, lookback, missing, expected", [
+    # no watermark / watermark before the window: the whole window
+    ("2024-01-01", "2024-01-10", None, 2, None, ("2024-01-01", "2024-01-10")),
+    ("2024-01-05", "2024-01-10", "2024-01-04", 2, None, ("2024-01-05", "2024-01-10")),
+    # watermark at or past until, nothing missing: served locally
+    ("2024-01-01", "2024-01-10", "2024-01-10", 2, None, None),
+    ("2024-01-01", "2024-01-10", "2024-01-12", 2, [], None),
+    # after the watermark, plus the last `lookback` days up to it
+    ("2024-01-01", "2024-01-10", "2024-01-07", 2, [], ("2024-01-06", "2024-01-10")),
+    ("2024-01-01", "2024-01-10", "2024-01-07", 0, [], ("2024-01-08", "2024-01-10")),
+    ("2024-01-01", "2024-01-10", "2024-01-07", -3, [], ("2024-01-08", "2024-01-10")),
+    # lookback crossing since is clamped to the window
+    ("2024-01-05", "2024-01-10", "2024-01-05", 3, [], ("2024-01-05", "2024-01-10")),
+    ("2024-01-05", "2024-01-10", "2024-01-06", 2, [], ("2024-01-05", "2024-01-10")),
+    # a hole before the watermark pulls the start back to it
+    ("2024-01-01", "2024-01-10", "2024-01-08", 2, ["2024-01-03"], ("2024-01-03", "2024-01-10")),
+    ("2024-01-01", "2024-01-10", "2024-01-08", 2, ["2024-01-08"], ("2024-01-07", "2024-01-10")),  # inside the lookback
+    ("2024-01-01", "2024-01-10", "2024-01-12", 2, ["2024-01-04", "2024-01-02"], ("2024-01-02", "2024-01-10")),
+])
+def test_plan_fetch(since, until, watermark, lookback, missing, expected):
+    assert plan_fetch(since, until, watermark, lookback, missing) == expected
+
+
+def test_plan_sync_finds_local_holes(tmp_path):
+    history = HistoryStore("c", root=str(tmp_path / "history"))
+    for day in ("2024-01-01", "2024-01-02", "2024-01-04", "2024-01-05"):
+        history.write_day("ad", day, [])
+    wms = WatermarkStore(str(tmp_path / "watermarks.json"))
+    assert plan_sync("act_1", "ad", "2024-01-01", "2024-01-05", history, 1, wms) == ("2024-01-01", "2024-01-05")
+    wms.set("act_1", "ad", "2024-01-05")
+    assert plan_sync("act_1", "ad", "2024-01-01", "2024-01-05", history, 1, wms) == ("2024-01-03", "2024-01-05")
+    history.write_day("ad", "2024-01-03", [])
+    assert plan_sync("act_1", "ad", "2024-01-01", "2024-01-05", history, 1, wms) is None
+    assert plan_sync("act_1", "ad", "2024-01-01", "2024-01-07", history, 1, wms) == ("2024-01-05", "2024-01-07")
@@ -0,0 +1,72 @@
+# src/test_upsert.py
+# Offline upsert checks against the local Notion stand-in (src/standin.py).
+#   python -m pytest src/test_upsert.py
+import pytest
+import requests
+
+from . import storage, ledger, page_index, notion
+from .standin import StandIn
+from .synth import SynthSpec
+from .meta_client import iter_kpis, to_fatigue_row
+
+
+@pytest.fixture
+def standin(tmp_path, monkeypatch):
+    # fresh local state and a Notion client pointed at the stand-in
+    monkeypatch.setattr(storage, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(ledger, "_ledger", None)
+    monkeypatch.setattr(page_index, "_indexes", {})
+    si = StandIn(SynthSpec(clients=1, ads=3, days=2)).start()
+    monkeypatch.setattr(notion, "NOTION_API", si.env()["NOTION_API_BASE"])
+    yield si
+    si.stop()
+
+
+def test_push_then_fatigue_upsert_is_one_page(standin):
+    row = next(standin.synth.graph_rows(0))
+    kpi = next(iter_kpis([row], "ad"))
+    assert notion.upsert_record("kpi-db", kpi)[0] == "created"
+    action, _ = notion.upsert_record("kpi-db", to_fatigue_row(row, "ad"))
+    assert action in ("updated", "skipped")
+    assert standin.stats()["notion"]["pages"] == 1
+
+
+def test_level_fills_in_for_records_without_one(standin):
+    row = next(standin.synth.graph_rows(0))
+    legacy = {k: v for k, v in next(iter_kpis([row], "ad")).items() if k != "level"}
+    notion.upsert_record("kpi-db", legacy, level="ad")
+    notion.upsert_record("kpi-db", to_fatigue_row(row, "ad"))
+    assert standin.stats()["notion"]["pages"] == 1
+
+
+def test_page_id_survives_a_new_process(standin, monkeypatch):
+    row = next(standin.synth.graph_rows(0))
+    kpi = next(iter_kpis([row], "ad"))
+    notion.upsert_record("kpi-db", kpi)
+    # a fresh process: nothing in memory, only the ledger file on disk
+    monkeypatch.setattr(ledger, "_ledger", None)
+    monkeypatch.setattr(page_index, "_indexes", {})
+    queries = standin.stats()["services"]["notion"].get("queries", 0)
+    action, _ = notion.upsert_record("kpi-db", dict(kpi, spend=kpi["spend"] + 1, name="renamed"))
+    assert action == "updated"
+    assert standin.stats()["notion"]["pages"] == 1
+    assert standin.stats()["services"]["notion"].get("queries", 0) == queries  # no re-index
+
+
+def test_create_that_lands_despite_a_5xx_is_not_resent(standin, monkeypatch):
+    real, failed = notion._request, []
+
+    def lossy(method, url, payload=None):
+        r = real(method, url, payload)
+        if method == "POST" and url.endswith("/pages") and not failed:
+            failed.append(r)  # written, but the caller only sees a gateway error
+            r = requests.Response()
+            r.status_code, r._content = 502, b'{"object": "error"}'
+        return r
+
+    monkeypatch.setattr(notion, "_request", lossy)
+    monkeypatch.setattr(notion, "backoff_delay", lambda *a: 0)
+    row = next(standin.synth.graph_rows(0))
+    action, page_id = notion.upsert_record("kpi-db", to_fatigue_row(row, "ad"))
+    assert (action, page_id) == ("created", failed[0].json()["id"])
+    assert standin.stats()["notion"]["pages"] == 1